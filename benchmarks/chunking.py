@@ -0,0 +1,82 @@
+'''
+Embedder truncation and chunk counts of the old character slicing versus the token based chunker.
+
+usage: python benchmarks/chunking.py FILE [FILE ...]
+
+Every chunk is tokenized with the embedding model's tokenizer; tokens past its input limit are the ones
+the embedder silently drops.
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chunking
+import ingestion
+
+# character slicing the chunker replaced
+CHAR_CHUNK_SIZE=500
+CHAR_CHUNK_OVERLAP=50
+
+def iter_char_chunks(pages, chunk_size: int=CHAR_CHUNK_SIZE, overlap: int=CHAR_CHUNK_OVERLAP):
+    '''
+    input: iterable of (page number, page text), chunk size and overlap in characters
+    output: generator of (chunk, page number the chunk starts on), identical to slicing the concatenated text
+    every chunk_size-overlap characters, but only holding about one page plus one chunk in memory
+    '''
+    step=chunk_size-overlap
+    buffer=""
+    base=0              # absolute offset of buffer[0]
+    position=0          # absolute offset of the next chunk
+    page_starts=[]      # (absolute offset, page number) of pages still overlapping the buffer
+
+    def page_at(offset):
+        number=page_starts[0][1]
+        for start, page_number in page_starts:
+            if start>offset:
+                break
+            number=page_number
+        return number
+
+    for page_number, text in pages:
+        if not text:
+            continue
+        page_starts.append((base+len(buffer), page_number))
+        buffer+=text
+        while base+len(buffer)>=position+chunk_size:
+            yield buffer[position-base:position-base+chunk_size], page_at(position)
+            position+=step
+        # drop text no later chunk can start in
+        buffer=buffer[position-base:]
+        base=position
+        while len(page_starts)>1 and page_starts[1][0]<=base:
+            page_starts.pop(0)
+
+    while position<base+len(buffer):
+        yield buffer[position-base:position-base+chunk_size], page_at(position)
+        position+=step
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+")
+    args=parser.parse_args()
+
+    chunkers=[
+        (f"chars {CHAR_CHUNK_SIZE}/{CHAR_CHUNK_OVERLAP}", iter_char_chunks),
+        (f"tokens {chunking.CHUNK_TOKENS}/{chunking.CHUNK_OVERLAP_TOKENS}", chunking.iter_chunks),
+    ]
+    print(f"{'chunker':<18}{'chunks':>8}{'tokens':>10}{'max':>6}{'truncated chunks':>18}{'truncated tokens':>18}{'seconds':>9}")
+    for name, iter_chunks in chunkers:
+        chunks=[]
+        start=time.perf_counter()
+        for path in args.files:
+            chunks.extend(chunk for chunk, _ in iter_chunks(ingestion.iter_pages(path)))
+        seconds=time.perf_counter()-start
+        stats=chunking.truncation_stats(chunks)
+        print(f"{name:<18}{stats['chunks']:>8}{stats['tokens']:>10}{stats['max_chunk_tokens']:>6}"
+            f"{stats['truncated_chunks']:>18}{stats['truncated_tokens']:>18}{seconds:>9.2f}")
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,65 @@
+'''
+Runtime and coverage of the chunk selection methods used by the summariser.
+
+usage: python benchmarks/clustering.py [--sizes 2000 20000 100000] [--clusters 10] [--topics 40]
+
+The corpus is synthetic: 384-d unit vectors drawn around --topics latent topics with uneven sizes, standing in
+for the chunks of a long book. Coverage is reported two ways: the share of topics that got a representative
+chunk, and the mean cosine similarity of every chunk to its closest selected chunk (higher is better).
+'''
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chunk_selection
+
+def synthetic_book(n_chunks: int, n_topics: int, dimension: int=384, seed: int=0)->tuple[np.ndarray, np.ndarray]:
+    '''
+    input: number of chunks and topics, vector dimension
+    output: unit normalised chunk vectors and the topic of every chunk
+    '''
+    rng=np.random.default_rng(seed)
+    centres=rng.standard_normal((n_topics, dimension)).astype('float32')
+    weights=rng.dirichlet(np.full(n_topics, 0.7))
+    topics=rng.choice(n_topics, size=n_chunks, p=weights)
+    vectors=centres[topics]+0.8*rng.standard_normal((n_chunks, dimension)).astype('float32')
+    vectors/=np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, topics
+
+def coverage(vectors: np.ndarray, topics: np.ndarray, selected: list[int])->tuple[float, float]:
+    '''
+    output: share of topics with a selected chunk, and mean similarity of each chunk to its closest selected chunk
+    '''
+    topic_share=len(set(topics[selected].tolist()))/len(set(topics.tolist()))
+    similarity=(vectors@vectors[selected].T).max(axis=1).mean()
+    return topic_share, float(similarity)
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2_000, 20_000, 100_000])
+    parser.add_argument("--clusters", type=int, default=10)
+    parser.add_argument("--topics", type=int, default=40)
+    parser.add_argument("--max-kmeans", type=int, default=50_000, help="skip full KMeans above this size")
+    args=parser.parse_args()
+
+    print(f"{'chunks':>8} {'method':<10}{'seconds':>9}{'topics':>8}{'mean sim':>10}")
+    for size in args.sizes:
+        vectors, topics=synthetic_book(size, args.topics)
+        auto=chunk_selection.choose_method(size)
+        for method in chunk_selection.SELECTION_METHODS:
+            if method=="kmeans" and size>args.max_kmeans:
+                continue
+            start=time.perf_counter()
+            selected=chunk_selection.select_representatives(vectors, args.clusters, method)
+            seconds=time.perf_counter()-start
+            topic_share, similarity=coverage(vectors, topics, selected)
+            label=method+("*" if method==auto else "")
+            print(f"{size:>8} {label:<10}{seconds:>9.2f}{topic_share:>8.2f}{similarity:>10.3f}")
+    print("* chosen by method='auto'")
+
+if __name__=="__main__":
+    main()
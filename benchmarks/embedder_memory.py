@@ -0,0 +1,68 @@
+'''
+Resident memory and cold-start time of one shared SentenceTransformer versus one copy per backend.
+
+usage: python benchmarks/embedder_memory.py [--copies 3]
+
+Each mode runs in a fresh subprocess so the measurements do not contaminate each other.
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def rss_mb()->float:
+    '''
+    output: resident set size of this process in MB
+    '''
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss/2**20
+    except ImportError:
+        import resource
+        # ru_maxrss is in KB on Linux; this is the peak, which equals current RSS for a load-only run
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+def measure(mode: str, copies: int)->dict:
+    '''
+    input: "shared" or "per-backend", and how many backends would load the embedder
+    output: baseline and loaded RSS and the load time, measured in this process
+    '''
+    import embedding_service
+    from sentence_transformers import SentenceTransformer
+    baseline=rss_mb()
+    start=time.perf_counter()
+    if mode=="shared":
+        models=[embedding_service.get_embedder() for _ in range(copies)]
+    else:
+        models=[SentenceTransformer(embedding_service.MODEL_NAME) for _ in range(copies)]
+    for model in models:
+        model.encode(["warm up"])
+    elapsed=time.perf_counter()-start
+    return {"mode": mode, "copies": copies, "rss_before_mb": baseline, "rss_after_mb": rss_mb(), "load_s": elapsed}
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=3)
+    parser.add_argument("--child", choices=["shared", "per-backend"], help=argparse.SUPPRESS)
+    args=parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.copies)))
+        return
+
+    results=[]
+    for mode in ("per-backend", "shared"):
+        out=subprocess.run([sys.executable, __file__, "--child", mode, "--copies", str(args.copies)], capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{'mode':<14}{'RSS added MB':>14}{'load s':>10}")
+    for r in results:
+        print(f"{r['mode']:<14}{r['rss_after_mb']-r['rss_before_mb']:>14.1f}{r['load_s']:>10.2f}")
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,102 @@
+'''
+Recall@k and latency of the approximate index kinds against the exact flat baseline.
+
+usage: python benchmarks/index_recall.py [--vectors N] [--queries Q] [--k K] [--from-cache]
+
+With --from-cache the corpus is made of the embeddings stored in cache/embeddings, otherwise a synthetic
+clustered corpus of 384-d vectors (the all-MiniLM-L6-v2 dimension) is generated.
+'''
+import argparse
+import glob
+import os
+import sys
+import time
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import index_manager
+from embedding_cache import CACHE_DIR
+
+def synthetic_corpus(n_vectors: int, dimension: int=384, n_topics: int=200, seed: int=0)->np.ndarray:
+    '''
+    input: corpus size, vector dimension and number of latent topics
+    output: unit-normalised float32 vectors grouped around random topic centres, like sentence embeddings
+    '''
+    rng=np.random.default_rng(seed)
+    centres=rng.standard_normal((n_topics, dimension)).astype('float32')
+    labels=rng.integers(0, n_topics, size=n_vectors)
+    vectors=centres[labels]+0.6*rng.standard_normal((n_vectors, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def cached_corpus()->np.ndarray:
+    '''
+    output: all embeddings stored in the embedding cache, stacked
+    '''
+    paths=glob.glob(os.path.join(CACHE_DIR, "*.npy"))
+    if not paths:
+        raise SystemExit(f"No cached embeddings found in {CACHE_DIR}")
+    return np.vstack([np.load(path) for path in paths]).astype('float32')
+
+def timed_search(index, queries: np.ndarray, k: int)->tuple[np.ndarray, float]:
+    '''
+    input: faiss index, query matrix and number of neighbours
+    output: ids found and mean latency per query in milliseconds, searching one query at a time like search_chunks
+    '''
+    found=np.empty((len(queries), k), dtype='int64')
+    start=time.perf_counter()
+    for row, query in enumerate(queries):
+        _, I=index.search(query[None, :], k)
+        found[row]=I[0]
+    elapsed=time.perf_counter()-start
+    return found, 1000*elapsed/len(queries)
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray)->float:
+    hits=sum(len(set(f.tolist()) & set(t.tolist())) for f, t in zip(found, truth))
+    return hits/truth.size
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--from-cache", action="store_true")
+    args=parser.parse_args()
+
+    vectors=cached_corpus() if args.from_cache else synthetic_corpus(args.vectors)
+    rng=np.random.default_rng(1)
+    queries=vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)]
+    queries=queries+0.05*rng.standard_normal(queries.shape).astype('float32')
+    ids=np.arange(len(vectors), dtype='int64')
+    dimension=vectors.shape[1]
+    print(f"corpus: {len(vectors)} x {dimension}, queries: {len(queries)}, k={args.k}, auto kind: {index_manager.choose_index_kind(len(vectors))}")
+
+    flat=index_manager.build_index("flat", dimension, len(vectors))
+    flat.add_with_ids(vectors, ids)
+    truth, flat_ms=timed_search(flat, queries, args.k)
+    print(f"{'index':<10}{'setting':<16}{'build s':>10}{'recall@k':>10}{'ms/query':>10}")
+    print(f"{'flat':<10}{'-':<16}{'-':>10}{1.0:>10.3f}{flat_ms:>10.3f}")
+
+    settings={
+        "ivf_flat": [("nprobe", v) for v in (1, 4, 16, 64)],
+        "ivf_pq": [("nprobe", v) for v in (4, 16, 64)],
+        "hnsw": [("efSearch", v) for v in (16, 32, 64, 128)],
+    }
+    for kind, knobs in settings.items():
+        start=time.perf_counter()
+        index=index_manager.build_index(kind, dimension, len(vectors))
+        index_manager.train_index(index, vectors)
+        index.add_with_ids(vectors, ids)
+        build_s=time.perf_counter()-start
+        for name, value in knobs:
+            if name=="nprobe":
+                index_manager.set_search_params(index, nprobe=value)
+            else:
+                index_manager.set_search_params(index, ef_search=value)
+            found, ms=timed_search(index, queries, args.k)
+            print(f"{kind:<10}{name+'='+str(value):<16}{build_s:>10.1f}{recall_at_k(found, truth):>10.3f}{ms:>10.3f}")
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,50 @@
+'''
+Wall-clock time of the summariser map phase, sequential versus concurrent llama contexts.
+
+usage: python benchmarks/map_phase.py [--pdf FILE] [--chunks 10] [--parallelism 1 2 4]
+
+Chunks are taken from the given PDF, or generated when none is given, and summarised with the same
+prompt as summariser_backend.summary_creater.
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model_loader
+import chunking
+import ingestion
+import summariser_backend
+
+SAMPLE_TEXT=("The committee reviewed the quarterly results and noted that revenue grew in every region except the north, "
+    "where supply problems delayed two product launches. Staff turnover fell for the third quarter in a row. ")
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf")
+    parser.add_argument("--chunks", type=int, default=10)
+    parser.add_argument("--parallelism", type=int, nargs="+", default=[1, 2, 4])
+    args=parser.parse_args()
+
+    pages=ingestion.iter_pages(args.pdf) if args.pdf else [(1, SAMPLE_TEXT*(args.chunks*6))]
+    chunks=[chunk for chunk, _ in chunking.iter_chunks(pages)]
+    selected=list(range(min(args.chunks, len(chunks))))
+    model_loader.wait_until_ready()
+
+    results=[]
+    for parallelism in args.parallelism:
+        # first call creates the pooled contexts, which is a one off cost per process
+        summariser_backend.summary_creater(selected[:parallelism], chunks, parallelism)
+        start=time.perf_counter()
+        summariser_backend.summary_creater(selected, chunks, parallelism)
+        results.append((parallelism, time.perf_counter()-start))
+
+    baseline=results[0][1]
+    print(f"{'parallelism':<12}{'seconds':>10}{'speedup':>10}")
+    for parallelism, seconds in results:
+        print(f"{parallelism:<12}{seconds:>10.1f}{baseline/seconds:>10.2f}")
+
+if __name__=="__main__":
+    main()
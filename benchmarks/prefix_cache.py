@@ -0,0 +1,60 @@
+'''
+Prompt evaluation time with and without reuse of the constant prompt prefixes.
+
+usage: python benchmarks/prefix_cache.py [--rounds 5]
+
+RAG, evaluation and summariser prompts are issued in turn, as happens when a user switches pages, with
+max_tokens=1 so the time to first token is essentially the prompt evaluation time. Each cache mode runs
+in a fresh subprocess since the cache is configured at import time.
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CONTEXT="The fitness assessment covers cardio endurance, muscular strength, balance and flexibility. "*12
+
+def run_rounds(rounds: int)->list[float]:
+    import inference
+    import rag_backend
+    import evaluation_backend
+    import summariser_backend
+
+    prompts=[
+        (rag_backend.PROMPT_PREFIX, "<|im_end|>\n<|im_start|>user\nContext:\n'''{context}'''\nQuestion:\n\"\"{question}\"\"<|im_end|>\n<|im_start|>assistant\n"),
+        (evaluation_backend.PROMPT_PREFIX, "<|im_start|>user\nMetrics:\n{{}}\nContext:\n{context}\nQuestion:\n{question}<|im_end|>\n<|im_start|>assistant\n"),
+        (summariser_backend.MAP_PROMPT_PREFIX, "{context}```\n        SUMMARY: \n        "),
+    ]
+    timings=[]
+    for round_number in range(rounds):
+        for prefix, suffix in prompts:
+            prompt=prefix+suffix.format(context=CONTEXT, question=f"What is covered in part {round_number}?")
+            _, stats=inference.complete(prompt, 1, prefix=prefix)
+            timings.append(stats["time_to_first_token_s"])
+    return timings
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args=parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_rounds(args.rounds)))
+        return
+
+    print(f"{'prompt cache':<14}{'first round s':>15}{'later rounds s':>16}")
+    for mode in ("off", "ram"):
+        env=dict(os.environ, RAG_PROMPT_CACHE=mode)
+        out=subprocess.run([sys.executable, __file__, "--child", "--rounds", str(args.rounds)], env=env, capture_output=True, text=True, check=True)
+        timings=json.loads(out.stdout.strip().splitlines()[-1])
+        first=sum(timings[:3])/3
+        later=sum(timings[3:])/max(1, len(timings)-3)
+        print(f"{mode:<14}{first:>15.3f}{later:>16.3f}")
+
+if __name__=="__main__":
+    main()
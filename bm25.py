@@ -0,0 +1,197 @@
+import json
+import math
+import os
+import re
+from array import array
+from collections import Counter
+import numpy as np
+
+K1=1.2
+B=0.75
+
+# words, and compounds such as sample1.json, ISO-9001 or f1_score, which are also indexed by their parts
+TOKEN_PATTERN=re.compile(r"\w+(?:[.\-/:]\w+)*")
+PART_SEPARATORS=re.compile(r"[.\-/:_]")
+
+def tokenize(text: str)->list[str]:
+    '''
+    input: text
+    output: lowercased terms, compounds followed by their parts
+    '''
+    terms=[]
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        term=match.group()
+        terms.append(term)
+        if not term.isalnum():
+            terms.extend(part for part in PART_SEPARATORS.split(term) if part)
+    return terms
+
+class BM25Index:
+    '''
+    Inverted index over chunk ids scoring keyword queries with Okapi BM25, which finds the exact identifiers,
+    part numbers and metric names that sentence embeddings blur.
+    Postings loaded from disk stay in flat, memory mapped arrays; postings of chunks added since live in per-term arrays.
+    Removed chunks get a document length of 0 and are skipped until compacted() drops them.
+    '''
+    def __init__(self, terms: list[str]=None, offsets: np.ndarray=None, ids: np.ndarray=None, tfs: np.ndarray=None, doc_lengths: np.ndarray=None):
+        self.base_terms={term: row for row, term in enumerate(terms or [])}
+        self.base_offsets=offsets if offsets is not None else np.zeros(1, dtype='int64')
+        self.base_ids=ids if ids is not None else np.zeros(0, dtype='int64')
+        self.base_tfs=tfs if tfs is not None else np.zeros(0, dtype='int32')
+        self.postings={}    # term -> (array of chunk ids, array of term frequencies)
+        # by chunk id, kept in memory because removal zeroes entries
+        self.doc_lengths=np.array(doc_lengths if doc_lengths is not None else [], dtype='int32')
+        self.n_docs=int(np.count_nonzero(self.doc_lengths))
+        self.total_length=int(self.doc_lengths.sum())
+
+    def add(self, ids: np.ndarray, texts: list[str])->None:
+        '''
+        input: new chunk ids and their texts
+        '''
+        if not len(ids):
+            return
+        lengths=np.zeros(len(ids), dtype='int32')
+        for position, (i, text) in enumerate(zip(ids.tolist(), texts)):
+            counts=Counter(tokenize(text))
+            for term, tf in counts.items():
+                if term not in self.postings:
+                    self.postings[term]=(array('q'), array('i'))
+                term_ids, term_tfs=self.postings[term]
+                term_ids.append(i)
+                term_tfs.append(tf)
+            lengths[position]=sum(counts.values())
+        size=max(len(self.doc_lengths), int(ids[-1])+1)
+        if size>len(self.doc_lengths):
+            self.doc_lengths=np.concatenate([self.doc_lengths, np.zeros(size-len(self.doc_lengths), dtype='int32')])
+        self.doc_lengths[ids]=lengths
+        self.n_docs+=int(np.count_nonzero(lengths))
+        self.total_length+=int(lengths.sum())
+
+    def remove(self, ids: np.ndarray)->None:
+        '''
+        input: chunk ids to drop from results
+        '''
+        if not len(ids):
+            return
+        lengths=self.doc_lengths[ids]
+        self.n_docs-=int(np.count_nonzero(lengths))
+        self.total_length-=int(lengths.sum())
+        self.doc_lengths[ids]=0
+
+    def term_postings(self, term: str)->tuple[np.ndarray, np.ndarray]:
+        '''
+        input: term
+        output: chunk ids containing it and the term frequencies, including removed chunks
+        '''
+        parts_ids=[]
+        parts_tfs=[]
+        row=self.base_terms.get(term)
+        if row is not None:
+            start, end=self.base_offsets[row], self.base_offsets[row+1]
+            parts_ids.append(np.asarray(self.base_ids[start:end]))
+            parts_tfs.append(np.asarray(self.base_tfs[start:end]))
+        if term in self.postings:
+            term_ids, term_tfs=self.postings[term]
+            parts_ids.append(np.frombuffer(term_ids, dtype='int64'))
+            parts_tfs.append(np.frombuffer(term_tfs, dtype='int32'))
+        if not parts_ids:
+            return np.zeros(0, dtype='int64'), np.zeros(0, dtype='int32')
+        return np.concatenate(parts_ids), np.concatenate(parts_tfs)
+
+    def search(self, query: str, top_k: int)->tuple[np.ndarray, np.ndarray]:
+        '''
+        input: keyword query and number of results
+        output: ids of the best matching chunks, best first, and their BM25 scores
+        '''
+        scores=np.zeros(len(self.doc_lengths), dtype='float32')
+        average_length=self.total_length/max(1, self.n_docs)
+        for term in set(tokenize(query)):
+            ids, tfs=self.term_postings(term)
+            lengths=self.doc_lengths[ids]
+            live=lengths>0
+            if not live.any():
+                continue
+            ids, tfs, lengths=ids[live], tfs[live].astype('float32'), lengths[live]
+            idf=math.log(1+(self.n_docs-len(ids)+0.5)/(len(ids)+0.5))
+            scores[ids]+=idf*tfs*(K1+1)/(tfs+K1*(1-B+B*lengths/average_length))
+        hits=np.flatnonzero(scores)
+        if len(hits)>top_k:
+            hits=hits[np.argpartition(-scores[hits], top_k-1)[:top_k]]
+        hits=hits[np.argsort(-scores[hits], kind='stable')]
+        return hits, scores[hits]
+
+    def _merged(self, mapping: np.ndarray=None)->tuple:
+        # flat arrays of all postings, with ids translated through mapping and removed chunks dropped
+        terms=[]
+        offsets=[0]
+        all_ids=[]
+        all_tfs=[]
+        for term in list(self.base_terms)+[term for term in self.postings if term not in self.base_terms]:
+            ids, tfs=self.term_postings(term)
+            keep=self.doc_lengths[ids]>0
+            ids, tfs=ids[keep], tfs[keep]
+            if mapping is not None:
+                ids=mapping[ids]
+            if not len(ids):
+                continue
+            terms.append(term)
+            all_ids.append(ids)
+            all_tfs.append(tfs)
+            offsets.append(offsets[-1]+len(ids))
+        if mapping is None:
+            doc_lengths=self.doc_lengths.copy()
+        else:
+            kept=mapping[:len(self.doc_lengths)]>=0
+            doc_lengths=np.zeros(int(mapping.max())+1 if len(mapping) else 0, dtype='int32')
+            doc_lengths[mapping[:len(self.doc_lengths)][kept]]=self.doc_lengths[kept]
+        return (terms, np.array(offsets, dtype='int64'),
+            np.concatenate(all_ids) if all_ids else np.zeros(0, dtype='int64'),
+            np.concatenate(all_tfs) if all_tfs else np.zeros(0, dtype='int32'),
+            doc_lengths)
+
+    def compacted(self, mapping: np.ndarray)->'BM25Index':
+        '''
+        input: array translating every old chunk id to its new id, or -1 for chunks that are dropped
+        output: index over the new ids with all postings in flat arrays
+        '''
+        return BM25Index(*self._merged(np.asarray(mapping, dtype='int64')))
+
+    def snapshot(self)->'BM25Index':
+        '''
+        output: index sharing the saved postings and holding a copy of the rest, which can be saved while this one keeps changing
+        '''
+        index=BM25Index()
+        # the saved part is never modified
+        index.base_terms=self.base_terms
+        index.base_offsets, index.base_ids, index.base_tfs=self.base_offsets, self.base_ids, self.base_tfs
+        index.postings={term: (array('q', ids), array('i', tfs)) for term, (ids, tfs) in self.postings.items()}
+        index.doc_lengths=self.doc_lengths.copy()
+        index.n_docs=self.n_docs
+        index.total_length=self.total_length
+        return index
+
+    def save(self, directory: str)->None:
+        '''
+        input: directory to write bm25_terms.json and the bm25_*.npy arrays to
+        output: None
+        '''
+        terms, offsets, ids, tfs, doc_lengths=self._merged()
+        with open(os.path.join(directory, "bm25_terms.json"), 'w', encoding='utf-8') as f:
+            json.dump(terms, f)
+        for name, column in (("bm25_offsets", offsets), ("bm25_ids", ids), ("bm25_tfs", tfs), ("bm25_doc_lengths", doc_lengths)):
+            with open(os.path.join(directory, name+".npy"), 'wb') as f:
+                np.save(f, column)
+
+    @classmethod
+    def open(cls, directory: str)->'BM25Index':
+        '''
+        input: directory written by save()
+        output: index with the postings memory mapped read only
+        '''
+        with open(os.path.join(directory, "bm25_terms.json"), 'r', encoding='utf-8') as f:
+            terms=json.load(f)
+        return cls(terms,
+            np.load(os.path.join(directory, "bm25_offsets.npy"), mmap_mode='r'),
+            np.load(os.path.join(directory, "bm25_ids.npy"), mmap_mode='r'),
+            np.load(os.path.join(directory, "bm25_tfs.npy"), mmap_mode='r'),
+            np.load(os.path.join(directory, "bm25_doc_lengths.npy")))
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import threading
+import inference
+import scheduler
+from inference import count_tokens
+
+# tokens of conversation carried into each prompt
+HISTORY_TOKEN_BUDGET=int(os.environ.get("RAG_HISTORY_TOKENS", "1536"))
+# fold turns that no longer fit the budget into a rolling LLM summary instead of dropping them
+SUMMARISE_OLD_TURNS=os.environ.get("RAG_HISTORY_SUMMARY", "0")=="1"
+SUMMARY_MAX_TOKENS=200
+
+SUMMARY_PROMPT_PREFIX="""<|im_start|>system
+You condense conversations. Rewrite the earlier summary and the new exchanges below into one short summary of at most 5 sentences, keeping names, numbers and conclusions. Output only the summary.<|im_end|>
+<|im_start|>user
+"""
+
+def format_turn(question: str, answer: str)->str:
+    return "Q: "+question+"\nA: "+answer+"\n\n"
+
+def _turns_digest(turns: list[tuple[str, str]])->str:
+    sha=hashlib.sha256()
+    for q, a in turns:
+        sha.update(q.encode("utf-8")+b"\0"+a.encode("utf-8")+b"\0")
+    return sha.hexdigest()
+
+class HistoryManager:
+    '''
+    Renders the chat history into the prompt within a token budget, keeping the most recent turns.
+    With summarise enabled, turns that fall out of the budget are folded into a rolling summary in a background thread.
+    '''
+    def __init__(self, budget_tokens: int=HISTORY_TOKEN_BUDGET, summarise: bool=SUMMARISE_OLD_TURNS):
+        self.budget_tokens=budget_tokens
+        self.summarise=summarise
+        self.summary=""
+        self.covered=0          # number of leading turns the summary covers
+        self.covered_digest=None
+        self.lock=threading.Lock()
+        self.summary_thread=None
+
+    def _valid_summary(self, history: list[tuple[str, str]])->tuple[str, int]:
+        with self.lock:
+            if self.summary and self.covered<=len(history) and _turns_digest(history[:self.covered])==self.covered_digest:
+                return self.summary, self.covered
+        return "", 0
+
+    def window_start(self, history: list[tuple[str, str]], budget_tokens: int, earliest: int=0)->int:
+        '''
+        input: history, token budget and the earliest turn that may be included
+        output: index of the oldest turn kept so that the newest turns fit in the budget
+        '''
+        used=0
+        start=len(history)
+        for i in range(len(history)-1, earliest-1, -1):
+            used+=count_tokens(format_turn(*history[i]))
+            if used>budget_tokens:
+                break
+            start=i
+        return start
+
+    def render(self, history: list[tuple[str, str]], budget_tokens: int=None)->str:
+        '''
+        input: history of previous questions and answers, and optionally a budget overriding the default
+        output: history text for the prompt, within the token budget
+        '''
+        budget_tokens=self.budget_tokens if budget_tokens is None else budget_tokens
+        summary, covered=self._valid_summary(history) if self.summarise else ("", 0)
+        summary_text=f"Summary of the earlier conversation: {summary}\n\n" if summary else ""
+        if summary_text and count_tokens(summary_text)<budget_tokens:
+            budget_tokens-=count_tokens(summary_text)
+        else:
+            summary_text, covered="", 0
+
+        start=self.window_start(history, budget_tokens, covered)
+        return summary_text+"".join(format_turn(q, a) for q, a in history[start:])
+
+    def refresh_summary(self, history: list[tuple[str, str]])->None:
+        '''
+        input: history after the latest answer was appended
+        folds turns that no longer fit the budget into the rolling summary
+        output: None
+        '''
+        summary, covered=self._valid_summary(history)
+        start=self.window_start(history, self.budget_tokens-SUMMARY_MAX_TOKENS, covered)
+        if start<=covered:
+            return
+
+        new_turns="".join(format_turn(q, a) for q, a in history[covered:start])
+        prompt=SUMMARY_PROMPT_PREFIX+f"Earlier summary: {summary or 'none'}\n\nNew exchanges:\n{new_turns}<|im_end|>\n<|im_start|>assistant\n"
+        new_summary, _=inference.complete(prompt, SUMMARY_MAX_TOKENS, temperature=0.2, prefix=SUMMARY_PROMPT_PREFIX)
+        with self.lock:
+            self.summary=new_summary.strip()
+            self.covered=start
+            self.covered_digest=_turns_digest(history[:start])
+
+    def refresh_summary_async(self, history: list[tuple[str, str]])->None:
+        '''
+        input: history after the latest answer was appended
+        starts refresh_summary in a background thread when summarising is enabled, so the answer is not delayed
+        output: None
+        '''
+        if not self.summarise:
+            return
+        if self.summary_thread and self.summary_thread.is_alive():
+            return
+        snapshot=list(history)
+
+        def run():
+            try:
+                # the next question goes ahead of this summary
+                with scheduler.priority(scheduler.BACKGROUND):
+                    self.refresh_summary(snapshot)
+            except Exception as e:
+                print(f"Could not summarise chat history: {e}")
+
+        self.summary_thread=threading.Thread(target=run, daemon=True)
+        self.summary_thread.start()
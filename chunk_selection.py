@@ -0,0 +1,71 @@
+import numpy as np
+
+SELECTION_METHODS=("kmeans", "minibatch", "faiss")
+
+# corpus sizes at which "auto" moves to a cheaper clustering
+KMEANS_MAX_VECTORS=5_000
+MINIBATCH_MAX_VECTORS=50_000
+
+def choose_method(n_vectors: int)->str:
+    '''
+    input: number of chunk vectors
+    output: clustering method suited to that many vectors
+    '''
+    if n_vectors<KMEANS_MAX_VECTORS:
+        return "kmeans"
+    if n_vectors<MINIBATCH_MAX_VECTORS:
+        return "minibatch"
+    return "faiss"
+
+def fit_kmeans(vectors: np.ndarray, num_clusters: int, seed: int=42)->tuple[np.ndarray, np.ndarray]:
+    from sklearn.cluster import KMeans
+    kmeans=KMeans(n_clusters=num_clusters, random_state=seed, n_init=10).fit(vectors)
+    return kmeans.labels_, kmeans.cluster_centers_
+
+def fit_minibatch(vectors: np.ndarray, num_clusters: int, seed: int=42)->tuple[np.ndarray, np.ndarray]:
+    from sklearn.cluster import MiniBatchKMeans
+    kmeans=MiniBatchKMeans(n_clusters=num_clusters, random_state=seed, batch_size=2048, n_init=3).fit(vectors)
+    return kmeans.labels_, kmeans.cluster_centers_
+
+def fit_faiss(vectors: np.ndarray, num_clusters: int, seed: int=42)->tuple[np.ndarray, np.ndarray]:
+    import faiss
+    vectors=np.ascontiguousarray(vectors, dtype='float32')
+    clustering=faiss.Clustering(vectors.shape[1], num_clusters)
+    clustering.niter=20
+    clustering.nredo=1
+    clustering.seed=seed
+    clustering.verbose=False
+    # centroids are read back from the index, as faiss.Kmeans fails to convert them once pymupdf's swig types are loaded
+    index=faiss.IndexFlatL2(vectors.shape[1])
+    clustering.train(vectors, index)
+    _, labels=index.search(vectors, 1)
+    return labels[:, 0], index.reconstruct_n(0, index.ntotal)
+
+FITTERS={"kmeans": fit_kmeans, "minibatch": fit_minibatch, "faiss": fit_faiss}
+
+def nearest_to_centroids(vectors: np.ndarray, labels: np.ndarray, centroids: np.ndarray)->list[int]:
+    '''
+    input: vectors, their cluster labels and the cluster centroids
+    output: sorted indices of the vector closest to its centroid in every non-empty cluster
+    '''
+    distances=np.einsum('ij,ij->i', vectors-centroids[labels], vectors-centroids[labels])
+    # sort by cluster, then by distance, and take the first entry of every cluster
+    order=np.lexsort((distances, labels))
+    sorted_labels=labels[order]
+    first=np.ones(len(order), dtype=bool)
+    first[1:]=sorted_labels[1:]!=sorted_labels[:-1]
+    return sorted(order[first].tolist())
+
+def select_representatives(vectors: np.ndarray, num_clusters: int, method: str="auto")->list[int]:
+    '''
+    input: chunk embeddings, number of chunks wanted and the clustering method ("auto" or one of SELECTION_METHODS)
+    output: sorted indices of one representative chunk per cluster
+    '''
+    if len(vectors)<num_clusters:
+        return list(range(len(vectors)))
+    method=choose_method(len(vectors)) if method=="auto" else method
+    if method not in FITTERS:
+        raise ValueError(f"Unknown selection method: {method}. Expected 'auto' or one of {SELECTION_METHODS}")
+    vectors=np.asarray(vectors, dtype='float32')
+    labels, centroids=FITTERS[method](vectors, num_clusters)
+    return nearest_to_centroids(vectors, np.asarray(labels, dtype='int64'), np.asarray(centroids, dtype='float32'))
@@ -0,0 +1,154 @@
+import json
+import os
+from array import array
+import numpy as np
+
+class ChunkStore:
+    '''
+    Chunk texts and metadata in flat arrays indexed by chunk id: one UTF-8 buffer with an offset array, plus
+    page and source columns, instead of a Python dict entry and str object per chunk.
+    A store opened from disk keeps the saved chunks memory mapped and appends new chunks in memory.
+    Removed chunks keep their ids, lookups of them fail, and their bytes are freed by compacted().
+    '''
+    def __init__(self, buffer: np.ndarray=None, offsets: np.ndarray=None, pages: np.ndarray=None, sources: np.ndarray=None, source_paths: list[str]=None, removed_sources: set[int]=None):
+        # saved part, usually memory mapped
+        self.base_buffer=buffer if buffer is not None else np.zeros(0, dtype='uint8')
+        self.base_offsets=offsets if offsets is not None else np.zeros(1, dtype='int64')
+        self.base_pages=pages if pages is not None else np.zeros(0, dtype='int32')
+        self.base_sources=sources if sources is not None else np.zeros(0, dtype='int32')
+        self.base_count=len(self.base_offsets)-1
+        # part appended since
+        self.buffer=bytearray()
+        self.offsets=array('q', [0])
+        self.pages=array('i')
+        self.sources=array('i')
+        # one entry per add() call, so a file added again after a change gets a new source
+        self.source_paths=list(source_paths or [])
+        self.removed_sources=set(removed_sources or ())
+        self.removed=int(np.isin(self.base_sources, list(self.removed_sources)).sum()) if self.removed_sources else 0
+
+    def __len__(self)->int:
+        '''
+        output: number of chunks that have not been removed
+        '''
+        return self.next_id-self.removed
+
+    @property
+    def next_id(self)->int:
+        return self.base_count+len(self.pages)
+
+    def add(self, path: str, chunks: list[str], pages: list[int])->np.ndarray:
+        '''
+        input: filepath, its chunks and the page each starts on
+        output: the consecutive ids given to the chunks
+        '''
+        ids=np.arange(self.next_id, self.next_id+len(chunks), dtype='int64')
+        source=len(self.source_paths)
+        self.source_paths.append(path)
+        for chunk, page in zip(chunks, pages):
+            self.buffer+=chunk.encode('utf-8')
+            self.offsets.append(len(self.buffer))
+            self.pages.append(page)
+            self.sources.append(source)
+        return ids
+
+    def remove(self, ids: np.ndarray)->None:
+        '''
+        input: ids returned by one add() call
+        '''
+        if len(ids):
+            self.removed_sources.add(self._source_index(int(ids[0])))
+            self.removed+=len(ids)
+
+    def _source_index(self, i: int)->int:
+        if i<self.base_count:
+            return int(self.base_sources[i])
+        return self.sources[i-self.base_count]
+
+    def __contains__(self, i)->bool:
+        return 0<=i<self.next_id and self._source_index(i) not in self.removed_sources
+
+    def __getitem__(self, i: int)->str:
+        '''
+        input: chunk id
+        output: chunk text, decoded from the buffer
+        '''
+        if i not in self:
+            raise KeyError(i)
+        if i<self.base_count:
+            return self.base_buffer[self.base_offsets[i]:self.base_offsets[i+1]].tobytes().decode('utf-8')
+        j=i-self.base_count
+        return self.buffer[self.offsets[j]:self.offsets[j+1]].decode('utf-8')
+
+    def page(self, i: int)->int:
+        if i not in self:
+            raise KeyError(i)
+        return int(self.base_pages[i]) if i<self.base_count else self.pages[i-self.base_count]
+
+    def source(self, i: int)->str:
+        '''
+        input: chunk id
+        output: filepath the chunk came from, or None for unknown or removed ids
+        '''
+        if i not in self:
+            return None
+        return self.source_paths[self._source_index(i)]
+
+    def compacted(self, files: dict)->tuple['ChunkStore', dict]:
+        '''
+        input: filepath -> ids, in the order the new ids should follow
+        output: a store holding only those chunks in memory with ids from 0, and filepath -> new ids
+        '''
+        store=ChunkStore()
+        new_files={}
+        for path, ids in files.items():
+            new_files[path]=store.add(path, [self[i] for i in ids.tolist()], [self.page(i) for i in ids.tolist()])
+        return store, new_files
+
+    def snapshot(self)->'ChunkStore':
+        '''
+        output: store sharing the saved part and holding a copy of the part appended since, which can be saved while
+        this one keeps changing
+        '''
+        store=ChunkStore(self.base_buffer, self.base_offsets, self.base_pages, self.base_sources, self.source_paths, self.removed_sources)
+        store.buffer=bytearray(self.buffer)
+        store.offsets=array('q', self.offsets)
+        store.pages=array('i', self.pages)
+        store.sources=array('i', self.sources)
+        store.removed=self.removed
+        return store
+
+    def save(self, directory: str)->None:
+        '''
+        input: directory to write chunks.bin, chunk_offsets.npy, chunk_pages.npy, chunk_sources.npy and chunk_sources.json to
+        removed chunks are written too and stay removed when opened, so saving never renumbers ids
+        output: None
+        '''
+        with open(os.path.join(directory, "chunks.bin"), 'wb') as f:
+            f.write(self.base_buffer.tobytes())
+            f.write(self.buffer)
+        offsets=np.concatenate([self.base_offsets, np.frombuffer(self.offsets, dtype='int64')[1:]+self.base_offsets[-1]])
+        for name, column in (("chunk_offsets", offsets),
+                ("chunk_pages", np.concatenate([self.base_pages, np.frombuffer(self.pages, dtype='int32')])),
+                ("chunk_sources", np.concatenate([self.base_sources, np.frombuffer(self.sources, dtype='int32')]))):
+            with open(os.path.join(directory, name+".npy"), 'wb') as f:
+                np.save(f, column)
+        with open(os.path.join(directory, "chunk_sources.json"), 'w', encoding='utf-8') as f:
+            json.dump({"paths": self.source_paths, "removed": sorted(self.removed_sources)}, f)
+
+    @classmethod
+    def open(cls, directory: str)->'ChunkStore':
+        '''
+        input: directory written by save()
+        output: store with the saved chunks memory mapped read only
+        '''
+        with open(os.path.join(directory, "chunk_sources.json"), 'r', encoding='utf-8') as f:
+            sources=json.load(f)
+        buffer_path=os.path.join(directory, "chunks.bin")
+        # an empty file cannot be memory mapped
+        buffer=np.memmap(buffer_path, dtype='uint8', mode='r') if os.path.getsize(buffer_path) else None
+        return cls(buffer,
+            np.load(os.path.join(directory, "chunk_offsets.npy"), mmap_mode='r'),
+            np.load(os.path.join(directory, "chunk_pages.npy"), mmap_mode='r'),
+            np.load(os.path.join(directory, "chunk_sources.npy"), mmap_mode='r'),
+            sources["paths"], set(sources["removed"]))
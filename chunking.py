@@ -0,0 +1,115 @@
+import os
+import re
+import embedding_service
+
+# chunk size and overlap in embedder tokens; chunks stay below MAX_SEQ_TOKENS so the embedder sees all of them
+CHUNK_TOKENS=int(os.environ.get("RAG_CHUNK_TOKENS", "200"))
+# overlap is whole trailing sentences up to this many tokens, every overlapping token is embedded twice
+CHUNK_OVERLAP_TOKENS=int(os.environ.get("RAG_CHUNK_OVERLAP_TOKENS", "32"))
+# identifies the chunker's output in the embedding cache
+VERSION=f"tokens-{CHUNK_TOKENS}-{CHUNK_OVERLAP_TOKENS}-sentences"
+
+PARAGRAPH_BREAK=re.compile(r"\n\s*\n")
+SENTENCE_END=re.compile(r"(?<=[.!?])\s+")
+
+def split_units(text: str)->list[tuple[str, bool]]:
+    '''
+    input: text of a page
+    output: list of (sentence, whether it starts a paragraph)
+    '''
+    units=[]
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        first=True
+        for sentence in SENTENCE_END.split(paragraph):
+            sentence=sentence.strip()
+            if sentence:
+                units.append((sentence, first))
+                first=False
+    return units
+
+def token_windows(text: str, tokenizer, max_tokens: int, overlap_tokens: int)->list[tuple[str, int]]:
+    '''
+    input: a sentence longer than max_tokens, the tokenizer, window size and overlap in tokens
+    output: list of (piece of the sentence, its token count), cut on token boundaries
+    '''
+    offsets=tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    step=max(1, max_tokens-overlap_tokens)
+    windows=[]
+    for start in range(0, len(offsets), step):
+        window=offsets[start:start+max_tokens]
+        windows.append((text[window[0][0]:window[-1][1]], len(window)))
+        if start+max_tokens>=len(offsets):
+            break
+    return windows
+
+def iter_units(pages, tokenizer, max_tokens: int, overlap_tokens: int):
+    '''
+    input: iterable of (page number, page text), the tokenizer, largest unit and overlap in tokens
+    output: generator of (text, token count, page number, whether it starts a paragraph)
+    '''
+    for page_number, text in pages:
+        units=split_units(text) if text else []
+        if not units:
+            continue
+        counts=[len(ids) for ids in tokenizer([unit for unit, _ in units], add_special_tokens=False)["input_ids"]]
+        for (unit, starts_paragraph), count in zip(units, counts):
+            if count<=max_tokens:
+                yield unit, count, page_number, starts_paragraph
+                continue
+            for position, (piece, piece_count) in enumerate(token_windows(unit, tokenizer, max_tokens, overlap_tokens)):
+                yield piece, piece_count, page_number, starts_paragraph and position==0
+
+def render(units)->str:
+    text=units[0][0]
+    for unit, _, _, starts_paragraph in units[1:]:
+        text+=("\n\n" if starts_paragraph else " ")+unit
+    return text
+
+def iter_chunks(pages, chunk_tokens: int=CHUNK_TOKENS, overlap_tokens: int=CHUNK_OVERLAP_TOKENS, tokenizer=None):
+    '''
+    input: iterable of (page number, page text), chunk size and overlap in embedder tokens, and optionally the tokenizer
+    packs whole sentences into chunks of at most chunk_tokens, starting a new chunk rather than cutting a sentence;
+    only sentences longer than a chunk are cut, on token boundaries. One page is tokenized at a time.
+    output: generator of (chunk, page number the chunk starts on)
+    '''
+    if chunk_tokens+2>embedding_service.MAX_SEQ_TOKENS:
+        raise ValueError(f"chunk_tokens must leave room for the embedder's special tokens, at most {embedding_service.MAX_SEQ_TOKENS-2}")
+    tokenizer=tokenizer or embedding_service.get_tokenizer()
+    current=[]
+    size=0
+    fresh=0     # units in current that are not overlap from the previous chunk
+    for unit in iter_units(pages, tokenizer, chunk_tokens, overlap_tokens):
+        if current and size+unit[1]>chunk_tokens:
+            yield render(current), current[0][2]
+            # carry the trailing sentences that fit in the overlap
+            tail=[]
+            tail_size=0
+            for previous in reversed(current):
+                if tail_size+previous[1]>overlap_tokens:
+                    break
+                tail.insert(0, previous)
+                tail_size+=previous[1]
+            current, size, fresh=tail, tail_size, 0
+            if size+unit[1]>chunk_tokens:
+                current, size=[], 0
+        current.append(unit)
+        size+=unit[1]
+        fresh+=1
+    if fresh:
+        yield render(current), current[0][2]
+
+def truncation_stats(chunks: list[str], tokenizer=None, max_tokens: int=None)->dict:
+    '''
+    input: chunks, optionally the tokenizer and the embedder's input limit (special tokens included)
+    output: dict with the number of chunks and tokens, and how many of each the embedder truncates
+    '''
+    tokenizer=tokenizer or embedding_service.get_tokenizer()
+    max_tokens=max_tokens or embedding_service.MAX_SEQ_TOKENS
+    counts=[len(ids) for ids in tokenizer(chunks, add_special_tokens=True)["input_ids"]] if chunks else []
+    return {
+        "chunks": len(counts),
+        "tokens": sum(counts),
+        "max_chunk_tokens": max(counts, default=0),
+        "truncated_chunks": sum(1 for count in counts if count>max_tokens),
+        "truncated_tokens": sum(count-max_tokens for count in counts if count>max_tokens),
+    }
@@ -0,0 +1,85 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import model_loader
+
+CACHE_DIR=os.path.join(model_loader.BASE_DIR, "cache", "completions")
+# "on" lets a failed job resume from the completions of its last attempt, "off" disables the cache
+ENABLED=os.environ.get("RAG_COMPLETION_CACHE", "on")!="off"
+# unfinished jobs kept for resuming, the least recently used beyond this are deleted
+MAX_JOBS=int(os.environ.get("RAG_COMPLETION_CACHE_JOBS", "8"))
+
+def job_id(*parts)->str:
+    '''
+    input: values identifying a job, e.g. document digests and settings
+    output: id of the job's cache, the same when the job is run again with the same inputs; None if the cache is off
+    '''
+    if not ENABLED:
+        return None
+    return hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:32]
+
+def cache_key(prompt: str, max_tokens: int, temperature: float)->str:
+    '''
+    input: prompt and generation settings
+    output: key identifying the completion for this model
+    '''
+    model_name=os.path.basename(model_loader.model_path)
+    return hashlib.sha256(f"{model_name}|{max_tokens}|{temperature}|{prompt}".encode("utf-8")).hexdigest()
+
+def load(job: str, prompt: str, max_tokens: int, temperature: float):
+    '''
+    input: job id, prompt and generation settings
+    output: the completion stored by an earlier attempt of the job, or None
+    '''
+    path=os.path.join(CACHE_DIR, job, cache_key(prompt, max_tokens, temperature)+".json")
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)["text"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def store(job: str, prompt: str, max_tokens: int, temperature: float, text: str)->None:
+    '''
+    input: job id, prompt, generation settings and the generated completion
+    writes the completion to the job's cache, making room by deleting the caches of old jobs
+    output: None
+    '''
+    directory=os.path.join(CACHE_DIR, job)
+    if not os.path.isdir(directory):
+        prune(MAX_JOBS-1)
+    path=os.path.join(directory, cache_key(prompt, max_tokens, temperature)+".json")
+    tmp_path=path+".tmp"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"text": text}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not write completion cache: {e}")
+
+def clear(job: str)->None:
+    '''
+    input: id of a job that finished, whose completions are not needed any more
+    '''
+    if job:
+        shutil.rmtree(os.path.join(CACHE_DIR, job), ignore_errors=True)
+
+def prune(keep: int=MAX_JOBS)->None:
+    '''
+    input: number of job caches to keep
+    deletes the least recently written job caches beyond keep
+    '''
+    try:
+        entries=[os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR)]
+    except OSError:
+        return
+    for path in entries:
+        if not os.path.isdir(path):
+            # completions cached per prompt before the cache was scoped to jobs
+            with contextlib.suppress(OSError):
+                os.remove(path)
+    jobs=sorted((path for path in entries if os.path.isdir(path)), key=os.path.getmtime, reverse=True)
+    for path in jobs[max(0, keep):]:
+        shutil.rmtree(path, ignore_errors=True)
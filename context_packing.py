@@ -0,0 +1,80 @@
+import os
+import model_loader
+from inference import count_tokens
+
+# upper bound on retrieved context per prompt; more context costs prompt evaluation time without improving answers
+CONTEXT_TOKEN_BUDGET=int(os.environ.get("RAG_CONTEXT_TOKENS", "1500"))
+# chunks fetched from the index before packing
+CANDIDATE_POOL=20
+# tokens kept free for the chat template and tokenizer differences
+SAFETY_MARGIN=64
+# longest overlap between consecutive chunks that is looked for when merging them
+MAX_OVERLAP_CHARS=400
+# shortest overlap taken as shared text; shorter matches are coincidence, as chunks need not overlap at all
+MIN_OVERLAP_CHARS=16
+
+def available_tokens(max_tokens: int)->int:
+    '''
+    input: number of tokens reserved for the answer
+    output: tokens left in the llm's context window for the prompt
+    '''
+    return model_loader.get_llm().n_ctx()-max_tokens-SAFETY_MARGIN
+
+def overlap_length(left: str, right: str, max_overlap: int=MAX_OVERLAP_CHARS, min_overlap: int=MIN_OVERLAP_CHARS)->int:
+    '''
+    input: two consecutive chunks
+    output: length of the longest suffix of left that is also a prefix of right, or 0 if it is shorter than min_overlap
+    '''
+    for k in range(min(max_overlap, len(left), len(right)), min_overlap-1, -1):
+        if left.endswith(right[:k]):
+            return k
+    return 0
+
+def pack_context(candidate_ids: list[int], index_manager, budget_tokens: int)->str:
+    '''
+    input: chunk ids ranked by relevance, the index manager holding their text, and a token budget
+    greedily takes the best chunks that fit, skipping duplicates, and merges neighbouring chunks of the same file
+    so their overlapping text is only paid for once
+    output: context text within the budget
+    '''
+    selected={}     # id -> rank
+    seen_texts=set()
+    used=0
+    for rank, i in enumerate(candidate_ids):
+        if i==-1 or i in selected:
+            continue
+        text=index_manager.chunks[i]
+        if text in seen_texts:
+            continue
+
+        # only the part not already covered by a selected neighbour costs tokens
+        new_text=text
+        if i-1 in selected and index_manager.same_file(i-1, i):
+            new_text=new_text[overlap_length(index_manager.chunks[i-1], new_text):]
+        if i+1 in selected and index_manager.same_file(i, i+1):
+            new_text=new_text[:len(new_text)-overlap_length(new_text, index_manager.chunks[i+1])]
+        cost=count_tokens(new_text)
+        if used+cost>budget_tokens:
+            continue
+        selected[i]=rank
+        seen_texts.add(text)
+        used+=cost
+
+    # group consecutive ids of the same file into runs, then order the runs by their best rank
+    runs=[]
+    for i in sorted(selected):
+        if runs and runs[-1][-1]==i-1 and index_manager.same_file(i-1, i):
+            runs[-1].append(i)
+        else:
+            runs.append([i])
+    runs.sort(key=lambda run: min(selected[i] for i in run))
+
+    passages=[]
+    for run in runs:
+        passage=index_manager.chunks[run[0]]
+        for prev, i in zip(run, run[1:]):
+            # compared with the previous chunk alone, since the passage may already end in an overlap
+            k=overlap_length(index_manager.chunks[prev], index_manager.chunks[i])
+            passage+=index_manager.chunks[i][k:] if k else " "+index_manager.chunks[i]
+        passages.append(passage)
+    return "\n\n".join(passages)
@@ -0,0 +1,158 @@
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+import embedding_service
+import chunking
+
+if getattr(sys, 'frozen', False):
+    # Running as a bundled exe
+    BASE_DIR = os.path.dirname(sys.executable)
+else:
+    # Running as a .py file
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CACHE_DIR=os.path.join(BASE_DIR, "cache", "embeddings")
+# size the cache may grow to, the least recently used entries beyond it are deleted
+MAX_CACHE_BYTES=int(float(os.environ.get("RAG_EMBEDDING_CACHE_MB", "2048"))*(1<<20))
+
+# bump these whenever chunking or the embedding model changes, so stale entries are never reused
+CHUNKER_VERSION=chunking.VERSION+"-pages"
+EMBEDDER_VERSION=embedding_service.MODEL_NAME
+
+# filepath -> (mtime, size, digest), avoids re-hashing unchanged files on every question
+_digest_memo={}
+
+def file_digest(filepath: str, block_size: int=1<<20)->str:
+    '''
+    input: filepath of a document
+    output: sha256 hex digest of the file contents
+    '''
+    stat=os.stat(filepath)
+    memo=_digest_memo.get(filepath)
+    if memo and memo[0]==stat.st_mtime_ns and memo[1]==stat.st_size:
+        return memo[2]
+
+    sha=hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    digest=sha.hexdigest()
+    _digest_memo[filepath]=(stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+def cache_key(digest: str)->str:
+    '''
+    input: content digest of a file
+    output: cache key combining the content digest with chunker and embedder versions
+    '''
+    return hashlib.sha256(f"{digest}|{CHUNKER_VERSION}|{EMBEDDER_VERSION}".encode()).hexdigest()
+
+def _entry_paths(key: str)->tuple[str, str]:
+    return os.path.join(CACHE_DIR, key+".json"), os.path.join(CACHE_DIR, key+".npy")
+
+def load(filepath: str):
+    '''
+    input: filepath of a document
+    output: (chunks, vectors, pages) if an up to date entry exists on disk, else None
+    '''
+    meta_path, vectors_path=_entry_paths(cache_key(file_digest(filepath)))
+    if not (os.path.exists(meta_path) and os.path.exists(vectors_path)):
+        return None
+
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta=json.load(f)
+        vectors=np.load(vectors_path)
+        if meta.get("chunker")!=CHUNKER_VERSION or meta.get("embedder")!=EMBEDDER_VERSION:
+            return None
+        chunks, pages=meta["chunks"], meta["pages"]
+        if len(chunks)!=len(vectors) or len(pages)!=len(chunks):
+            raise ValueError("chunk, page and vector counts differ")
+    except (OSError, EOFError, ValueError, KeyError, TypeError, AttributeError) as e:
+        # a truncated or corrupted entry is a miss, embedding the file again overwrites it
+        print(f"Ignoring unreadable embedding cache entry for {filepath}: {e}")
+        return None
+    # marks the entry as recently used for prune()
+    with contextlib.suppress(OSError):
+        os.utime(meta_path)
+    return chunks, vectors, pages
+
+def store(filepath: str, chunks: list[str], vectors: np.ndarray, pages: list[int])->None:
+    '''
+    input: filepath of a document, its chunks, their embeddings and the page each chunk starts on
+    writes the entry to the on-disk cache
+    output: None
+    '''
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    meta_path, vectors_path=_entry_paths(cache_key(file_digest(filepath)))
+    meta={
+        "source": os.path.basename(filepath),
+        "chunker": CHUNKER_VERSION,
+        "embedder": EMBEDDER_VERSION,
+        "chunks": chunks,
+        "pages": pages,
+    }
+
+    # vectors go first and the metadata last, so a half written entry is never picked up by load()
+    tmp_vectors=vectors_path+".tmp"
+    with open(tmp_vectors, 'wb') as f:
+        np.save(f, np.asarray(vectors, dtype='float32'))
+    os.replace(tmp_vectors, vectors_path)
+
+    tmp_meta=meta_path+".tmp"
+    with open(tmp_meta, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, meta_path)
+    prune()
+
+def prune(max_bytes: int=None)->None:
+    '''
+    input: size the cache may take on disk, MAX_CACHE_BYTES by default
+    deletes the least recently used entries until the cache fits
+    '''
+    max_bytes=MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    entries={}  # key -> [last use, bytes]
+    try:
+        names=os.listdir(CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        key, extension=os.path.splitext(name)
+        if extension not in (".json", ".npy"):
+            continue
+        try:
+            stat=os.stat(os.path.join(CACHE_DIR, name))
+        except OSError:
+            continue
+        entry=entries.setdefault(key, [0, 0])
+        if extension==".json":
+            entry[0]=stat.st_mtime
+        entry[1]+=stat.st_size
+    total=sum(size for _, size in entries.values())
+    for key, (_, size) in sorted(entries.items(), key=lambda item: item[1][0]):
+        if total<=max_bytes:
+            break
+        for path in _entry_paths(key):
+            with contextlib.suppress(OSError):
+                os.remove(path)
+        total-=size
+
+def load_or_embed(filepath: str, embed_file)->tuple[list[str], np.ndarray, list[int]]:
+    '''
+    input: filepath of a document, and a function mapping a filepath to (chunks, vectors, pages)
+    output: chunks, float32 vectors and page numbers, read from the cache when the file is unchanged
+    '''
+    cached=load(filepath)
+    if cached is not None:
+        return cached
+
+    chunks, vectors, pages=embed_file(filepath)
+    vectors=np.asarray(vectors, dtype='float32')
+    try:
+        store(filepath, chunks, vectors, pages)
+    except OSError as e:
+        print(f"Could not write embedding cache for {filepath}: {e}")
+    return chunks, vectors, pages
@@ -0,0 +1,93 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+MODEL_NAME='all-MiniLM-L6-v2'
+# longest input the embedder reads, including its two special tokens; anything after is silently dropped
+MAX_SEQ_TOKENS=256
+
+# torch intra-op threads used by the embedder, 0 keeps torch's default
+EMBEDDER_THREADS=int(os.environ.get("RAG_EMBEDDER_THREADS", "0"))
+
+# query embeddings kept for repeated questions
+QUERY_CACHE_SIZE=int(os.environ.get("RAG_QUERY_CACHE", "1024"))
+
+_embedder=None
+_tokenizer=None
+_lock=threading.Lock()
+_query_cache=OrderedDict()   # normalized query -> embedding, least recently used first
+_query_cache_lock=threading.Lock()
+
+def get_embedder():
+    '''
+    output: the process wide SentenceTransformer, created on first use
+    '''
+    global _embedder
+    if _embedder is None:
+        with _lock:
+            if _embedder is None:
+                # imported here so that importing a backend does not pull in torch
+                from sentence_transformers import SentenceTransformer
+                if EMBEDDER_THREADS>0:
+                    import torch
+                    torch.set_num_threads(EMBEDDER_THREADS)
+                _embedder=SentenceTransformer(MODEL_NAME)
+                print(f"Embedding model {MODEL_NAME} loaded")
+    return _embedder
+
+def get_tokenizer():
+    '''
+    output: the tokenizer of the embedding model; loaded on its own when the model is not, so
+    ingestion worker processes can count tokens without loading torch weights
+    '''
+    global _tokenizer
+    if _embedder is not None:
+        return _embedder.tokenizer
+    if _tokenizer is None:
+        with _lock:
+            if _tokenizer is None:
+                from transformers import AutoTokenizer
+                _tokenizer=AutoTokenizer.from_pretrained(f"sentence-transformers/{MODEL_NAME}")
+    return _tokenizer
+
+def is_loaded()->bool:
+    return _embedder is not None
+
+def encode(texts: list[str], batch_size: int=32)->np.ndarray:
+    '''
+    input: list of texts
+    output: float32 embeddings of the texts, one row per text
+    '''
+    vectors=get_embedder().encode(texts, batch_size=batch_size)
+    return np.asarray(vectors, dtype='float32')
+
+def normalize_query(query: str)->str:
+    '''
+    input: query text
+    output: cache key of the query; the model is uncased and ignores runs of whitespace, so this does not change its embedding
+    '''
+    return " ".join(query.lower().split())
+
+def encode_queries(queries: list[str])->np.ndarray:
+    '''
+    input: list of queries
+    output: float32 embeddings, one row per query; cached queries are reused and the rest are encoded in one batch
+    '''
+    keys=[normalize_query(query) for query in queries]
+    found={}
+    with _query_cache_lock:
+        for key in keys:
+            if key in _query_cache:
+                _query_cache.move_to_end(key)
+                found[key]=_query_cache[key]
+    missing=list(dict.fromkeys(key for key in keys if key not in found))
+    if missing:
+        for key, vector in zip(missing, encode(missing, batch_size=min(256, len(missing)))):
+            found[key]=vector
+        with _query_cache_lock:
+            for key in missing:
+                _query_cache[key]=found[key]
+            while len(_query_cache)>QUERY_CACHE_SIZE:
+                _query_cache.popitem(last=False)
+    return np.vstack([found[key] for key in keys])
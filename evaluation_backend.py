@@ -1,13 +1,9 @@
-import pymupdf
-import llama_cpp
-from sentence_transformers import SentenceTransformer
-import faiss
-import numpy as np
-from PySide6.QtCore import QRunnable, Slot, Signal, QObject
-import traceback
 import sys
 import os
-import json
+import embedding_cache
+import ingestion
+from index_manager import IndexManager
+from chat_history import HistoryManager
 
 if getattr(sys, 'frozen', False):
     # Running as a bundled exe
@@ -15,130 +11,81 @@ if getattr(sys, 'frozen', False):
 else:
     # Running as a .py file
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-from model_loader import llm_model
-
-llm=llm_model
+import model_loader
+import inference
+import context_packing
+import retrieval
+import knowledge_base
+import evaluation_metrics
 
 
+# downloaded during the model warm-up, so it may not exist yet at import time
 json_path=os.path.join(BASE_DIR, "metrics", "sample1.json")
 
-if not os.path.exists(json_path):
-    raise ValueError(f"Model path or json path does not exist: {json_path}")
-
-index=None
-id_to_text={}
-
-embedder=SentenceTransformer('all-MiniLM-L6-v2')
-
-def extract_json_information(filepath: str)->dict:
-    '''
-    input: path of json file
-    output: infomration contained in the given json
-    '''
-    with open(filepath, 'r') as f:
-        data = json.load(f)
-    return data
-
-def split_into_chunks(text, chunk_size=500, overlap=50):
-    '''
-    input: text in the form of  a string
-    output: list of chunks of text, each of size chunk_size
-    '''
-    
-    chunks=[]
-    for i in range(0, len(text), chunk_size-overlap):
-        chunks.append(text[i:i+chunk_size])
-    return chunks
+index_manager=IndexManager()
+history_manager=HistoryManager()
+# knowledge base holding the last indexed selection, reopened memory mapped on the next launch
+KNOWLEDGE_BASE="evaluation"
 
-def embed_text(text:str)->np.ndarray:
-    # embed the text using the sentence transformer model
+def search_chunk_ids(query, top_k=3, timings=None):
     '''
-    input: text in the form of a string
-    output: embedding of the text in the form of a numpy array
+    input: query in the form of a string, and optionally a dict receiving the latency of every retrieval stage
+    output: ids of the top_k best matching chunks by vector similarity fused with BM25, best first
     '''
+    return retrieval.search(index_manager, query, top_k, timings=timings)
 
-    chunks=split_into_chunks(text)
-    vectors=embedder.encode(chunks)
-    return chunks, vectors
-
-def extract_text_from_pdf(filepath: str)-> str:
+def search_chunks(query, top_k=3):
     '''
-    input: filepath of pdf
-    output: text extracted from the pdf
+    input: query in the form of a string
+    output: top_k most similar chunks
     '''
-    doc=pymupdf.open(filepath)
-    full_text=""
-    for page in doc:
-        full_text+=page.get_text()
-    return full_text
+    return [index_manager.chunks[i] for i in search_chunk_ids(query, top_k)]
 
-def create_index(vectors, chunks):
+def search_chunks_batch(queries: list[str], top_k=3)->list[list[str]]:
     '''
-    input: list of vectors and list of chunks
-    output: faiss index
+    input: list of queries
+    output: top_k best matching chunks for every query; the queries are embedded in one forward pass and the index is searched once
     '''
-    global index
-    global id_to_text
-    dimension=vectors.shape[1]
-    index=faiss.IndexFlatL2(dimension)
-    index.reset()
-    index.add(np.array(vectors).astype('float32'))
-    id_to_text={i:text for i,text in enumerate(chunks)}
+    return [[index_manager.chunks[i] for i in ids] for ids in retrieval.search_batch(index_manager, queries, top_k)]
 
-def search_chunks(query, top_k=3):
+def index_files(filepaths: list[str], on_progress=None)->tuple[bool, callable]:
     '''
-    input: query in the form of a string
-    output: top_k most similar chunks
+    input: list of filepaths, and an optional callback receiving (files done, total files)
+    processes files for text extraction and embedding, only embedding files that are not already indexed
+    output: whether the indexed selection changed, and a function mapping an indexed filepath to (chunks, vectors, pages)
     '''
-    query_vec=embedder.encode([query]).astype('float32')
-    D, I = index.search(query_vec, k=top_k)
-    return [id_to_text[i] for i in I[0]]
+    paths=[path for path in filepaths if ingestion.is_supported(path)]
+    new_paths=index_manager.missing(paths)
+    changed=bool(new_paths) or set(paths)!=set(index_manager.files)
+    ingested=ingestion.ingest_files(new_paths, on_progress=on_progress)
+    load_file=lambda path: ingested[path] if path in ingested else embedding_cache.load_or_embed(path, ingestion.embed_file)
+    index_manager.sync(paths, load_file)
+    return changed, load_file
 
-def process_files(filepaths: list[str])-> None:
+def process_files(filepaths: list[str], on_progress=None)-> None:
     '''
-    input: list of filepaths
-    processes files for text extraction and embedding
+    input: list of filepaths, and an optional callback receiving (files done, total files)
+    indexes the files like index_files, starting from the app's knowledge base and saving the selection back to it
     output: None
     '''
-    all_chunks=[]
-    all_vectors=[]
-    for path in filepaths:
-        if path.endswith('.pdf'):
-            text=extract_text_from_pdf(path)
-
-        elif path.endswith('.json'):
-            with open(path, 'r') as f:
-                text=f.read()
-        
-        else:
-            continue
-        chunks, vectors=embed_text(text)
-        all_chunks.extend(chunks)
-        all_vectors.append(vectors)
-
-    if all_vectors:
-        all_vectors=np.vstack(all_vectors)
-        create_index(all_vectors, all_chunks)
-
-    else:
-        raise ValueError('No text extracted')
+    if index_manager.index is None:
+        knowledge_base.load(index_manager, KNOWLEDGE_BASE)
+    changed, load_file=index_files(filepaths, on_progress)
+    if changed:
+        # written in the background once the selection settles, so questions do not wait for it
+        knowledge_base.save_later(index_manager, KNOWLEDGE_BASE, load_file)
     
-def ask_model(question: str, history: list[tuple[str, str]], json_path: str, max_tokens: int)->str:
+# constant head of every evaluation prompt, kept identical across questions so its evaluated KV state can be reused
+PROMPT_PREFIX="""<|im_start|>system
+    You are a helpful assistant in a document Q&A app set up, where the task is to generate evaluation feedback. Consider the metrics to contain information on the conducted evaluation. Use the added context, to enhance the answers created from the metrics. If the answer is not present in the context, print "Insufficient context" and nothing else. Structure your response in markdown, using bullet points or headings if appropriate. Ensure that if there is no relevant information, you provide "Insufficient context" and nothing else at all. <|im_end|>
+    """
+
+def build_prompt(question: str, metrics, context: str, chat_history: str)->str:
     '''
-    input: question as a string, and history of previous questions and answers, and max tokens to decide output length
-    output: answer as a string
+    input: question, rendered evaluation metrics, retrieved context and rendered chat history
+    output: full prompt for the llm
     '''
-    context="\n\n".join(search_chunks(question))
-
-    metrics=extract_json_information(json_path)
-
-    chat_history=""
-    for q,a in history:
-        chat_history+="Q: "+q+"\nA: "+a+"\n\n"
-
-    final_prompt=f"""<|im_start|>system
-    You are a helpful assistant in a document Q&A app set up, where the task is to generate evaluation feedback. Consider the metrics to contain information on the conducted evaluation. Use the added context, to enhance the answers created from the metrics. If the answer is not present in the context, print "Insufficient context" and nothing else. Structure your response in markdown, using bullet points or headings if appropriate. Ensure that if there is no relevant information, you provide "Insufficient context" and nothing else at all. <|im_end|>
-    {chat_history}
+    return PROMPT_PREFIX+f"""{chat_history}
     <|im_start|>user
     Use the following metrics to answer the question. Enhance the answer using the given context, and print only the answer in markdown. Do not print information irrelevant to the question. If information is present in the context, do not print anything about insufficient context.
 
@@ -153,44 +100,49 @@ def ask_model(question: str, history: list[tuple[str, str]], json_path: str, max
     <|im_start|>assistant
     """
 
-    temp=0.7
+def ask_model(question: str, history: list[tuple[str, str]], json_path: str, max_tokens: int, on_text=None, on_stats=None, candidate_ids=None)->str:
+    '''
+    input: question as a string, and history of previous questions and answers, path of the metrics json, and max tokens to decide output length
+    optionally on_text receives the partial answer while it streams, and on_stats the generation stats;
+    chunk ids already retrieved for the question skip the retrieval
+    output: answer as a string
+    '''
+    available=context_packing.available_tokens(max_tokens)
+    chat_history=history_manager.render(history, min(history_manager.budget_tokens, available//4))
+    # only the metrics relevant to the question, from a file parsed once
+    metrics=evaluation_metrics.load(json_path).render_for(question, min(evaluation_metrics.METRICS_TOKEN_BUDGET, available//4))
+    prompt_tokens=inference.count_tokens(build_prompt(question, metrics, "", chat_history))
+    context_budget=min(context_packing.CONTEXT_TOKEN_BUDGET, available-prompt_tokens)
+    retrieval_timings={}
+    if candidate_ids is None:
+        candidate_ids=search_chunk_ids(question, context_packing.CANDIDATE_POOL, retrieval_timings)
+    context=context_packing.pack_context(candidate_ids, index_manager, context_budget)
 
-    response=llm.create_completion(
-        prompt=final_prompt,
-        temperature=temp,
-        max_tokens=max_tokens
-    )
+    final_prompt=build_prompt(question, metrics, context, chat_history)
+
+    temp=0.7
 
-    assistant_reply=response['choices'][0]['text']
-    assistant_reply=assistant_reply.replace("[/INST]", "")
+    assistant_reply, stats=inference.complete(final_prompt, max_tokens, temperature=temp, on_text=on_text, prefix=PROMPT_PREFIX)
+    stats["retrieval"]=retrieval_timings
+    if on_stats:
+        on_stats(stats)
     return assistant_reply
 
-class WorkerSignals(QObject):
-    finished=Signal()
-    error=Signal(str)
-    result=Signal(object)
-
-class EvaluationWorker(QRunnable):
-    def __init__(self, filepaths, json_filepath, question=None, history=None, max_tokens: int=512):
-        super().__init__()
-        self.filepaths=filepaths
-        self.json_filepath=json_filepath
-        self.question=question
-        self.history=history or []
-        self.max_tokens=max_tokens
-        self.signals=WorkerSignals()
-    
-    @Slot()
-    def run(self):
-        try:
-            process_files(self.filepaths)
-            if self.question:
-                result=ask_model(self.question, self.history, self.json_filepath, self.max_tokens)
-                self.history.append((self.question, result))
-                self.signals.result.emit((result, self.history))
-        
-        except Exception as e:
-            tb=traceback.format_exc()
-            self.signals.error.emit(tb)
-        finally:
-            self.signals.finished.emit()
+def answer(filepaths: list[str], json_path: str, question: str, history: list[tuple[str, str]]=None, max_tokens: int=512, on_text=None, on_stats=None, on_progress=None, autosave: bool=True)->tuple[str, list[tuple[str, str]]]:
+    '''
+    input: selected filepaths, path of the metrics json, question, history of previous questions and answers, max
+    tokens of the answer, and optional callbacks receiving the partial answer, the generation stats and the indexing progress, and
+    whether the selection is kept in the app's knowledge base, which headless callers leave to the app
+    indexes the files and answers the question, then summarises old turns in the background
+    output: answer, and the history with this turn appended
+    '''
+    history=list(history or [])
+    model_loader.wait_until_ready()
+    if autosave:
+        process_files(filepaths, on_progress)
+    else:
+        index_files(filepaths, on_progress)
+    reply=ask_model(question, history, json_path, max_tokens, on_text, on_stats)
+    history.append((question, reply))
+    history_manager.refresh_summary_async(history)
+    return reply, history
@@ -0,0 +1,138 @@
+'''
+Headless batch mode of the evaluation assistant: answers a file of questions about a metrics JSON file.
+
+usage: python evaluation_batch.py --pdf FILE [FILE ...] --metrics METRICS.json --questions QUESTIONS --output RESULTS
+
+The documents are indexed and the metrics read once; all questions are retrieved in one batch, with repeated
+questions retrieved once, and then answered one after another without chat history. Questions are read from a
+.txt file (one per line, blank lines and lines starting with # skipped), a .json file (a list of strings or of
+objects with a "question" field) or a .jsonl file (one such string or object per line). Results are written as
+they complete, to a .csv file or otherwise as JSON lines.
+'''
+import argparse
+import csv
+import json
+import time
+import model_loader
+import scheduler
+import embedding_service
+import retrieval
+import context_packing
+import evaluation_backend
+import evaluation_metrics
+
+RESULT_FIELDS=["question", "answer", "total_s", "queue_wait_s", "time_to_first_token_s", "prompt_tokens", "completion_tokens", "retrieval_s", "error"]
+
+def read_questions(path: str)->list[str]:
+    '''
+    input: path of a .txt, .json or .jsonl question file
+    output: list of questions; json records without a question are reported with their position and skipped
+    '''
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.lower().endswith('.jsonl'):
+            records=[]
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    records.append((f"line {line_number}", json.loads(line)))
+                except ValueError as e:
+                    print(f"Skipping line {line_number} of {path}, it is not valid JSON: {e}")
+        elif path.lower().endswith('.json'):
+            records=[(f"item {position}", item) for position, item in enumerate(json.load(f), 1)]
+        else:
+            return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+    questions=[]
+    for where, record in records:
+        question=record.get("question") if isinstance(record, dict) else record
+        if not isinstance(question, str) or not question.strip():
+            print(f"Skipping {where} of {path}, it has no \"question\" text")
+            continue
+        questions.append(question)
+    return questions
+
+class ResultWriter:
+    '''
+    Appends one result row per question to a csv or JSON lines file, flushing every row.
+    '''
+    def __init__(self, path: str):
+        self.file=open(path, 'w', encoding='utf-8', newline='')
+        self.writer=None
+        if path.lower().endswith('.csv'):
+            self.writer=csv.DictWriter(self.file, fieldnames=RESULT_FIELDS)
+            self.writer.writeheader()
+
+    def write(self, row: dict)->None:
+        if self.writer:
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row, ensure_ascii=False)+"\n")
+        self.file.flush()
+
+    def close(self)->None:
+        self.file.close()
+
+def run_batch(filepaths: list[str], metrics_path: str, questions: list[str], output_path: str, max_tokens: int=512, on_result=None)->list[dict]:
+    '''
+    input: document filepaths, metrics json path, questions, results file path, answer length, and optionally a
+    callback receiving (position, result row) as each question is answered
+    output: the result rows, in question order
+    '''
+    model_loader.wait_until_ready()
+    start=time.perf_counter()
+    # headless, so the app's saved selection is left alone
+    evaluation_backend.index_files(filepaths)
+    evaluation_metrics.load(metrics_path)
+    print(f"Indexed {len(filepaths)} documents and read metrics in {time.perf_counter()-start:.2f}s")
+
+    # one retrieval per distinct question, in a single batch
+    start=time.perf_counter()
+    distinct=list(dict.fromkeys(embedding_service.normalize_query(question) for question in questions))
+    retrieved=dict(zip(distinct, retrieval.search_batch(evaluation_backend.index_manager, distinct, context_packing.CANDIDATE_POOL)))
+    retrieval_s=(time.perf_counter()-start)/max(1, len(distinct))
+    print(f"Retrieved context for {len(distinct)} distinct of {len(questions)} questions in {time.perf_counter()-start:.2f}s")
+
+    rows=[]
+    writer=ResultWriter(output_path)
+    try:
+        for position, question in enumerate(questions):
+            stats={}
+            row={"question": question, "answer": None, "retrieval_s": retrieval_s, "error": None}
+            try:
+                # a batch should not hold up interactive use of the model in the same process
+                with scheduler.priority(scheduler.BACKGROUND):
+                    row["answer"]=evaluation_backend.ask_model(question, [], metrics_path, max_tokens, on_stats=stats.update,
+                        candidate_ids=retrieved[embedding_service.normalize_query(question)])
+            except Exception as e:
+                row["error"]=repr(e)
+            for field in ("total_s", "queue_wait_s", "time_to_first_token_s", "prompt_tokens", "completion_tokens"):
+                row[field]=stats.get(field)
+            writer.write(row)
+            rows.append(row)
+            if on_result:
+                on_result(position, row)
+    finally:
+        writer.close()
+
+    answered=[row for row in rows if row["error"] is None]
+    if answered:
+        total=sum(row["total_s"] for row in answered)
+        print(f"Answered {len(answered)} of {len(rows)} questions in {total:.1f}s, {total/len(answered):.2f}s per question, "
+            f"{sum(row['completion_tokens'] for row in answered)} tokens generated")
+    return rows
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", nargs="+", required=True)
+    parser.add_argument("--metrics", required=True)
+    parser.add_argument("--questions", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--max-tokens", type=int, default=512)
+    args=parser.parse_args()
+
+    questions=read_questions(args.questions)
+    run_batch(args.pdf, args.metrics, questions, args.output, args.max_tokens,
+        on_result=lambda position, row: print(f"[{position+1}/{len(questions)}] {row['question'][:60]}"))
+
+if __name__=="__main__":
+    main()
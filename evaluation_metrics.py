@@ -0,0 +1,132 @@
+import json
+import os
+import re
+import threading
+import numpy as np
+import embedding_service
+import retrieval
+from bm25 import BM25Index
+from inference import count_tokens
+
+# upper bound on rendered metrics per prompt
+METRICS_TOKEN_BUDGET=int(os.environ.get("RAG_METRICS_TOKENS", "400"))
+# lists of scalars at most this long become one record instead of one record per item
+INLINE_LIST_ITEMS=8
+
+def flatten(data, path: str="")->list[tuple[str, str]]:
+    '''
+    input: parsed json and the path of its root
+    output: list of (dotted path, value as text), one per scalar, in file order
+    '''
+    if isinstance(data, dict):
+        records=[]
+        for key, value in data.items():
+            records.extend(flatten(value, f"{path}.{key}" if path else str(key)))
+        return records
+    if isinstance(data, list):
+        if len(data)<=INLINE_LIST_ITEMS and not any(isinstance(item, (dict, list)) for item in data):
+            return [(path, "; ".join(json.dumps(item) if not isinstance(item, str) else item for item in data))]
+        records=[]
+        for position, item in enumerate(data):
+            records.extend(flatten(item, f"{path}[{position}]"))
+        return records
+    return [(path, data if isinstance(data, str) else json.dumps(data))]
+
+def record_text(path: str, value: str)->str:
+    # path words and value, which is what questions about a metric mention
+    return re.sub(r"[._\[\]]+", " ", path)+" "+value
+
+def render(records: list[tuple[str, str]])->str:
+    '''
+    input: metric records in file order
+    output: one line per parent path, e.g. "quiz_results: total_questions=15, correct_answers=13"
+    '''
+    lines=[]
+    parent_of_line=None
+    for path, value in records:
+        parent, _, key=path.rpartition(".")
+        if parent and parent==parent_of_line:
+            lines[-1]+=f", {key}={value}"
+        elif parent:
+            lines.append(f"{parent}: {key}={value}")
+        else:
+            lines.append(f"{key}: {value}")
+        parent_of_line=parent or None
+    return "\n".join(lines)
+
+class MetricsIndex:
+    '''
+    Metric records of one metrics file, with a BM25 index and embeddings over them, so a question gets only
+    the metrics it is about instead of the whole file.
+    '''
+    def __init__(self, data):
+        self.records=flatten(data)
+        texts=[record_text(path, value) for path, value in self.records]
+        self.lexical=BM25Index()
+        self.lexical.add(np.arange(len(texts), dtype='int64'), texts)
+        self.vectors=embedding_service.encode(texts) if texts else np.zeros((0, 0), dtype='float32')
+        self.total_cost=count_tokens(render(self.records))
+        # tokens a record adds to a line its parent already has, a lower bound on what it adds to any rendering
+        self.min_costs=[count_tokens(f", {path.rpartition('.')[2]}={value}") for path, value in self.records]
+
+    def ranked(self, question: str)->list[int]:
+        '''
+        input: question
+        output: positions of all records, most relevant first, by fused BM25 and embedding similarity
+        '''
+        if not self.records:
+            return []
+        query=embedding_service.encode_queries([question])[0]
+        similarity=self.vectors@query
+        semantic=np.argsort(-similarity, kind='stable').tolist()
+        lexical, _=self.lexical.search(question, len(self.records))
+        return retrieval.reciprocal_rank_fusion([semantic, lexical.tolist()])
+
+    def select(self, question: str, budget_tokens: int=METRICS_TOKEN_BUDGET)->list[tuple[str, str]]:
+        '''
+        input: question and token budget
+        output: all records when their rendering fits the budget, otherwise the most relevant records whose
+        rendering fits, in file order
+        '''
+        if self.total_cost<=budget_tokens:
+            return list(self.records)
+        chosen=[]
+        used=0
+        for position in self.ranked(question):
+            if used+self.min_costs[position]>budget_tokens:
+                continue
+            # records sharing a parent share its line, so the cost is measured on the rendering as a whole
+            candidate=sorted(chosen+[position])
+            cost=count_tokens(render([self.records[i] for i in candidate]))
+            if cost<=budget_tokens:
+                chosen=candidate
+                used=cost
+        return [self.records[position] for position in chosen]
+
+    def render_for(self, question: str, budget_tokens: int=METRICS_TOKEN_BUDGET)->str:
+        '''
+        input: question and token budget
+        output: compact rendering of the metrics relevant to the question
+        '''
+        return render(self.select(question, budget_tokens))
+
+# filepath -> (mtime, size, MetricsIndex)
+_loaded={}
+_lock=threading.Lock()
+
+def load(filepath: str)->MetricsIndex:
+    '''
+    input: path of a metrics json file
+    output: its MetricsIndex, parsed and indexed again only when the file changed
+    '''
+    stat=os.stat(filepath)
+    with _lock:
+        cached=_loaded.get(filepath)
+        if cached and cached[0]==stat.st_mtime_ns and cached[1]==stat.st_size:
+            return cached[2]
+    with open(filepath, 'r', encoding='utf-8') as f:
+        metrics=MetricsIndex(json.load(f))
+    with _lock:
+        _loaded[filepath]=(stat.st_mtime_ns, stat.st_size, metrics)
+    print(f"Indexed {len(metrics.records)} metrics from {os.path.basename(filepath)}")
+    return metrics
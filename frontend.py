@@ -1,10 +1,14 @@
 import sys
+import multiprocessing
 from PySide6.QtWidgets import(
-    QApplication, QWidget, QVBoxLayout, QPushButton, QLabel, QGridLayout, QFormLayout, QSpinBox, QHBoxLayout, QStackedWidget, QSlider
+    QApplication, QWidget, QVBoxLayout, QPushButton, QLabel, QGridLayout, QFormLayout, QSpinBox, QHBoxLayout, QStackedWidget, QSlider, QProgressBar
 )
-from PySide6.QtCore import Qt, Signal
+from PySide6.QtCore import Qt, Signal, QObject, QRunnable, QThreadPool, Slot
 from PySide6.QtGui import QIcon, QPixmap
 import os
+import traceback
+
+import model_loader
 
 from rag_gui import RAGChatWidget
 
@@ -19,6 +23,29 @@ else:
     # Running as a .py file
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+class WarmupSignals(QObject):
+    progress=Signal(int, str)
+    finished=Signal()
+    error=Signal(str)
+
+class WarmupWorker(QRunnable):
+    '''
+    Downloads and loads the LLM and embedding model off the GUI thread, so the window opens immediately.
+    '''
+    def __init__(self):
+        super().__init__()
+        self.signals=WarmupSignals()
+
+    @Slot()
+    def run(self):
+        try:
+            model_loader.warm_up(lambda percent, message: self.signals.progress.emit(percent, message))
+        except Exception as e:
+            tb=traceback.format_exc()
+            self.signals.error.emit(tb)
+        finally:
+            self.signals.finished.emit()
+
 class MainWindow(QWidget):
     def __init__(self):
         super().__init__()
@@ -26,7 +53,9 @@ class MainWindow(QWidget):
         self.setMinimumSize(1000, 700)
 
         self.max_tokens_value=512
+        self.threadpool=QThreadPool()
         self.setup_ui()
+        self.start_warm_up()
 
     def setup_ui(self):
         main_layout=QHBoxLayout()
@@ -139,6 +168,17 @@ class MainWindow(QWidget):
         
         left_side_panel_layout.addStretch()
 
+        self.model_status_label=QLabel("Loading models...")
+        self.model_status_label.setWordWrap(True)
+        self.model_status_label.setStyleSheet("color: #dcdcdc; font-size: 12px;")
+        left_side_panel_layout.addWidget(self.model_status_label)
+
+        self.model_progress_bar=QProgressBar()
+        self.model_progress_bar.setRange(0, 100)
+        self.model_progress_bar.setTextVisible(False)
+        self.model_progress_bar.setFixedHeight(8)
+        left_side_panel_layout.addWidget(self.model_progress_bar)
+
         self.reset_all_button=QPushButton("Clear")
         self.reset_all_button.setIcon(icon("reset.png"))
         self.reset_all_button.setStyleSheet(reset_button_style)
@@ -178,6 +218,26 @@ class MainWindow(QWidget):
         self.stack.setCurrentWidget(self.welcome_page)
         main_layout.addWidget(self.stack, 4)
 
+    def start_warm_up(self):
+        worker=WarmupWorker()
+        worker.signals.progress.connect(self.update_warm_up_progress)
+        worker.signals.error.connect(self.warm_up_failed)
+        worker.signals.finished.connect(self.warm_up_finished)
+        self.threadpool.start(worker)
+
+    def update_warm_up_progress(self, percent, message):
+        self.model_progress_bar.setValue(percent)
+        self.model_status_label.setText(message)
+
+    def warm_up_failed(self, error):
+        print(error)
+        self.model_status_label.setText("Model loading failed, see console for details.")
+        self.model_status_label.setStyleSheet("color: #ff6b6b; font-size: 12px;")
+
+    def warm_up_finished(self):
+        if model_loader.is_ready():
+            self.model_progress_bar.hide()
+
     def update_max_tokens(self, value):
         self.max_tokens_value=value
         self.max_tokens_label.setText(f"Max Tokens: {self.max_tokens_value}")
@@ -217,6 +277,8 @@ class MainWindow(QWidget):
         else:
             print(f"Current page '{current_widget.windowTitle()}' does not have a specific reset method.")
 if __name__=="__main__":
+    # ingestion runs extraction in worker processes, which a frozen build must not start as new windows
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     app.setStyleSheet("""
         QWidget{
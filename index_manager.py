@@ -0,0 +1,434 @@
+import math
+import os
+import threading
+import faiss
+import numpy as np
+import embedding_cache
+from chunk_store import ChunkStore
+from bm25 import BM25Index
+
+INDEX_KINDS=("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+# corpus size at which "auto" switches to an approximate index
+FLAT_MAX_VECTORS=50_000
+
+# "auto" picks the kind from the corpus size, or one of INDEX_KINDS to always build that kind, e.g. ivf_pq to
+# trade recall for memory on very large corpora
+INDEX_KIND=os.environ.get("RAG_INDEX_KIND", "auto")
+# IVF lists probed per query and HNSW candidate list size; higher values trade speed for recall
+DEFAULT_NPROBE=int(os.environ.get("RAG_NPROBE", "16"))
+DEFAULT_EF_SEARCH=int(os.environ.get("RAG_EF_SEARCH", "64"))
+HNSW_M=32
+PQ_BITS=8
+TRAIN_POINTS_PER_LIST=64
+
+def choose_index_kind(n_vectors: int)->str:
+    '''
+    input: number of vectors in the corpus
+    output: index kind suited to that corpus size; never ivf_pq, whose compressed vectors lose too much recall
+    to be chosen without asking, and which faiss cannot refine while keeping removal
+    '''
+    if n_vectors<FLAT_MAX_VECTORS:
+        return "flat"
+    return "ivf_flat"
+
+def ivf_nlist(n_vectors: int)->int:
+    '''
+    input: number of vectors in the corpus
+    output: number of IVF lists, roughly 4*sqrt(n) as recommended by faiss
+    '''
+    return max(1, min(65536, int(4*math.sqrt(n_vectors))))
+
+def pq_subquantizers(dimension: int)->int:
+    '''
+    input: vector dimension
+    output: number of PQ sub-quantizers, the largest divisor of dimension leaving at least 4 dims per sub-vector
+    '''
+    for m in (64, 48, 32, 24, 16, 8, 4, 2, 1):
+        if dimension%m==0 and dimension//m>=4:
+            return m
+    return 1
+
+def build_index(kind: str, dimension: int, n_vectors: int):
+    '''
+    input: index kind, vector dimension and expected corpus size
+    output: empty faiss index accepting add_with_ids, untrained for the IVF kinds
+    '''
+    if kind=="flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+    if kind=="hnsw":
+        return faiss.IndexIDMap2(faiss.IndexHNSWFlat(dimension, HNSW_M))
+    nlist=ivf_nlist(n_vectors)
+    quantizer=faiss.IndexFlatL2(dimension)
+    if kind=="ivf_flat":
+        index=faiss.IndexIVFFlat(quantizer, dimension, nlist)
+    elif kind=="ivf_pq":
+        index=faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_subquantizers(dimension), PQ_BITS)
+    else:
+        raise ValueError(f"Unknown index kind: {kind}. Expected one of {INDEX_KINDS}")
+    return index
+
+def train_index(index, vectors: np.ndarray, seed: int=42)->None:
+    '''
+    input: untrained faiss index and the corpus vectors
+    trains the index on a random sample of the corpus
+    output: None
+    '''
+    if index.is_trained:
+        return
+    ivf=faiss.extract_index_ivf(index)
+    sample_size=min(len(vectors), max(ivf.nlist*TRAIN_POINTS_PER_LIST, 1<<PQ_BITS))
+    if len(vectors)<ivf.nlist:
+        raise ValueError(f"Need at least {ivf.nlist} vectors to train the index, got {len(vectors)}")
+    rng=np.random.default_rng(seed)
+    sample=vectors[rng.choice(len(vectors), size=sample_size, replace=False)]
+    index.train(np.ascontiguousarray(sample, dtype='float32'))
+
+def set_search_params(index, nprobe: int=DEFAULT_NPROBE, ef_search: int=DEFAULT_EF_SEARCH)->None:
+    '''
+    input: faiss index, IVF lists to probe and HNSW candidate list size
+    applies the search knobs relevant to the index type
+    output: None
+    '''
+    inner=faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch=ef_search
+    elif isinstance(inner, faiss.IndexIVF):
+        inner.nprobe=min(nprobe, inner.nlist)
+
+def file_vectors(vectors: np.ndarray, path: str, ids: np.ndarray, load_file, loaded: dict=None)->np.ndarray:
+    '''
+    input: memory mapped vectors of a knowledge base or None, a filepath, its ids, a function mapping a filepath to
+    (chunks, vectors, pages), and optionally vectors already loaded per filepath
+    output: the file's float32 vectors, from loaded, the mapped vectors or load_file
+    '''
+    if loaded and path in loaded:
+        return np.asarray(loaded[path], dtype='float32')
+    if vectors is not None and ids[-1]<len(vectors):
+        return np.asarray(vectors[ids[0]:ids[-1]+1], dtype='float32')
+    return np.asarray(load_file(path)[1], dtype='float32')
+
+def gather_vectors(files: dict, vectors: np.ndarray, load_file, loaded: dict=None)->tuple[np.ndarray, np.ndarray]:
+    '''
+    input: filepath -> (digest, ids), memory mapped vectors of a knowledge base or None, a function mapping a filepath
+    to (chunks, vectors, pages), and optionally vectors already loaded per filepath
+    output: the vectors of all files in one matrix and their ids, or (None, None) when there are none
+    '''
+    all_vectors=[]
+    all_ids=[]
+    for path, (_, ids) in files.items():
+        if len(ids)==0:
+            continue
+        all_vectors.append(file_vectors(vectors, path, ids, load_file, loaded))
+        all_ids.append(ids)
+    if not all_vectors:
+        return None, None
+    return np.ascontiguousarray(np.vstack(all_vectors)), np.concatenate(all_ids)
+
+def build_over(kind: str, vectors: np.ndarray, ids: np.ndarray, nprobe: int=DEFAULT_NPROBE, ef_search: int=DEFAULT_EF_SEARCH):
+    '''
+    input: index kind, the vectors and their ids, and the search knobs
+    output: index of that kind, trained on the vectors when it needs training, holding them under their ids
+    '''
+    index=build_index(kind, vectors.shape[1], len(vectors))
+    if not index.is_trained:
+        train_index(index, vectors)
+    set_search_params(index, nprobe, ef_search)
+    index.add_with_ids(vectors, ids)
+    return index
+
+def supports_removal(kind: str)->bool:
+    return kind!="hnsw"
+
+class IndexManager:
+    '''
+    Keeps one FAISS index for the current file selection and tracks which file contributed which vector ids,
+    so changing the selection only embeds newly added files and drops the ids of deselected ones.
+    The index kind is either fixed or chosen from the corpus size ("auto"). Approximate kinds are built, and
+    rebuilt when the corpus outgrows the trained index, on a background thread from the embedding cache, while
+    questions keep searching the previous index, or a flat one when there is none.
+    Chunk texts live in a ChunkStore, with a BM25 index over them kept alongside the vectors.
+    A manager opened from a knowledge base has its index and chunks memory mapped; the index is copied into
+    memory on the next change to the selection.
+    '''
+    def __init__(self, kind: str=INDEX_KIND, nprobe: int=DEFAULT_NPROBE, ef_search: int=DEFAULT_EF_SEARCH):
+        if kind!="auto" and kind not in INDEX_KINDS:
+            raise ValueError(f"Unknown index kind: {kind}. Expected 'auto' or one of {INDEX_KINDS}")
+        self.kind=kind
+        self.nprobe=nprobe
+        self.ef_search=ef_search
+        self.index=None
+        self.built_kind=None
+        self.trained_on=0
+        self.chunks=ChunkStore()
+        self.lexical=BM25Index()
+        self.files={}   # filepath -> (content digest, np.ndarray of vector ids)
+        self.vectors=None   # memory mapped vectors of a knowledge base, row i holding id i
+        self.mapped=False
+        self.lock=threading.Lock()
+        # bumped whenever files or ids change, so a background build of an older selection is thrown away
+        self.version=0
+        self.builder=None   # thread building the index kind suited to the corpus
+        self.load_file=None     # used by the builder, the one given to the last sync
+
+    def resolve_kind(self, n_vectors: int)->str:
+        '''
+        input: number of vectors in the corpus
+        output: index kind to build, falling back to flat when there is too little data to train an IVF index
+        '''
+        kind=choose_index_kind(n_vectors) if self.kind=="auto" else self.kind
+        if kind in ("ivf_flat", "ivf_pq") and n_vectors<ivf_nlist(n_vectors)*TRAIN_POINTS_PER_LIST//4:
+            return "flat"
+        return kind
+
+    def open_mapped(self, index, built_kind: str, trained_on: int, files: dict, chunks: ChunkStore, lexical: BM25Index, vectors: np.ndarray)->None:
+        '''
+        input: memory mapped index, the kind and corpus size it was built for, filepath -> (digest, ids),
+        the chunk store, the BM25 index, and the vectors with row i holding id i
+        replaces the manager's contents with a saved knowledge base
+        output: None
+        '''
+        with self.lock:
+            self.index=index
+            set_search_params(index, self.nprobe, self.ef_search)
+            self.built_kind=built_kind
+            self.trained_on=trained_on
+            self.files=files
+            self.chunks=chunks
+            self.lexical=lexical
+            self.vectors=vectors
+            self.mapped=True
+            self.version+=1
+
+    def is_contiguous(self)->bool:
+        '''
+        output: True if the ids run from 0 without gaps, which is the case until a file is removed
+        '''
+        return self.chunks.removed==0
+
+    def vectors_of(self, path: str, ids: np.ndarray, load_file, loaded: dict=None)->np.ndarray:
+        '''
+        input: filepath in the index, its ids, a function mapping a filepath to (chunks, vectors, pages), and optionally
+        vectors already loaded per filepath
+        output: the file's float32 vectors, from memory, the mapped knowledge base or load_file
+        '''
+        return file_vectors(self.vectors, path, ids, load_file, loaded)
+
+    def needs_compaction(self)->bool:
+        '''
+        output: True once the ids left behind by removed files outnumber the live ones
+        '''
+        return self.chunks.next_id-len(self.chunks)>len(self.chunks)
+
+    def _unmap(self)->None:
+        # a memory mapped index is read only, so it is copied into memory, keeping its training
+        if self.mapped:
+            self.index=faiss.deserialize_index(faiss.serialize_index(self.index))
+            set_search_params(self.index, self.nprobe, self.ef_search)
+            self.mapped=False
+
+    def compact(self, load_file, loaded: dict=None)->None:
+        '''
+        input: function mapping a filepath to (chunks, vectors, pages), and optionally vectors already loaded per filepath
+        renumbers the ids from 0 in file order, dropping the gaps left by removed files; the index is emptied and
+        refilled under the new ids, keeping its training
+        output: None
+        '''
+        loaded=dict(loaded or {})
+        for path, (_, ids) in self.files.items():
+            if len(ids) and path not in loaded:
+                loaded[path]=self.vectors_of(path, ids, load_file)
+        mapping=np.full(self.chunks.next_id, -1, dtype='int64')
+        self.chunks, new_ids=self.chunks.compacted({path: ids for path, (_, ids) in self.files.items()})
+        for path, (_, ids) in self.files.items():
+            mapping[ids]=new_ids[path]
+        self.lexical=self.lexical.compacted(mapping)
+        self.files={path: (digest, new_ids[path]) for path, (digest, _) in self.files.items()}
+        self.vectors=None
+        self.version+=1
+        self._refill(load_file, loaded)
+        self._rebuild_later(load_file)
+        print(f"Compacted the index to {len(self.chunks)} chunks")
+
+    def _register(self, path: str, digest: str, chunks: list[str], pages: list[int])->np.ndarray:
+        ids=self.chunks.add(path, chunks, pages)
+        self.lexical.add(ids, chunks)
+        self.files[path]=(digest, ids)
+        return ids
+
+    def _needs_rebuild(self, n_vectors: int)->bool:
+        kind=self.resolve_kind(n_vectors)
+        if self.index is None or kind!=self.built_kind:
+            return True
+        # IVF centroids trained on a much smaller corpus give poorly balanced lists
+        return kind in ("ivf_flat", "ivf_pq") and n_vectors>2*self.trained_on
+
+    def rebuild(self, load_file, loaded: dict=None, kind: str=None)->None:
+        '''
+        input: function mapping a filepath to (chunks, vectors, pages), optionally vectors already loaded per filepath,
+        and the kind to build, by default the one suited to the corpus
+        rebuilds the index for the current selection while the caller waits, keeping vector ids stable
+        output: None
+        '''
+        vectors, ids=gather_vectors(self.files, self.vectors, load_file, loaded)
+        if vectors is None:
+            self.index=None
+            self.built_kind=None
+            return
+        kind=kind or self.resolve_kind(len(vectors))
+        self._install(build_over(kind, vectors, ids, self.nprobe, self.ef_search), kind, len(vectors))
+
+    def _install(self, index, kind: str, n_vectors: int)->None:
+        self.index=index
+        self.built_kind=kind
+        self.trained_on=n_vectors
+        self.mapped=False
+        print(f"Built {kind} index over {n_vectors} vectors")
+
+    def _refill(self, load_file, loaded: dict=None)->None:
+        # makes the index hold exactly the current ids without training: a trained index is emptied and refilled,
+        # anything else is replaced by a flat index until the background build is done
+        if self.index is None or not supports_removal(self.built_kind):
+            self.rebuild(load_file, loaded, "flat")
+            return
+        vectors, ids=gather_vectors(self.files, self.vectors, load_file, loaded)
+        self._unmap()
+        self.index.reset()
+        if vectors is not None:
+            self.index.add_with_ids(vectors, ids)
+
+    def _rebuild_later(self, load_file)->None:
+        # starts building the index kind suited to the corpus on a background thread, when the index is not that kind
+        self.load_file=load_file
+        if self.builder is None and self.index is not None and self._needs_rebuild(len(self.chunks)):
+            self.builder=threading.Thread(target=self._build_in_background, daemon=True)
+            self.builder.start()
+
+    def _build_in_background(self)->None:
+        while True:
+            with self.lock:
+                if self.index is None or not self._needs_rebuild(len(self.chunks)):
+                    self.builder=None
+                    return
+                version=self.version
+                files=dict(self.files)
+                mapped_vectors=self.vectors
+                load_file=self.load_file
+            try:
+                vectors, ids=gather_vectors(files, mapped_vectors, load_file)
+                kind=self.resolve_kind(len(vectors))
+                index=build_over(kind, vectors, ids, self.nprobe, self.ef_search)
+            except (OSError, ValueError, RuntimeError) as e:
+                print(f"Could not rebuild the index: {e}")
+                with self.lock:
+                    self.builder=None
+                return
+            with self.lock:
+                # otherwise the selection changed during the build and the next round builds for the new one
+                if self.version==version:
+                    self._install(index, kind, len(vectors))
+
+    def wait_until_built(self, timeout: float=None)->None:
+        '''
+        input: optional seconds to wait at most
+        blocks until a background build of the index kind suited to the corpus, if one is running, has finished
+        '''
+        with self.lock:
+            builder=self.builder
+        if builder is not None:
+            builder.join(timeout)
+
+    def remove_file(self, path: str)->bool:
+        '''
+        input: filepath currently in the index
+        removes the file's chunk texts, and its vectors when the index supports removal
+        output: True if the index must be rebuilt to drop the vectors
+        '''
+        _, ids=self.files.pop(path)
+        self.chunks.remove(ids)
+        self.lexical.remove(ids)
+        if len(ids)==0 or self.index is None:
+            return False
+        if not supports_removal(self.built_kind):
+            return True
+        self.index.remove_ids(ids)
+        return False
+
+    def missing(self, filepaths: list[str])->list[str]:
+        '''
+        input: list of filepaths
+        output: the filepaths not indexed at their current content
+        '''
+        with self.lock:
+            return [path for path in filepaths if self.files.get(path, (None,))[0]!=embedding_cache.file_digest(path)]
+
+    def sync(self, filepaths: list[str], load_file)->None:
+        '''
+        input: list of selected filepaths, and a function mapping a filepath to (chunks, vectors, pages)
+        brings the index in line with the selection: deselected or modified files are removed, new files are added
+        output: None
+        '''
+        with self.lock:
+            wanted={path: embedding_cache.file_digest(path) for path in filepaths}
+
+            changed=set(wanted)!=set(self.files) or any(self.files[path][0]!=digest for path, digest in wanted.items())
+            if changed:
+                self._unmap()
+                self.version+=1
+            stale=False
+            for path, (digest, _) in list(self.files.items()):
+                if wanted.get(path)!=digest:
+                    stale=self.remove_file(path) or stale
+
+            loaded={}
+            for path, digest in wanted.items():
+                if path not in self.files:
+                    chunks, vectors, pages=load_file(path)
+                    self._register(path, digest, chunks, pages)
+                    if len(chunks):
+                        loaded[path]=np.ascontiguousarray(vectors, dtype='float32')
+
+            if not len(self.chunks):
+                raise ValueError('No text extracted')
+
+            if self.needs_compaction():
+                # otherwise switching files in and out grows the texts, postings and vectors without bound
+                self.compact(load_file, loaded)
+            elif stale or self.index is None:
+                self._refill(load_file, loaded)
+            else:
+                for path, vectors in loaded.items():
+                    self.index.add_with_ids(vectors, self.files[path][1])
+            # training an approximate index takes seconds to minutes, which questions do not wait for
+            self._rebuild_later(load_file)
+
+    def file_of(self, chunk_id: int)->str:
+        '''
+        input: chunk id
+        output: filepath the chunk came from, or None
+        '''
+        return self.chunks.source(chunk_id)
+
+    def same_file(self, a: int, b: int)->bool:
+        path=self.file_of(a)
+        return path is not None and path==self.file_of(b)
+
+    def search(self, query_vecs: np.ndarray, top_k: int=3)->tuple[np.ndarray, np.ndarray]:
+        '''
+        input: matrix of query vectors and number of neighbours
+        output: distances and ids of the nearest chunks, padded with -1 when fewer exist
+        '''
+        with self.lock:
+            if self.index is None:
+                raise ValueError("No documents are indexed, index files or open a knowledge base first")
+            k=min(top_k, self.index.ntotal)
+            return self.index.search(np.ascontiguousarray(query_vecs, dtype='float32'), k=k)
+
+    def search_lexical(self, query: str, top_k: int=3)->list[int]:
+        '''
+        input: query text and number of results
+        output: ids of the chunks with the best BM25 scores, best first
+        '''
+        with self.lock:
+            ids, _=self.lexical.search(query, top_k)
+        return ids.tolist()
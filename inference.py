@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+import model_loader
+import scheduler
+from scheduler import Cancelled
+
+# minimum seconds between partial text callbacks, keeps the GUI thread from repainting on every token
+STREAM_EMIT_INTERVAL=0.1
+
+# "ram" keeps evaluated prompt states in memory for this process, "disk" persists them across launches, "off" disables
+PROMPT_CACHE=os.environ.get("RAG_PROMPT_CACHE", "ram")
+# only the states of the constant prompt prefixes are cached, a handful of small states
+PROMPT_CACHE_BYTES=int(os.environ.get("RAG_PROMPT_CACHE_BYTES", str(256<<20)))
+PROMPT_CACHE_DIR=os.path.join(model_loader.BASE_DIR, "cache", "llama_states")
+
+_cache_lock=threading.Lock()
+_cache_installed=False
+_primed_prefixes=set()
+# cancel event of the request the current thread works on, see cancel_on
+_scope=threading.local()
+
+@contextmanager
+def cancel_on(event: threading.Event):
+    '''
+    input: event that, once set, cancels the generations this thread starts inside the block
+    a cancelled generation stops at the next token and raises Cancelled
+    '''
+    previous=getattr(_scope, "cancel", None)
+    _scope.cancel=event
+    try:
+        yield
+    finally:
+        _scope.cancel=previous
+
+def cancel_event()->threading.Event:
+    '''
+    output: the cancel event installed by cancel_on in this thread, or None
+    '''
+    return getattr(_scope, "cancel", None)
+
+def check_cancelled(event: threading.Event=None)->None:
+    '''
+    input: cancel event, by default the one of this thread
+    raises Cancelled if it is set
+    '''
+    event=event or cancel_event()
+    if event is not None and event.is_set():
+        raise Cancelled()
+
+def clean_reply(text: str)->str:
+    return text.replace("[/INST]", "")
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str)->int:
+    '''
+    input: text
+    output: number of tokens the llm's tokenizer produces for it
+    '''
+    return len(model_loader.get_llm().tokenize(text.encode("utf-8"), add_bos=False, special=True))
+
+def prefix_cache(cache_class):
+    '''
+    input: llama_cpp cache class
+    output: subclass only storing the states prime_prefix puts in it; llama-cpp-python also stores the state of the
+    whole context after every completion, which can take hundreds of MB each time
+    '''
+    class PrefixCache(cache_class):
+        accepting=False
+
+        def __setitem__(self, key, value):
+            if self.accepting:
+                super().__setitem__(key, value)
+    return PrefixCache
+
+def install_prompt_cache(llm)->None:
+    '''
+    input: Llama instance
+    attaches a llama.cpp state cache, so a prompt sharing a prefix with an earlier one restores its evaluated state
+    output: None
+    '''
+    global _cache_installed
+    with _cache_lock:
+        if _cache_installed or PROMPT_CACHE=="off":
+            return
+        import llama_cpp
+        if PROMPT_CACHE=="disk":
+            cache=prefix_cache(llama_cpp.LlamaDiskCache)(cache_dir=PROMPT_CACHE_DIR, capacity_bytes=PROMPT_CACHE_BYTES)
+        else:
+            cache=prefix_cache(llama_cpp.LlamaRAMCache)(capacity_bytes=PROMPT_CACHE_BYTES)
+        llm.set_cache(cache)
+        _cache_installed=True
+
+def prime_prefix(llm, prefix: str)->None:
+    '''
+    input: Llama instance and a constant prompt prefix
+    evaluates the prefix once per process and stores its state in the prompt cache
+    output: None
+    '''
+    if llm.cache is None:
+        return
+    with _cache_lock:
+        if prefix in _primed_prefixes:
+            return
+        # tokenised exactly as create_completion does, so the cached tokens are a prefix of later prompts
+        tokens=llm.tokenize(prefix.encode("utf-8"), add_bos=True, special=True)
+        start=time.perf_counter()
+        llm.reset()
+        llm.eval(tokens)
+        llm.cache.accepting=True
+        try:
+            llm.cache[tokens]=llm.save_state()
+        finally:
+            llm.cache.accepting=False
+        _primed_prefixes.add(prefix)
+        print(f"Primed {len(tokens)} token prompt prefix in {time.perf_counter()-start:.2f}s")
+
+def complete(prompt: str, max_tokens: int, temperature: float=0.7, on_text=None, emit_interval: float=STREAM_EMIT_INTERVAL, prefix: str=None)->tuple[str, dict]:
+    '''
+    input: prompt, max tokens and temperature, an optional callback receiving the reply generated so far,
+    and optionally the constant prefix the prompt starts with
+    streams the completion from the shared llm, calling on_text at most every emit_interval seconds and once at the end
+    output: cleaned reply and generation stats (time waited for the model, time to first token, total time,
+    prompt and completion tokens)
+    raises Cancelled when the cancel event of this thread is set before or during the generation
+    '''
+    llm=model_loader.get_llm()
+    install_prompt_cache(llm)
+    cancel=cancel_event()
+
+    # llama.cpp contexts are not thread safe, so the scheduler runs one generation at a time on the shared model,
+    # at the priority of the calling thread
+    with scheduler.slot(cancel) as queue_wait_s:
+        check_cancelled(cancel)
+        if prefix:
+            prime_prefix(llm, prefix)
+
+        start=time.perf_counter()
+        first_token_at=None
+        last_emit=0.0
+        n_tokens=0
+        pieces=[]
+
+        stream=llm.create_completion(prompt=prompt, temperature=temperature, max_tokens=max_tokens, stream=True)
+        for chunk in stream:
+            if cancel is not None and cancel.is_set():
+                # closing the generator stops decoding before the model is handed to the next request
+                stream.close()
+                print(f"Generation cancelled after {n_tokens} tokens")
+                raise Cancelled()
+            piece=chunk['choices'][0]['text']
+            now=time.perf_counter()
+            if first_token_at is None:
+                first_token_at=now
+            n_tokens+=1
+            pieces.append(piece)
+            if on_text and now-last_emit>=emit_interval:
+                on_text(clean_reply("".join(pieces)))
+                last_emit=now
+
+    reply=clean_reply("".join(pieces))
+    if on_text:
+        on_text(reply)
+
+    end=time.perf_counter()
+    stats={
+        "queue_wait_s": queue_wait_s,
+        "time_to_first_token_s": (first_token_at or end)-start,
+        "total_s": end-start,
+        "prompt_tokens": len(llm.tokenize(prompt.encode("utf-8"), add_bos=True, special=True)),
+        "completion_tokens": n_tokens,
+    }
+    if queue_wait_s>=0.01:
+        print(f"Waited {queue_wait_s:.2f}s for the model")
+    print(f"Time to first token: {stats['time_to_first_token_s']:.2f}s for a {stats['prompt_tokens']} token prompt, {n_tokens} tokens in {stats['total_s']:.2f}s")
+    return reply, stats
@@ -0,0 +1,146 @@
+import itertools
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import embedding_service
+import embedding_cache
+import chunking
+
+EMBED_BATCH_SIZE=64
+# processes extracting and chunking files in parallel; embedding stays in this process with the shared model
+INGEST_WORKERS=int(os.environ.get("RAG_INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+# pages a worker extracts per task, so the pages of one large file are extracted in parallel and embedded as they arrive
+PAGES_PER_TASK=8
+
+def is_supported(path: str)->bool:
+    return path.lower().endswith('.pdf') or path.lower().endswith('.json')
+
+def iter_pages(path: str, start: int=0, stop: int=None):
+    '''
+    input: filepath of a pdf or json file, and optionally the range of pages to read, counted from 0
+    output: generator of (page number, page text), one page in memory at a time; json files are a single page
+    '''
+    if path.lower().endswith('.pdf'):
+        import pymupdf
+        with pymupdf.open(path) as doc:
+            for number in range(start, len(doc) if stop is None else min(stop, len(doc))):
+                yield number+1, doc[number].get_text()
+    elif start==0 and stop!=0:
+        with open(path, 'r') as f:
+            yield 1, f.read()
+
+def embed_chunks(chunks_with_pages, batch_size: int=EMBED_BATCH_SIZE)->tuple[list[str], np.ndarray, list[int]]:
+    '''
+    input: iterable of (chunk, page number), and how many chunks are embedded per batch
+    output: chunks, their float32 embeddings and page numbers
+    '''
+    chunks=[]
+    pages=[]
+    vectors=[]
+    batch=[]
+
+    def flush():
+        vectors.append(embedding_service.encode(batch, batch_size=batch_size))
+        batch.clear()
+
+    for chunk, page_number in chunks_with_pages:
+        chunks.append(chunk)
+        pages.append(page_number)
+        batch.append(chunk)
+        if len(batch)>=batch_size:
+            flush()
+    if batch:
+        flush()
+    if not vectors:
+        return chunks, np.empty((0, 0), dtype='float32'), pages
+    return chunks, np.vstack(vectors), pages
+
+def embed_file(path: str)->tuple[list[str], np.ndarray, list[int]]:
+    '''
+    input: filepath of a pdf or json file
+    output: chunks of the file's text, their embeddings and the page each chunk starts on
+    '''
+    return embed_chunks(chunking.iter_chunks(iter_pages(path)))
+
+def page_count(path: str)->int:
+    '''
+    input: filepath of a pdf or json file
+    output: number of pages, 1 for json files
+    '''
+    if path.lower().endswith('.pdf'):
+        import pymupdf
+        with pymupdf.open(path) as doc:
+            return len(doc)
+    return 1
+
+def extract_pages(path: str, start: int, stop: int)->list[tuple[int, str]]:
+    '''
+    input: filepath of a pdf or json file, and the range of pages to read, counted from 0
+    output: list of (page number, page text) of those pages; runs in ingestion worker processes
+    '''
+    return list(iter_pages(path, start, stop))
+
+def iter_extracted(executor, tasks: list[tuple[str, int, int]], window: int):
+    '''
+    input: process pool, (filepath, first page, page after the last) tasks in file and page order, and how many
+    tasks may be submitted ahead of the one being consumed
+    output: generator of (filepath, pages of one task), in task order
+    '''
+    pending=deque()
+    for path, start, stop in tasks:
+        pending.append((path, executor.submit(extract_pages, path, start, stop)))
+        if len(pending)>window:
+            path, future=pending.popleft()
+            yield path, future.result()
+    while pending:
+        path, future=pending.popleft()
+        yield path, future.result()
+
+def ingest_files(paths: list[str], workers: int=None, on_progress=None)->dict:
+    '''
+    input: filepaths, number of extraction processes, and an optional callback receiving (files done, total files)
+    reads unchanged files from the embedding cache; the pages of the rest are extracted by a process pool a few
+    pages per task, and chunked and embedded in batches in file order as they arrive, then written to the cache
+    output: dict of filepath -> (chunks, vectors, pages)
+    '''
+    workers=INGEST_WORKERS if workers is None else workers
+    paths=list(dict.fromkeys(paths))
+    results={}
+    missing=[]
+    for path in paths:
+        cached=embedding_cache.load(path)
+        if cached is None:
+            missing.append(path)
+        else:
+            results[path]=cached
+
+    done=len(results)
+    if on_progress:
+        on_progress(done, len(paths))
+
+    def embed_and_store(path, pages):
+        nonlocal done
+        chunks, vectors, page_numbers=embed_chunks(chunking.iter_chunks(pages))
+        try:
+            embedding_cache.store(path, chunks, vectors, page_numbers)
+        except OSError as e:
+            print(f"Could not write embedding cache for {path}: {e}")
+        results[path]=(chunks, vectors, page_numbers)
+        done+=1
+        if on_progress:
+            on_progress(done, len(paths))
+
+    if workers<=1 or not missing:
+        for path in missing:
+            embed_and_store(path, iter_pages(path))
+    else:
+        # every file gets at least one task, so files without pages still get a result
+        tasks=[(path, start, start+PAGES_PER_TASK) for path in missing for start in range(0, max(1, page_count(path)), PAGES_PER_TASK)]
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            # the pages are chunked and embedded in order while the workers extract the following ones
+            extracted=iter_extracted(executor, tasks, 2*workers)
+            for path, group in itertools.groupby(extracted, key=lambda item: item[0]):
+                embed_and_store(path, (page for _, pages in group for page in pages))
+
+    return results
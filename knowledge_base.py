@@ -0,0 +1,190 @@
+import atexit
+import json
+import os
+import shutil
+import threading
+import time
+import faiss
+import numpy as np
+import embedding_cache
+import index_manager
+from chunk_store import ChunkStore
+from bm25 import BM25Index
+
+KB_DIR=os.path.join(embedding_cache.BASE_DIR, "knowledge_bases")
+FORMAT_VERSION=4
+# seconds the selection must stay unchanged before save_later writes the knowledge base
+AUTOSAVE_DELAY_S=float(os.environ.get("RAG_KB_AUTOSAVE_DELAY", "30"))
+
+# memory map the index data instead of reading it; IVF lists opened this way are read only
+MMAP_FLAGS=getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)|faiss.IO_FLAG_READ_ONLY
+
+def kb_path(name: str)->str:
+    if not name or os.path.basename(name)!=name or name.startswith("."):
+        raise ValueError(f"Invalid knowledge base name: {name!r}")
+    return os.path.join(KB_DIR, name)
+
+def current_generation(name: str):
+    '''
+    input: knowledge base name
+    output: directory of its latest complete save, or None
+    '''
+    try:
+        with open(os.path.join(kb_path(name), "CURRENT"), 'r', encoding='utf-8') as f:
+            path=os.path.join(kb_path(name), f.read().strip())
+    except OSError:
+        return None
+    return path if os.path.isdir(path) else None
+
+def list_knowledge_bases()->list[str]:
+    if not os.path.isdir(KB_DIR):
+        return []
+    return sorted(name for name in os.listdir(KB_DIR) if current_generation(name))
+
+# one save at a time, so a save at exit waits for a background one still writing
+_save_lock=threading.Lock()
+# knowledge base name -> timer of its pending autosave
+_pending={}
+_pending_lock=threading.Lock()
+
+def save(manager, name: str, load_file, compact: bool=False)->None:
+    '''
+    input: index manager to persist, knowledge base name, a function mapping a filepath to (chunks, vectors, pages),
+    and whether to first renumber the ids to drop the gaps left by removed files
+    writes the index, vectors, chunk texts and metadata to a new generation directory and then switches
+    CURRENT to it, so readers that have the previous generation memory mapped are never disturbed
+    output: None
+    '''
+    with _save_lock:
+        _save(manager, name, load_file, compact)
+
+def _save(manager, name: str, load_file, compact: bool)->None:
+    start=time.perf_counter()
+    with manager.lock:
+        if manager.index is None:
+            raise ValueError("Nothing to save, the index is empty")
+        if compact and not manager.is_contiguous():
+            # drops the gaps now instead of once sync finds them outnumbering the live ids
+            manager.compact(load_file)
+        # copied under the lock and written after releasing it, so questions do not wait for the disk
+        index_data=faiss.serialize_index(manager.index)
+        files=dict(manager.files)
+        chunks=manager.chunks.snapshot()
+        lexical=manager.lexical.snapshot()
+        mapped_vectors=manager.vectors
+        built_kind, trained_on=manager.built_kind, manager.trained_on
+
+    generation=f"gen-{time.time_ns()}"
+    directory=os.path.join(kb_path(name), generation)
+    os.makedirs(directory)
+
+    vectors=None
+    file_meta={}
+    for path, (digest, ids) in files.items():
+        file_meta[path]=[digest, int(ids[0]) if len(ids) else 0, len(ids)]
+        if len(ids)==0:
+            continue
+        file_vectors=index_manager.file_vectors(mapped_vectors, path, ids, load_file)
+        if vectors is None:
+            vectors=np.lib.format.open_memmap(os.path.join(directory, "vectors.npy"), mode='w+', dtype='float32', shape=(chunks.next_id, file_vectors.shape[1]))
+        vectors[ids[0]:ids[-1]+1]=file_vectors
+    vectors.flush()
+    del vectors
+
+    chunks.save(directory)
+    lexical.save(directory)
+
+    index_data.tofile(os.path.join(directory, "index.faiss"))
+    meta={
+        "format": FORMAT_VERSION,
+        "chunker": embedding_cache.CHUNKER_VERSION,
+        "embedder": embedding_cache.EMBEDDER_VERSION,
+        "built_kind": built_kind,
+        "trained_on": trained_on,
+        "files": file_meta,
+    }
+    with open(os.path.join(directory, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+    current=os.path.join(kb_path(name), "CURRENT")
+    with open(current+".tmp", 'w', encoding='utf-8') as f:
+        f.write(generation)
+    os.replace(current+".tmp", current)
+
+    for old in os.listdir(kb_path(name)):
+        if old.startswith("gen-") and old!=generation:
+            # fails on windows while another process still maps the old files; the next save retries
+            shutil.rmtree(os.path.join(kb_path(name), old), ignore_errors=True)
+    print(f"Saved knowledge base {name} with {len(chunks)} chunks in {time.perf_counter()-start:.2f}s")
+
+def save_later(manager, name: str, load_file, delay: float=AUTOSAVE_DELAY_S)->None:
+    '''
+    input: index manager, knowledge base name, a function mapping a filepath to (chunks, vectors, pages), and seconds to wait
+    saves the knowledge base on a background thread once it went delay seconds without another save_later for
+    the same name; saves still pending when the process exits are written then
+    output: None
+    '''
+    timer=threading.Timer(delay, _autosave, (manager, name, load_file))
+    timer.daemon=True
+    with _pending_lock:
+        previous=_pending.get(name)
+        if previous is not None:
+            previous.cancel()
+        _pending[name]=timer
+    timer.start()
+
+def _autosave(manager, name: str, load_file)->None:
+    with _pending_lock:
+        if _pending.get(name) is not threading.current_thread():
+            # superseded by a later save_later or already written by flush_pending
+            return
+        del _pending[name]
+    try:
+        save(manager, name, load_file)
+    except (OSError, ValueError) as e:
+        print(f"Could not save knowledge base {name}: {e}")
+
+def flush_pending()->None:
+    '''
+    writes the pending autosaves now instead of after their delay
+    '''
+    with _pending_lock:
+        pending=list(_pending.items())
+        _pending.clear()
+    for name, timer in pending:
+        timer.cancel()
+        try:
+            save(*timer.args)
+        except (OSError, ValueError) as e:
+            print(f"Could not save knowledge base {name}: {e}")
+
+atexit.register(flush_pending)
+
+def load(manager, name: str)->bool:
+    '''
+    input: index manager to fill, and knowledge base name
+    opens the knowledge base memory mapped and read only; the manager copies what it changes on the next sync
+    output: True if it was opened, False if it does not exist or was built with another chunker or embedder
+    '''
+    directory=current_generation(name)
+    if directory is None:
+        return False
+    start=time.perf_counter()
+    try:
+        with open(os.path.join(directory, "meta.json"), 'r', encoding='utf-8') as f:
+            meta=json.load(f)
+        if meta.get("format")!=FORMAT_VERSION or meta.get("chunker")!=embedding_cache.CHUNKER_VERSION or meta.get("embedder")!=embedding_cache.EMBEDDER_VERSION:
+            print(f"Ignoring knowledge base {name}, it was built with another chunker or embedder")
+            return False
+        index=faiss.read_index(os.path.join(directory, "index.faiss"), MMAP_FLAGS)
+        vectors=np.load(os.path.join(directory, "vectors.npy"), mmap_mode='r')
+        chunks=ChunkStore.open(directory)
+        lexical=BM25Index.open(directory)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Could not open knowledge base {name}: {e}")
+        return False
+
+    files={path: (digest, np.arange(first, first+count, dtype='int64')) for path, (digest, first, count) in meta["files"].items()}
+    manager.open_mapped(index, meta["built_kind"], meta["trained_on"], files, chunks, lexical, vectors)
+    print(f"Opened knowledge base {name} with {len(chunks)} chunks in {time.perf_counter()-start:.2f}s")
+    return True
@@ -0,0 +1,137 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import model_loader
+import inference
+import scheduler
+import completion_cache
+
+# context window of the pooled contexts; map prompts are one chunk plus instructions, so they need far less than the chat model
+POOL_N_CTX=2048
+
+def default_parallelism()->int:
+    '''
+    output: number of concurrent map generations, from RAG_MAP_PARALLELISM or the cpu count
+    '''
+    configured=os.environ.get("RAG_MAP_PARALLELISM")
+    if configured:
+        return max(1, int(configured))
+    import llama_cpp
+    if llama_cpp.llama_supports_gpu_offload():
+        # a fully offloaded model already saturates the gpu, and every extra context would copy the weights into vram
+        return 1
+    return max(1, min(4, (os.cpu_count() or 1)//4))
+
+class ContextPool:
+    '''
+    Fixed set of extra llama contexts over the same GGUF file, for running independent prompts concurrently.
+    The weights are memory mapped, so the contexts share them and each only adds its own KV cache.
+    '''
+    def __init__(self, size: int, n_ctx: int=POOL_N_CTX):
+        self.size=size
+        self.n_ctx=n_ctx
+        self.n_threads=max(1, (os.cpu_count() or 1)//size)
+        self.idle=queue.Queue()
+        self.created=0
+        self.lock=threading.Lock()
+
+    def acquire(self):
+        '''
+        output: an idle context, creating one if the pool is not full yet
+        '''
+        with self.lock:
+            if self.idle.empty() and self.created<self.size:
+                self.created+=1
+                return model_loader.load_llm(n_ctx=self.n_ctx, n_threads=self.n_threads)
+        return self.idle.get()
+
+    def release(self, llm)->None:
+        self.idle.put(llm)
+
+_pools={}
+_pools_lock=threading.Lock()
+
+def get_pool(size: int)->ContextPool:
+    '''
+    input: number of contexts
+    output: the process wide pool of that size, created on first use
+    '''
+    with _pools_lock:
+        if size not in _pools:
+            _pools[size]=ContextPool(size)
+        return _pools[size]
+
+def _complete_on(llm, prompt: str, max_tokens: int, temperature: float)->str:
+    response=llm.create_completion(prompt=prompt, temperature=temperature, max_tokens=max_tokens)
+    return inference.clean_reply(response['choices'][0]['text'])
+
+def context_window(parallelism: int)->int:
+    '''
+    input: number of concurrent generations
+    output: context size available to each prompt run by map_completions
+    '''
+    if parallelism<=1:
+        return model_loader.get_llm().n_ctx()
+    return POOL_N_CTX
+
+def map_completions(prompts: list[str], max_tokens: int, temperature: float=0.7, prefix: str=None, parallelism: int=None, on_done=None, cache_job: str=None)->list[str]:
+    '''
+    input: independent prompts, generation settings, the constant prefix they share, the number of concurrent
+    generations, an optional callback receiving (position, reply) as each prompt finishes, and optionally the id
+    of the job whose completion cache replies are read from and written to
+    output: replies in the same order as the prompts
+    raises inference.Cancelled when the cancel event of the calling thread is set, without starting further prompts
+    '''
+    cancel=inference.cancel_event()
+    level=scheduler.current_priority()
+    parallelism=default_parallelism() if parallelism is None else parallelism
+    replies=[None]*len(prompts)
+    start=time.perf_counter()
+
+    pending=[]
+    for position, prompt in enumerate(prompts):
+        cached=completion_cache.load(cache_job, prompt, max_tokens, temperature) if cache_job else None
+        if cached is None:
+            pending.append(position)
+        else:
+            replies[position]=cached
+            if on_done:
+                on_done(position, cached)
+
+    def finish(position, reply):
+        replies[position]=reply
+        if cache_job:
+            completion_cache.store(cache_job, prompts[position], max_tokens, temperature, reply)
+        if on_done:
+            on_done(position, reply)
+
+    if parallelism<=1 or len(pending)<=1:
+        # sequential on the shared model, which also reuses its cached prefix state
+        for position in pending:
+            reply, _=inference.complete(prompts[position], max_tokens, temperature=temperature, prefix=prefix)
+            finish(position, reply)
+    else:
+        model_loader.wait_until_ready()
+        pool=get_pool(parallelism)
+
+        def run(position):
+            # pool threads do not see the caller's cancel event and priority, so they are passed on here
+            inference.check_cancelled(cancel)
+            # the scheduler holds the generation back while more urgent ones wait or run, and counts it
+            with scheduler.priority(level), scheduler.slot(cancel, pooled=True):
+                llm=pool.acquire()
+                try:
+                    # consecutive prompts on a context share the prefix, which llama.cpp reuses from its last evaluation
+                    reply=_complete_on(llm, prompts[position], max_tokens, temperature)
+                finally:
+                    pool.release(llm)
+            finish(position, reply)
+
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            for future in [executor.submit(run, position) for position in pending]:
+                future.result()
+
+    print(f"Generated {len(pending)} of {len(prompts)} completions ({len(prompts)-len(pending)} cached) with parallelism {parallelism} in {time.perf_counter()-start:.2f}s")
+    return replies
@@ -1,7 +1,10 @@
-import llama_cpp
 import os
 import sys
+import threading
+from concurrent.futures import Future
 from setup import download_metrics_folder, download_model
+import embedding_service
+import reranker
 
 
 if getattr(sys, 'frozen', False):
@@ -10,19 +13,88 @@ else:
     # Running as a .py file
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-download_metrics_folder()
-download_model()
-
 model_path = os.path.join(BASE_DIR, "models", "Dolphin3.0-Llama3.2-3B-Q5_K_M.gguf")
 
-if not os.path.exists(model_path):
-    raise ValueError(f"Model file not found at: {model_path}. Please ensure it's in the 'models' directory.")
-
-try:
-    llm_model = llama_cpp.Llama(model_path=model_path, chat_format="llama-2", n_ctx=8192, n_gpu_layers=-1)
-    print(f"Llama model loaded successfully from {model_path}")
-except Exception as e:
-    print(f"Error loading Llama model from {model_path}: {e}")
-    print("Please ensure the model file is valid and compatible with your llama-cpp-python installation.")
-    print("Consider re-downloading the model or updating llama-cpp-python.")
-    sys.exit(1) # Exit if the core model cannot be loaded
+# resolved with the Llama instance once warm_up() has finished, or with the error that stopped it
+_ready=Future()
+_started=False
+_lock=threading.Lock()
+
+def load_llm(n_ctx: int=8192, n_threads: int=None):
+    '''
+    input: context window size and optionally the number of cpu threads used for decoding
+    output: a llama_cpp.Llama model loaded from model_path
+    '''
+    import llama_cpp
+
+    if not os.path.exists(model_path):
+        raise ValueError(f"Model file not found at: {model_path}. Please ensure it's in the 'models' directory.")
+
+    try:
+        llm = llama_cpp.Llama(model_path=model_path, chat_format="llama-2", n_ctx=n_ctx, n_threads=n_threads, n_gpu_layers=-1)
+        print(f"Llama model loaded successfully from {model_path}")
+    except Exception as e:
+        print(f"Error loading Llama model from {model_path}: {e}")
+        print("Please ensure the model file is valid and compatible with your llama-cpp-python installation.")
+        print("Consider re-downloading the model or updating llama-cpp-python.")
+        raise
+    return llm
+
+def warm_up(progress=None)->None:
+    '''
+    input: optional callback taking (percent, message)
+    downloads missing files, then loads the LLM and the embedding model, resolving the readiness future
+    output: None
+    '''
+    global _started
+    with _lock:
+        already_started=_started
+        _started=True
+    if already_started:
+        _ready.result()
+        return
+
+    def report(percent, message):
+        print(message)
+        if progress:
+            progress(percent, message)
+
+    try:
+        report(0, "Checking metrics files...")
+        download_metrics_folder()
+        report(10, "Checking model file...")
+        download_model()
+        report(30, "Loading language model...")
+        llm=load_llm()
+        report(70, "Loading embedding model...")
+        embedding_service.get_embedder()
+        if reranker.ENABLED:
+            report(90, "Loading re-ranking model...")
+            reranker.get_reranker()
+        report(100, "Models ready")
+    except BaseException as e:
+        _ready.set_exception(e)
+        raise
+    _ready.set_result(llm)
+
+def is_ready()->bool:
+    return _ready.done() and _ready.exception() is None
+
+def wait_until_ready(timeout: float=None):
+    '''
+    input: optional timeout in seconds
+    blocks until the models are loaded, loading them in the calling thread if nobody started the warm-up
+    output: the Llama instance
+    '''
+    if not _started:
+        try:
+            warm_up()
+        except Exception:
+            pass
+    return _ready.result(timeout)
+
+def get_llm():
+    '''
+    output: the shared Llama instance, waiting for the warm-up if it is still running
+    '''
+    return wait_until_ready()
@@ -0,0 +1,86 @@
+from PySide6.QtCore import QRunnable, Slot, Signal, QObject
+import traceback
+import rag_backend
+import evaluation_backend
+import summariser_backend
+
+class WorkerSignals(QObject):
+    finished=Signal()
+    error=Signal(str)
+    result=Signal(object)
+    partial=Signal(str)
+    metrics=Signal(object)
+    progress=Signal(int, int)
+
+class RAGWorker(QRunnable):
+    def __init__(self, filepaths, question=None, history=None, max_tokens: int=512):
+        super().__init__()
+        self.filepaths=filepaths
+        self.question=question
+        self.history=history or []
+        self.max_tokens=max_tokens
+        self.signals=WorkerSignals()
+
+    @Slot()
+    def run(self):
+        try:
+            if self.question:
+                result=rag_backend.answer(self.filepaths, self.question, self.history, self.max_tokens,
+                    self.signals.partial.emit, self.signals.metrics.emit, self.signals.progress.emit)
+                self.signals.result.emit(result)
+            else:
+                rag_backend.process_files(self.filepaths, self.signals.progress.emit)
+
+        except Exception as e:
+            tb=traceback.format_exc()
+            self.signals.error.emit(tb)
+        finally:
+            self.signals.finished.emit()
+
+class EvaluationWorker(QRunnable):
+    def __init__(self, filepaths, json_filepath, question=None, history=None, max_tokens: int=512):
+        super().__init__()
+        self.filepaths=filepaths
+        self.json_filepath=json_filepath
+        self.question=question
+        self.history=history or []
+        self.max_tokens=max_tokens
+        self.signals=WorkerSignals()
+
+    @Slot()
+    def run(self):
+        try:
+            if self.question:
+                result=evaluation_backend.answer(self.filepaths, self.json_filepath, self.question, self.history, self.max_tokens,
+                    self.signals.partial.emit, self.signals.metrics.emit, self.signals.progress.emit)
+                self.signals.result.emit(result)
+            else:
+                evaluation_backend.process_files(self.filepaths, self.signals.progress.emit)
+
+        except Exception as e:
+            tb=traceback.format_exc()
+            self.signals.error.emit(tb)
+        finally:
+            self.signals.finished.emit()
+
+class SummarizationWorker(QRunnable):
+    def __init__(self, filepaths: list[str], num_clusters: int=10, max_tokens: int=512, map_parallelism: int=None):
+        super().__init__()
+        self.filepaths=filepaths
+        self.num_clusters=num_clusters
+        self.max_tokens=max_tokens
+        self.map_parallelism=map_parallelism
+        self.signals=WorkerSignals()
+
+    @Slot()
+    def run(self):
+        try:
+            collated_summary=summariser_backend.summarize(self.filepaths, self.num_clusters, self.max_tokens,
+                self.signals.partial.emit, self.signals.metrics.emit, self.signals.progress.emit, self.map_parallelism)
+            self.signals.result.emit(collated_summary)
+
+        except Exception as e:
+            tb=traceback.format_exc()
+            self.signals.error.emit(tb)
+        finally:
+            self.signals.finished.emit()
@@ -7,7 +7,7 @@ from PySide6.QtWidgets import(
 from PySide6.QtCore import Qt, QThreadPool
 from PySide6.QtGui import QTextOption
 
-from rag_backend import RAGWorker
+from qt_workers import RAGWorker
 
 class ChatBubble(QTextBrowser):
     def __init__(self, message, sender="user"):
@@ -49,6 +49,14 @@ class ChatBubble(QTextBrowser):
 
         self.setText(message)
 
+    def update_text(self, message):
+        # keep the reader's scroll position pinned to the end while the answer streams in
+        scroll_bar=self.verticalScrollBar()
+        at_bottom=scroll_bar.value()==scroll_bar.maximum()
+        self.setText(message)
+        if at_bottom:
+            scroll_bar.setValue(scroll_bar.maximum())
+
 class RAGChatWidget(QWidget):
     def __init__(self, max_tokens: int=512):
         super().__init__()
@@ -58,6 +66,7 @@ class RAGChatWidget(QWidget):
         self.conversation_history=[]
         self.max_tokens=max_tokens
         self.threadpool=QThreadPool()
+        self.streaming_bubble=None
         self.selected_files=[]
 
         self.setup_ui()
@@ -136,6 +145,7 @@ class RAGChatWidget(QWidget):
         self.chat_layout.addLayout(h_layout)
         self.chat_layout.addSpacing(5)
         self.chat_scroll.verticalScrollBar().setValue(self.chat_scroll.verticalScrollBar().maximum())
+        return bubble
 
     def display_error(self, error):
         self.add_message(f"Error:\n{error}", "assistant")
@@ -160,20 +170,38 @@ class RAGChatWidget(QWidget):
         self.add_message(question, "user")
         worker=RAGWorker(self.selected_files, question, self.conversation_history, self.max_tokens)
 
+        self.streaming_bubble=None
+        worker.signals.partial.connect(self.stream_answer)
+        worker.signals.progress.connect(self.show_progress)
         worker.signals.result.connect(self.update_chat)
         worker.signals.error.connect(self.display_error)
         worker.signals.finished.connect(self.reenable_buttons)
 
         self.threadpool.start(worker)
 
+    def show_progress(self, done, total):
+        self.run_button.setText(f"Indexing {done}/{total}")
+
+    def stream_answer(self, partial_answer):
+        if self.streaming_bubble is None:
+            self.streaming_bubble=self.add_message(partial_answer, "assistant")
+        else:
+            self.streaming_bubble.update_text(partial_answer)
+            self.chat_scroll.verticalScrollBar().setValue(self.chat_scroll.verticalScrollBar().maximum())
+
     def update_chat(self, result_tuple):
         answer, history=result_tuple
         self.conversation_history=history
-        self.add_message(answer, "assistant")
+        if self.streaming_bubble is None:
+            self.add_message(answer, "assistant")
+        else:
+            self.streaming_bubble.update_text(answer)
+            self.streaming_bubble=None
 
     def reenable_buttons(self):
         self.ask_button.setEnabled(True)
         self.run_button.setEnabled(True)
+        self.run_button.setText("Run RAG")
         self.file_button.setEnabled(True)
         self.done_processing()
 
@@ -0,0 +1,152 @@
+'''
+Qt-free entry point to the toolkit, usable as a library or from the command line.
+
+usage:
+    python ragtoolkit.py index FILE [FILE ...] [--kb NAME [--compact]]
+    python ragtoolkit.py ask "QUESTION" (--files FILE [FILE ...] | --kb NAME) [--metrics METRICS.json] [--max-tokens 512] [--stream]
+    python ragtoolkit.py summarize FILE [FILE ...] [--clusters 10] [--max-tokens 512] [--stream]
+
+The answer or summary is written to stdout; progress and timing messages go to stderr.
+'''
+import argparse
+import contextlib
+import multiprocessing
+import sys
+import time
+import knowledge_base
+import rag_backend
+import evaluation_backend
+import summariser_backend
+
+def ingest(filepaths: list[str], on_progress=None, knowledge_base_name: str=None, compact: bool=False)->int:
+    '''
+    input: filepaths, an optional callback receiving (files done, total files), optionally a knowledge base name,
+    and whether to drop the gaps left by removed files before saving
+    indexes the files for ask() and saves the index under the name when one is given
+    output: number of indexed chunks
+    '''
+    _, load_file=rag_backend.index_files(filepaths, on_progress)
+    if knowledge_base_name:
+        # save the index kind suited to the corpus rather than the flat one used while it is built
+        rag_backend.index_manager.wait_until_built()
+        knowledge_base.save(rag_backend.index_manager, knowledge_base_name, load_file, compact)
+    return len(rag_backend.index_manager.chunks)
+
+def open_knowledge_base(name: str)->None:
+    '''
+    input: name of a saved knowledge base
+    makes it the index ask() and search() use, with and without metrics
+    '''
+    # both backends map the same files, so the second one costs next to nothing
+    for manager in (rag_backend.index_manager, evaluation_backend.index_manager):
+        if not knowledge_base.load(manager, name):
+            raise ValueError(f"Knowledge base not found or built with another chunker or embedder: {name}")
+
+def search(query: str, top_k: int=3)->list[str]:
+    '''
+    input: query and number of results
+    output: best matching chunks of the indexed files
+    '''
+    return rag_backend.search_chunks(query, top_k)
+
+def ask(question: str, filepaths: list[str]=None, history: list[tuple[str, str]]=None, metrics_path: str=None, max_tokens: int=512, on_text=None, on_stats=None)->tuple[str, list[tuple[str, str]]]:
+    '''
+    input: question, filepaths to answer from (None keeps the current index), history of previous questions and
+    answers, optionally a metrics json for evaluation feedback, max tokens of the answer, and optional callbacks
+    receiving the partial answer and the generation stats
+    output: answer, and the history with this turn appended
+    '''
+    if filepaths is None:
+        # answer from the index as it is, e.g. an opened knowledge base
+        history=list(history or [])
+        if metrics_path:
+            if evaluation_backend.index_manager.index is None:
+                raise ValueError("Nothing indexed for evaluation, give filepaths or open a knowledge base first")
+            reply=evaluation_backend.ask_model(question, history, metrics_path, max_tokens, on_text, on_stats)
+        else:
+            reply=rag_backend.ask_model(question, history, max_tokens, on_text, on_stats)
+        return reply, history+[(question, reply)]
+    if metrics_path:
+        return evaluation_backend.answer(filepaths, metrics_path, question, history, max_tokens, on_text, on_stats, autosave=False)
+    return rag_backend.answer(filepaths, question, history, max_tokens, on_text, on_stats, autosave=False)
+
+def summarize(filepaths: list[str], num_clusters: int=10, max_tokens: int=512, on_text=None, on_stats=None)->str:
+    '''
+    input: filepaths, number of representative chunks, max tokens of the summary, and optional callbacks receiving
+    the partial summary and the generation stats
+    output: summary of the documents
+    '''
+    return summariser_backend.summarize(filepaths, num_clusters, max_tokens, on_text, on_stats)
+
+class StreamPrinter:
+    '''
+    Writes the growing text passed to on_text to a stream, printing only what was added since the last call.
+    '''
+    def __init__(self, stream):
+        self.stream=stream
+        self.printed=""
+
+    def __call__(self, text: str)->None:
+        if text.startswith(self.printed):
+            self.stream.write(text[len(self.printed):])
+            self.stream.flush()
+            self.printed=text
+
+    def finish(self, text: str)->None:
+        self(text)
+        if not text.startswith(self.printed):
+            # cleaning the finished reply changed text that was already printed
+            self.stream.write("\n"+text)
+        self.stream.write("\n")
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands=parser.add_subparsers(dest="command", required=True)
+
+    index_parser=commands.add_parser("index", help="index documents")
+    index_parser.add_argument("files", nargs="+")
+    index_parser.add_argument("--kb", help="save the index as this knowledge base")
+    index_parser.add_argument("--compact", action="store_true", help="renumber chunk ids before saving")
+
+    ask_parser=commands.add_parser("ask", help="answer a question from documents")
+    ask_parser.add_argument("question")
+    sources=ask_parser.add_mutually_exclusive_group(required=True)
+    sources.add_argument("--files", nargs="+")
+    sources.add_argument("--kb", help="answer from this saved knowledge base")
+    ask_parser.add_argument("--metrics", help="metrics json for evaluation feedback")
+    ask_parser.add_argument("--max-tokens", type=int, default=512)
+    ask_parser.add_argument("--stream", action="store_true")
+
+    summarize_parser=commands.add_parser("summarize", help="summarise documents")
+    summarize_parser.add_argument("files", nargs="+")
+    summarize_parser.add_argument("--clusters", type=int, default=10)
+    summarize_parser.add_argument("--max-tokens", type=int, default=512)
+    summarize_parser.add_argument("--stream", action="store_true")
+
+    args=parser.parse_args()
+
+    stdout=sys.stdout
+    printer=StreamPrinter(stdout) if getattr(args, "stream", False) else None
+    start=time.perf_counter()
+    # the pipeline reports progress with print, which must not mix with the result
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.command=="index":
+            count=ingest(args.files, lambda done, total: print(f"Indexed {done}/{total} files"), args.kb, args.compact)
+            result=f"{count} chunks indexed"
+        elif args.command=="ask":
+            if args.kb:
+                open_knowledge_base(args.kb)
+            result, _=ask(args.question, args.files, metrics_path=args.metrics, max_tokens=args.max_tokens, on_text=printer)
+        else:
+            result=summarize(args.files, args.clusters, args.max_tokens, on_text=printer)
+        print(f"Done in {time.perf_counter()-start:.2f}s")
+
+    if printer:
+        printer.finish(result)
+    else:
+        stdout.write(result+"\n")
+
+if __name__=="__main__":
+    # ingestion extracts files in worker processes
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+import numpy as np
+
+RERANK_MODEL='cross-encoder/ms-marco-MiniLM-L-6-v2'
+# second retrieval stage, off unless RAG_RERANK=1
+ENABLED=os.environ.get("RAG_RERANK", "0")=="1"
+# first stage results re-scored by the cross-encoder
+RERANK_POOL=int(os.environ.get("RAG_RERANK_POOL", "50"))
+# time allowed for re-scoring one query; the pool is cut to what the measured speed fits in it
+RERANK_BUDGET_S=float(os.environ.get("RAG_RERANK_BUDGET_MS", "300"))/1000
+RERANK_BATCH_SIZE=16
+
+_reranker=None
+_lock=threading.Lock()
+# moving average of the cross-encoder's cost per (query, chunk) pair, None until it was measured
+_seconds_per_pair=None
+
+def get_reranker():
+    '''
+    output: the process wide CrossEncoder, created on first use
+    '''
+    global _reranker
+    if _reranker is None:
+        with _lock:
+            if _reranker is None:
+                from sentence_transformers import CrossEncoder
+                _reranker=CrossEncoder(RERANK_MODEL, device="cpu")
+                print(f"Re-ranking model {RERANK_MODEL} loaded")
+    return _reranker
+
+def affordable_pairs(n_candidates: int, budget_s: float)->int:
+    '''
+    input: number of candidates and the latency budget in seconds
+    output: how many of them can be re-scored within the budget at the measured speed
+    '''
+    if _seconds_per_pair is None:
+        return n_candidates
+    return min(n_candidates, int(budget_s/_seconds_per_pair))
+
+def rerank(query: str, ids: list[int], text_of, top_k: int, budget_s: float=RERANK_BUDGET_S)->list[int]:
+    '''
+    input: query, first stage ids best first, function mapping an id to its chunk text, number of results,
+    and the latency budget in seconds
+    re-scores the best candidates with the cross-encoder in batches, cutting the pool to what fits in the budget
+    and stopping early if a batch overruns it; candidates that were not scored keep their first stage order after
+    the scored ones
+    output: ids of the best top_k chunks, best first
+    '''
+    global _seconds_per_pair
+    limit=affordable_pairs(len(ids), budget_s)
+    if limit<2:
+        print(f"Skipping re-ranking, {len(ids)} candidates do not fit in {budget_s*1000:.0f}ms")
+        return ids[:top_k]
+
+    model=get_reranker()
+    start=time.perf_counter()
+    scores=[]
+    for batch_start in range(0, limit, RERANK_BATCH_SIZE):
+        batch=ids[batch_start:min(limit, batch_start+RERANK_BATCH_SIZE)]
+        batch_time=time.perf_counter()
+        scores.extend(model.predict([(query, text_of(i)) for i in batch], batch_size=RERANK_BATCH_SIZE))
+        per_pair=(time.perf_counter()-batch_time)/len(batch)
+        _seconds_per_pair=per_pair if _seconds_per_pair is None else 0.8*_seconds_per_pair+0.2*per_pair
+        if time.perf_counter()-start>budget_s:
+            break
+
+    order=np.argsort(-np.asarray(scores, dtype='float32'), kind='stable')
+    reranked=[ids[position] for position in order.tolist()]+ids[len(scores):]
+    if len(scores)<len(ids):
+        print(f"Re-ranked {len(scores)} of {len(ids)} candidates within {budget_s*1000:.0f}ms")
+    return reranked[:top_k]
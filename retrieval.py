@@ -0,0 +1,76 @@
+import os
+import time
+import embedding_service
+import reranker
+
+RETRIEVAL_MODES=("hybrid", "vector")
+# "hybrid" fuses BM25 and vector results, "vector" is the embedding search alone
+RETRIEVAL_MODE=os.environ.get("RAG_RETRIEVAL", "hybrid")
+# results taken from each retriever before fusing them
+FUSION_CANDIDATES=50
+# reciprocal rank fusion constant; larger values flatten the difference between ranks
+RRF_K=60
+
+def reciprocal_rank_fusion(rankings: list[list[int]], k: int=RRF_K)->list[int]:
+    '''
+    input: ranked id lists from several retrievers, and the fusion constant
+    output: ids ranked by the sum of 1/(k+rank) over the lists, ties keeping the order of the first list
+    '''
+    scores={}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking):
+            scores[i]=scores.get(i, 0.0)+1.0/(k+rank+1)
+    return sorted(scores, key=lambda i: -scores[i])
+
+def search_batch(index_manager, queries: list[str], top_k: int, mode: str=None, rerank: bool=None, timings: dict=None)->list[list[int]]:
+    '''
+    input: index manager, queries, number of results per query, retrieval mode (RETRIEVAL_MODE when None), whether
+    results are re-ranked by the cross-encoder (reranker.ENABLED when None), and optionally a dict that receives
+    the latency of every stage in seconds, summed over the queries
+    embeds all queries in one forward pass, reusing cached query embeddings, and searches the index once
+    output: ids of the best chunks for every query, best first
+    '''
+    mode=mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}. Expected one of {RETRIEVAL_MODES}")
+    rerank=reranker.ENABLED if rerank is None else rerank
+    timings={} if timings is None else timings
+    if not queries:
+        return []
+    # size of the first stage's result list
+    pool=max(top_k, reranker.RERANK_POOL) if rerank else top_k
+    candidates=max(pool, FUSION_CANDIDATES) if mode=="hybrid" else pool
+
+    start=time.perf_counter()
+    query_vecs=embedding_service.encode_queries(queries)
+    timings["embed_s"]=time.perf_counter()-start
+
+    start=time.perf_counter()
+    _, I=index_manager.search(query_vecs, candidates)
+    results=[[int(i) for i in row if i!=-1] for row in I]
+    timings["vector_s"]=time.perf_counter()-start
+
+    if mode=="hybrid":
+        start=time.perf_counter()
+        lexical=[index_manager.search_lexical(query, candidates) for query in queries]
+        timings["bm25_s"]=time.perf_counter()-start
+
+        start=time.perf_counter()
+        results=[reciprocal_rank_fusion([ids, lexical_ids]) for ids, lexical_ids in zip(results, lexical)]
+        timings["fusion_s"]=time.perf_counter()-start
+
+    if rerank:
+        start=time.perf_counter()
+        results=[reranker.rerank(query, ids[:pool], lambda i: index_manager.chunks[i], top_k) for query, ids in zip(queries, results)]
+        timings["rerank_s"]=time.perf_counter()-start
+
+    print(f"Retrieval of {len(queries)} {'query' if len(queries)==1 else 'queries'}: "+", ".join(f"{stage[:-2]} {seconds*1000:.1f}ms" for stage, seconds in timings.items()))
+    return [ids[:top_k] for ids in results]
+
+def search(index_manager, query: str, top_k: int, mode: str=None, rerank: bool=None, timings: dict=None)->list[int]:
+    '''
+    input: index manager, query, number of results, retrieval mode, whether results are re-ranked, and optionally
+    a dict that receives the latency of every stage in seconds, as for search_batch
+    output: ids of the best chunks, best first
+    '''
+    return search_batch(index_manager, [query], top_k, mode, rerank, timings)[0]
@@ -0,0 +1,149 @@
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+# priorities of generations on the shared model, lower runs first
+INTERACTIVE=0
+BACKGROUND=1
+PRIORITY_NAMES={INTERACTIVE: "interactive", BACKGROUND: "background"}
+# seconds between checks of a waiting request's cancel event
+CANCEL_POLL_S=0.1
+# weight of the newest wait in the average wait time
+WAIT_SMOOTHING=0.2
+
+# priority of the work the current thread does, see priority
+_scope=threading.local()
+
+class Cancelled(Exception):
+    '''
+    Raised by a generation whose request was cancelled.
+    '''
+
+class Scheduler:
+    '''
+    Grants the shared llama context to one generation at a time: the highest priority waiting request first,
+    in arrival order within a priority. A long job made of many generations, like a summary, gives way to
+    interactive requests between its generations.
+    Pooled generations run on contexts of their own, so any number of them run together, but none starts while
+    a more urgent generation is waiting or runs on the shared context.
+    '''
+    def __init__(self):
+        self.condition=threading.Condition()
+        # heap of (priority, arrival number, time queued, pooled)
+        self.waiting=[]
+        self.arrivals=itertools.count()
+        # priority of the generation on the shared context
+        self.running=None
+        self.running_since=None
+        # priority -> number of pooled generations running
+        self.pooled={level: 0 for level in PRIORITY_NAMES}
+        self.average_wait={level: 0.0 for level in PRIORITY_NAMES}
+        self.served={level: 0 for level in PRIORITY_NAMES}
+
+    def _admissible(self, ticket: tuple)->bool:
+        level, _, _, pooled=ticket
+        if self.waiting[0][0]<level:
+            return False
+        if pooled:
+            return self.running is None or self.running>=level
+        return self.running is None and min(waiting for waiting in self.waiting if not waiting[3])==ticket
+
+    @contextmanager
+    def slot(self, level: int=INTERACTIVE, cancel: threading.Event=None, pooled: bool=False):
+        '''
+        input: priority of the generation, optionally an event that cancels it while waiting, and whether it runs
+        on a pooled context instead of the shared one
+        blocks until it is this generation's turn, and holds the shared context, or a pooled generation's place,
+        for the duration of the block
+        output: seconds waited, as the value of the with statement
+        raises Cancelled when the cancel event is set before the turn comes
+        '''
+        ticket=(level, next(self.arrivals), time.perf_counter(), pooled)
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while not self._admissible(ticket):
+                    if cancel is not None and cancel.is_set():
+                        raise Cancelled()
+                    self.condition.wait(CANCEL_POLL_S if cancel is not None else None)
+            except BaseException:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                # the next in line may have been waiting behind this ticket
+                self.condition.notify_all()
+                raise
+            self.waiting.remove(ticket)
+            heapq.heapify(self.waiting)
+            started=time.perf_counter()
+            if pooled:
+                self.pooled[level]+=1
+            else:
+                self.running=level
+                self.running_since=started
+            waited=started-ticket[2]
+            self.average_wait[level]+=WAIT_SMOOTHING*(waited-self.average_wait[level]) if self.served[level] else waited
+            self.served[level]+=1
+        try:
+            yield waited
+        finally:
+            with self.condition:
+                if pooled:
+                    self.pooled[level]-=1
+                else:
+                    self.running=None
+                    self.running_since=None
+                self.condition.notify_all()
+
+    def status(self)->dict:
+        '''
+        output: queue depth per priority, the generation on the shared context and how long it and the oldest waiting
+        one took so far, the pooled generations running per priority, and the average wait per priority
+        '''
+        now=time.perf_counter()
+        with self.condition:
+            queued={name: 0 for name in PRIORITY_NAMES.values()}
+            for level, _, _, _ in self.waiting:
+                queued[PRIORITY_NAMES[level]]+=1
+            return {
+                "queued": len(self.waiting),
+                "queued_by_priority": queued,
+                "oldest_wait_s": now-min(ticket[2] for ticket in self.waiting) if self.waiting else 0.0,
+                "running": PRIORITY_NAMES[self.running] if self.running is not None else None,
+                "running_s": now-self.running_since if self.running_since is not None else 0.0,
+                "running_pooled": {PRIORITY_NAMES[level]: count for level, count in self.pooled.items()},
+                "average_wait_s": {PRIORITY_NAMES[level]: wait for level, wait in self.average_wait.items()},
+                "served": {PRIORITY_NAMES[level]: count for level, count in self.served.items()},
+            }
+
+_scheduler=Scheduler()
+
+@contextmanager
+def priority(level: int):
+    '''
+    input: priority of the generations this thread starts inside the block
+    '''
+    previous=current_priority()
+    _scope.level=level
+    try:
+        yield
+    finally:
+        _scope.level=previous
+
+def current_priority()->int:
+    '''
+    output: priority set by priority() in this thread, INTERACTIVE by default
+    '''
+    return getattr(_scope, "level", INTERACTIVE)
+
+def slot(cancel: threading.Event=None, pooled: bool=False):
+    '''
+    input: optional cancel event, and whether the generation runs on a pooled context
+    output: context manager holding the shared model, or a pooled generation's place, at this thread's priority,
+    see Scheduler.slot
+    '''
+    return _scheduler.slot(current_priority(), cancel, pooled)
+
+def status()->dict:
+    return _scheduler.status()
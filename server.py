@@ -0,0 +1,443 @@
+'''
+Local HTTP service sharing this machine's loaded model between several users.
+
+usage: python server.py [--host 127.0.0.1] [--port 8000] [--queue-size 8]
+
+endpoints, all taking and returning JSON:
+    POST /v1/completions    {"prompt", "max_tokens": 16, "temperature": 0.7, "stream": false}, OpenAI completions format
+    POST /ask               {"question", "files": [...] or "kb": NAME, "metrics", "history": [[q, a], ...], "max_tokens": 512, "stream": false}
+    POST /summarize         {"files": [...], "clusters": 10, "max_tokens": 512, "stream": false}
+    DELETE /requests/ID     cancels a queued or running request, ID being the X-Request-Id header of its response
+    GET /health             queue depth, running requests and scheduler wait times
+
+File paths are paths on the server. Requests wait in a bounded queue and are answered with 429 and a Retry-After
+header when it is full. Chat requests and summaries are queued separately and run concurrently, the scheduler
+interleaving their generations on the model with chat first. A request is cancelled when its client
+disconnects; a running generation then stops at its next token. With "stream": true the response is sent as
+server-sent events, "data: {...}" per update and "data: [DONE]" at the end.
+'''
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import model_loader
+import inference
+import scheduler
+import ragtoolkit
+
+HOST=os.environ.get("RAG_SERVER_HOST", "127.0.0.1")
+PORT=int(os.environ.get("RAG_SERVER_PORT", "8000"))
+# requests waiting for the model, beyond the running ones
+QUEUE_SIZE=int(os.environ.get("RAG_SERVER_QUEUE", "8"))
+# suggested wait of a client turned away because the queue is full
+RETRY_AFTER_S=5
+MAX_BODY_BYTES=1<<20
+MODEL_NAME=os.path.splitext(os.path.basename(model_loader.model_path))[0]
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: dict=None):
+        super().__init__(message)
+        self.status=status
+        self.headers=headers or {}
+
+class Job:
+    '''
+    One queued request: the blocking call that serves it, and the state the connection handler waits on.
+    The call runs in the thread of its lane and reports through the event loop, keeping only the latest
+    partial text, so a slow client never holds up the model.
+    '''
+    def __init__(self, loop, target, level: int, request_id: str=None):
+        self.id=request_id or uuid.uuid4().hex
+        self.loop=loop
+        self.level=level
+        # target(on_text) runs the request in the thread of its lane and returns its result
+        self.target=target
+        self.cancel=threading.Event()
+        self.text=""
+        self.changed=asyncio.Event()
+        self.done=loop.create_future()
+        self.queued_at=time.perf_counter()
+
+    def on_text(self, text: str)->None:
+        self.loop.call_soon_threadsafe(self._update, text)
+
+    def _update(self, text: str)->None:
+        self.text=text
+        self.changed.set()
+
+    def run(self)->None:
+        # called in the thread of the lane
+        try:
+            with inference.cancel_on(self.cancel), scheduler.priority(self.level):
+                inference.check_cancelled()
+                result=self.target(self.on_text)
+        except BaseException as e:
+            if not isinstance(e, inference.Cancelled):
+                traceback.print_exc()
+            self.loop.call_soon_threadsafe(self._finish, None, e)
+        else:
+            self.loop.call_soon_threadsafe(self._finish, result, None)
+
+    def _finish(self, result, error)->None:
+        if not self.done.done():
+            if error is None:
+                self.done.set_result(result)
+            else:
+                self.done.set_exception(error)
+        self.changed.set()
+
+class InferenceServer:
+    '''
+    Accepts requests into a bounded queue and serves them in one lane per scheduler priority, each lane running
+    one request at a time on its own thread.
+    '''
+    def __init__(self, queue_size: int=QUEUE_SIZE):
+        self.queue_size=queue_size
+        self.lanes={}
+        self.jobs={}
+        self.running={level: None for level in scheduler.PRIORITY_NAMES}
+        self.executors={level: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-requests")
+            for level, name in scheduler.PRIORITY_NAMES.items()}
+
+    async def serve(self, host: str=HOST, port: int=PORT)->None:
+        self.lanes={level: asyncio.Queue() for level in scheduler.PRIORITY_NAMES}
+        loop=asyncio.get_running_loop()
+        # load the models before accepting requests, so the first one is not billed for it
+        await loop.run_in_executor(self.executors[scheduler.INTERACTIVE], model_loader.wait_until_ready)
+        workers=[asyncio.create_task(self.work(level)) for level in self.lanes]
+        server=await asyncio.start_server(self.handle, host, port)
+        print(f"Serving {MODEL_NAME} on http://{host}:{port} with {self.queue_size} queue slots")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            for executor in self.executors.values():
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def queued(self)->int:
+        return sum(lane.qsize() for lane in self.lanes.values())
+
+    async def work(self, level: int)->None:
+        loop=asyncio.get_running_loop()
+        lane=self.lanes[level]
+        while True:
+            job=await lane.get()
+            if job.cancel.is_set():
+                job._finish(None, inference.Cancelled())
+                continue
+            self.running[level]=job
+            start=time.perf_counter()
+            print(f"Request {job.id[:8]} started after {start-job.queued_at:.2f}s in the queue, {lane.qsize()} waiting behind it")
+            try:
+                await loop.run_in_executor(self.executors[level], job.run)
+            finally:
+                self.running[level]=None
+            print(f"Request {job.id[:8]} finished in {time.perf_counter()-start:.2f}s")
+
+    def submit(self, target, level: int, request_id: str=None)->Job:
+        '''
+        input: blocking callable taking an on_text callback, its scheduler priority, and optionally the id the
+        client chose for the request
+        output: the queued job
+        raises HTTPError 429 when the queue is full
+        '''
+        if request_id in self.jobs:
+            raise HTTPError(409, f"Request {request_id} is already queued or running")
+        if self.queued()>=self.queue_size:
+            raise HTTPError(429, "Too many requests waiting for the model, retry later", {"Retry-After": str(RETRY_AFTER_S)})
+        job=Job(asyncio.get_running_loop(), target, level, request_id)
+        self.lanes[level].put_nowait(job)
+        self.jobs[job.id]=job
+        job.done.add_done_callback(lambda done: self.forget(job))
+        return job
+
+    def forget(self, job: Job)->None:
+        self.jobs.pop(job.id, None)
+        # the client of a cancelled job may be gone, so nobody else retrieves its error
+        job.done.exception()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter)->None:
+        try:
+            try:
+                method, path, headers, body=await read_request(reader)
+                await self.route(method, path, headers, body, reader, writer)
+            except HTTPError as e:
+                await send_json(writer, e.status, {"error": {"message": str(e)}}, e.headers)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                raise
+            except Exception as e:
+                # a bug in handling one request still gets its client an answer
+                traceback.print_exc()
+                await send_json(writer, 500, {"error": {"message": repr(e)}})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    async def route(self, method: str, path: str, headers: dict, body: dict, reader, writer)->None:
+        if method=="GET" and path=="/health":
+            await send_json(writer, 200, {"status": "ok" if model_loader.is_ready() else "loading", "model": MODEL_NAME,
+                "queued": self.queued(), "queue_size": self.queue_size,
+                "running": {scheduler.PRIORITY_NAMES[level]: job.id if job else None for level, job in self.running.items()},
+                "scheduler": scheduler.status()})
+            return
+        if method=="DELETE" and path.startswith("/requests/"):
+            job=self.jobs.get(path[len("/requests/"):])
+            if job is None:
+                raise HTTPError(404, "No such queued or running request")
+            job.cancel.set()
+            await send_json(writer, 200, {"id": job.id, "cancelled": True})
+            return
+        if path not in ENDPOINTS:
+            raise HTTPError(404, f"No endpoint {path}")
+        if method!="POST":
+            raise HTTPError(405, f"{path} only accepts POST")
+        endpoint, level=ENDPOINTS[path]
+        target, event=endpoint(body)
+        # a client that sets its own id can cancel a request before the response headers arrive
+        job=self.submit(target, level, headers.get("x-request-id"))
+        if body.get("stream"):
+            await self.stream(job, event, reader, writer)
+        else:
+            await self.respond(job, event, reader, writer)
+
+    async def respond(self, job: Job, event, reader, writer)->None:
+        if not await finished_or_disconnected(job, reader):
+            return
+        try:
+            result=job.done.result()
+        except inference.Cancelled:
+            raise HTTPError(499, "Request cancelled")
+        except Exception as e:
+            raise HTTPError(500, repr(e))
+        await send_json(writer, 200, event(job, None, result, False), {"X-Request-Id": job.id})
+
+    async def stream(self, job: Job, event, reader, writer)->None:
+        writer.write(("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+            f"Transfer-Encoding: chunked\r\nConnection: close\r\nX-Request-Id: {job.id}\r\n\r\n").encode())
+        disconnected=asyncio.create_task(wait_disconnect(reader))
+        sent=""
+        try:
+            while True:
+                changed=asyncio.create_task(job.changed.wait())
+                await asyncio.wait({changed, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                changed.cancel()
+                if disconnected.done():
+                    job.cancel.set()
+                    return
+                job.changed.clear()
+                text=job.text
+                if text!=sent and text.startswith(sent):
+                    await send_event(writer, event(job, text[len(sent):], None, True))
+                    sent=text
+                if job.done.done():
+                    break
+            try:
+                result=job.done.result()
+            except inference.Cancelled:
+                await send_event(writer, {"error": {"message": "Request cancelled"}})
+            except Exception as e:
+                await send_event(writer, {"error": {"message": repr(e)}})
+            else:
+                await send_event(writer, event(job, "", result, True))
+            await send_event(writer, "[DONE]")
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except ConnectionError:
+            job.cancel.set()
+        finally:
+            disconnected.cancel()
+
+async def wait_disconnect(reader: asyncio.StreamReader)->None:
+    # responses close the connection, so anything the client still sends is ignored until it hangs up
+    while await reader.read(4096):
+        pass
+
+async def finished_or_disconnected(job: Job, reader)->bool:
+    '''
+    input: queued job and the reader of its connection
+    output: True once the job finished, False if the client disconnected first, which cancels the job
+    '''
+    disconnected=asyncio.create_task(wait_disconnect(reader))
+    try:
+        await asyncio.wait({job.done, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnected.cancel()
+    if job.done.done():
+        return True
+    job.cancel.set()
+    return False
+
+async def read_request(reader: asyncio.StreamReader)->tuple[str, str, dict, dict]:
+    '''
+    input: reader of a new connection
+    output: method, path, headers with lower case names, and the parsed JSON body (empty if there is none)
+    '''
+    request_line=(await reader.readline()).decode("latin-1").split()
+    if len(request_line)!=3:
+        raise HTTPError(400, "Malformed request line")
+    method, target, _=request_line
+    headers={}
+    while True:
+        line=(await reader.readline()).decode("latin-1")
+        if line in ("\r\n", "\n", ""):
+            break
+        name, _, value=line.partition(":")
+        headers[name.strip().lower()]=value.strip()
+    try:
+        length=int(headers.get("content-length", "0") or 0)
+    except ValueError:
+        length=-1
+    if length<0:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length>MAX_BODY_BYTES:
+        raise HTTPError(413, "Request body too large")
+    body={}
+    if length:
+        try:
+            body=json.loads(await reader.readexactly(length))
+        except ValueError:
+            raise HTTPError(400, "Body is not valid JSON")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "Body must be a JSON object")
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+REASONS={200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+    429: "Too Many Requests", 499: "Client Closed Request", 500: "Internal Server Error"}
+
+async def send_json(writer: asyncio.StreamWriter, status: int, body, headers: dict=None)->None:
+    data=json.dumps(body, ensure_ascii=False).encode("utf-8")
+    head=f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\nConnection: close\r\n"
+    head+="".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+    writer.write(head.encode()+b"\r\n"+data)
+    await writer.drain()
+
+async def send_event(writer: asyncio.StreamWriter, event)->None:
+    # one server-sent event in one chunk; drain waits for slow clients without blocking generation
+    data=f"data: {event if isinstance(event, str) else json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+    writer.write(f"{len(data):x}\r\n".encode()+data+b"\r\n")
+    await writer.drain()
+
+def required(body: dict, field: str, kind=str):
+    value=body.get(field)
+    if not isinstance(value, kind) or not value:
+        raise HTTPError(400, f"Missing or invalid field: {field}")
+    return value
+
+def optional(body: dict, field: str, kind=str):
+    value=body.get(field)
+    if value is not None and not isinstance(value, kind):
+        raise HTTPError(400, f"Invalid field: {field}")
+    return value
+
+def number(body: dict, field: str, default, low, high, kind=(int, float)):
+    value=body.get(field, default)
+    # bool is an int subclass, but true is not a count
+    if isinstance(value, bool) or not isinstance(value, kind) or not low<=value<=high:
+        raise HTTPError(400, f"{field} must be a {'whole ' if kind is int else ''}number from {low} to {high}")
+    return value
+
+def paths(body: dict, field: str, needed: bool=True)->list[str]:
+    value=required(body, field, list) if needed else optional(body, field, list)
+    if value is not None and not all(isinstance(path, str) and path for path in value):
+        raise HTTPError(400, f"{field} must be a list of paths")
+    return value
+
+def max_tokens_of(body: dict, default: int)->int:
+    # the reply may take at most half the context window, leaving the rest for the prompt
+    return number(body, "max_tokens", default, 1, model_loader.get_llm().n_ctx()//2, int)
+
+def completions_endpoint(body: dict):
+    '''
+    input: OpenAI completions request body
+    output: blocking call serving it, and the builder of its response events
+    '''
+    prompt=required(body, "prompt")
+    max_tokens=max_tokens_of(body, 16)
+    temperature=number(body, "temperature", 0.7, 0.0, 2.0)
+    if inference.count_tokens(prompt)+max_tokens>model_loader.get_llm().n_ctx():
+        raise HTTPError(400, "prompt and max_tokens do not fit in the context window")
+    created=int(time.time())
+
+    def target(on_text):
+        return inference.complete(prompt, max_tokens, temperature=temperature, on_text=on_text)
+
+    def event(job, delta, result, streamed):
+        response={"id": f"cmpl-{job.id}", "object": "text_completion", "created": created, "model": MODEL_NAME,
+            "choices": [{"text": delta, "index": 0, "logprobs": None, "finish_reason": None}]}
+        if result is not None:
+            reply, stats=result
+            # a streamed reply was already sent as deltas
+            response["choices"][0]["text"]="" if streamed else reply
+            response["choices"][0]["finish_reason"]="length" if stats["completion_tokens"]>=max_tokens else "stop"
+            response["usage"]={"prompt_tokens": stats["prompt_tokens"], "completion_tokens": stats["completion_tokens"],
+                "total_tokens": stats["prompt_tokens"]+stats["completion_tokens"]}
+        return response
+    return target, event
+
+def text_event(job, delta, result, streamed):
+    # partial updates carry the added text, the last event or the whole response the result
+    return {"text": delta} if result is None else result
+
+def ask_endpoint(body: dict):
+    question=required(body, "question")
+    files=paths(body, "files", needed=False)
+    kb=optional(body, "kb")
+    if bool(files)==bool(kb):
+        raise HTTPError(400, "Give either files or kb")
+    metrics=optional(body, "metrics")
+    history=optional(body, "history", list) or []
+    if not all(isinstance(turn, list) and len(turn)==2 and all(isinstance(text, str) for text in turn) for turn in history):
+        raise HTTPError(400, "history must be a list of [question, answer] pairs")
+    history=[tuple(turn) for turn in history]
+    max_tokens=max_tokens_of(body, 512)
+
+    def target(on_text):
+        stats={}
+        if kb:
+            ragtoolkit.open_knowledge_base(kb)
+        reply, new_history=ragtoolkit.ask(question, files, history, metrics, max_tokens, on_text, stats.update)
+        return {"answer": reply, "history": new_history, "stats": stats}
+    return target, text_event
+
+def summarize_endpoint(body: dict):
+    files=paths(body, "files")
+    num_clusters=number(body, "clusters", 10, 1, 1000, int)
+    max_tokens=max_tokens_of(body, 512)
+
+    def target(on_text):
+        stats={}
+        summary=ragtoolkit.summarize(files, num_clusters, max_tokens, on_text, stats.update)
+        return {"summary": summary, "stats": stats}
+    return target, text_event
+
+# path -> (request parser, scheduler priority)
+ENDPOINTS={
+    "/v1/completions": (completions_endpoint, scheduler.INTERACTIVE),
+    "/ask": (ask_endpoint, scheduler.INTERACTIVE),
+    "/summarize": (summarize_endpoint, scheduler.BACKGROUND),
+}
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    args=parser.parse_args()
+    try:
+        asyncio.run(InferenceServer(args.queue_size).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__=="__main__":
+    main()
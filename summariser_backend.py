@@ -1,74 +1,29 @@
-import pymupdf
-import llama_cpp
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from PySide6.QtCore import QRunnable, Slot, Signal, QObject
-import traceback
-import sys
-import os
-from sklearn.cluster import KMeans
+import ingestion
+import chunk_selection
 
-from model_loader import llm_model
+import model_loader
+import inference
+import llm_pool
+import scheduler
+import embedding_cache
+import completion_cache
 
-model=llm_model
 
-index=None
-id_to_text={}
-
-embedder=SentenceTransformer('all-MiniLM-L6-v2')
-
-def split_into_chunks(text, chunk_size=500, overlap=50):
-    '''
-    input: text in the form of  a string
-    output: list of chunks of text, each of size chunk_size
-    '''
-    
-    chunks=[]
-    for i in range(0, len(text), chunk_size-overlap):
-        chunks.append(text[i:i+chunk_size])
-    return chunks
-
-def embed_text(text:str)->np.ndarray:
-    # embed the text using the sentence transformer model
-    '''
-    input: text in the form of a string
-    output: embedding of the text in the form of a numpy array
-    '''
-
-    chunks=split_into_chunks(text)
-    vectors=embedder.encode(chunks)
-    return chunks, vectors
-
-def extract_text_from_pdf(filepath: str)-> str:
-    '''
-    input: filepath of pdf
-    output: text extracted from the pdf
+def process_files(filepaths: list[str], on_progress=None)-> tuple[list[str], np.ndarray]:
     '''
-    doc=pymupdf.open(filepath)
-    full_text=""
-    for page in doc:
-        full_text+=page.get_text()
-    return full_text
-
-def process_files(filepaths: list[str])-> tuple[list[str], np.ndarray]:
-    '''
-    input: list of filepaths
+    input: list of filepaths, and an optional callback receiving (files done, total files)
     processes files for text extraction and embedding
     output: extracted chunks and embeddings
     '''
+    paths=[path for path in filepaths if ingestion.is_supported(path)]
+    ingested=ingestion.ingest_files(paths, on_progress=on_progress)
     all_chunks=[]
     all_vectors=[]
-    for path in filepaths:
-        if path.endswith('.pdf'):
-            text=extract_text_from_pdf(path)
-
-        elif path.endswith('.json'):
-            with open(path, 'r') as f:
-                text=f.read()
-        
-        else:
+    for path in paths:
+        chunks, vectors, pages=ingested[path]
+        if len(chunks)==0:
             continue
-        chunks, vectors=embed_text(text)
         all_chunks.extend(chunks)
         all_vectors.append(vectors)
 
@@ -78,86 +33,76 @@ def process_files(filepaths: list[str])-> tuple[list[str], np.ndarray]:
 
     else:
         raise ValueError('No text extracted')
-def clustering(vectors, num_clusters):
+def clustering(vectors, num_clusters, method: str="auto"):
     """
-    input: embeddings from given pdf text as vectors
-    output: clusters of similar vectors
+    input: embeddings from given pdf text as vectors, number of clusters and clustering method
+    output: indices of the chunk closest to each cluster centre
     """
-    if len(vectors)<num_clusters:
-        return list(range(len(vectors)))
-    
-    k=num_clusters
-    kmeans=KMeans(n_clusters=k, random_state=42, n_init=10).fit(vectors)
-    labels=kmeans.labels_
-    closest_indices=[]
+    return chunk_selection.select_representatives(vectors, num_clusters, method)
+
+# constant heads of the map and reduce prompts, kept identical across calls so their evaluated KV state can be reused
+MAP_PROMPT_PREFIX="""
+        Act as a concise summariser.
+        Summarise the given text into 2-3 lines, no more. Ensure you completely cover the content of the text. This text will be enclosed in triple backticks (```)
+        The output should be the summary of the user supplied text.
+        Be concise and precise in your behaviour.
 
-    for i in range(num_clusters):
-        cluster_indices=np.where(labels==i)[0]
-        if len(cluster_indices)>0:
-            distances=np.linalg.norm(vectors[cluster_indices]-kmeans.cluster_centers_[i], axis=1)
+        ```"""
 
-            closest_index=np.argmin(distances)
+REDUCE_PROMPT_PREFIX="""<|im_start|>system
+    You are a precise and concise summariser.
+    You will be given a series of summaries from a book. The summaries will be enclosed in triple backticks (```).
+    Your task is to write a verbose summary of what was covered in the book.
 
-            closest_indices.append(cluster_indices[closest_index])
+    The output should be a detailed and coherent summary that captures all the key information present in the provided summaries. Combine each summary into one whole summary 
+    The goal is to help a reader understand the entire content of the book from this single collated summary. 
 
-    selected_indices=sorted(list(set(closest_indices)))
-    return selected_indices
+    Do not add any external information. Base your answer only on what is provided. Ensure it is a single stream of text, and not split up. Combine parts to form a bigger whole.
+    Capture the sentiment of the book.
+    Structure your response in markdown.
+    <|im_end|>
+    <|im_start|>user
+    ```"""
 
-def summary_creater(selected_indices, chunks):
+def summary_creater(selected_indices, chunks, parallelism: int=None, cache_job: str=None):
     """
-    input: indices of selected chunks and chunks themselves
+    input: indices of selected chunks and chunks themselves, and optionally how many chunks to summarise concurrently
+    and the id of the summary job whose completion cache is used
     output: summary list of selected chunks
     """
-    summary_list=[]
+    map_prompts=[]
     for i in selected_indices:
         section=chunks[i]
-        map_prompt=f"""
-        Act as a concise summariser.
-        Summarise the given text into 2-3 lines, no more. Ensure you completely cover the content of the text. This text will be enclosed in triple backticks (```)
-        The output should be the summary of the user supplied text.
-        Be concise and precise in your behaviour.
-
-        ```{section}```
+        map_prompt=MAP_PROMPT_PREFIX+f"""{section}```
         SUMMARY: 
         """
-        temp=0.7
-        max_tokens=150
-
-        response=model.create_completion(
-        prompt=map_prompt,
-        temperature=temp,
-        max_tokens=max_tokens
-        )
+        map_prompts.append(map_prompt)
+    temp=0.7
+    max_tokens=150
 
-        summary=response['choices'][0]['text']
-        summary=summary.replace("[/INST]", "")
+    def report(position, summary):
         print(summary)
-        print(i)
-        summary_list.append(summary)
-        print(f"Summary for chunk{i} is ready")
+        print(selected_indices[position])
+        print(f"Summary for chunk{selected_indices[position]} is ready")
 
+    summary_list=llm_pool.map_completions(map_prompts, max_tokens, temperature=temp, prefix=MAP_PROMPT_PREFIX, parallelism=parallelism, on_done=report, cache_job=cache_job)
     return summary_list
 
-def collate_summaries(individual_summaries: list[str], max_tokens: int)->str:
-    '''
-    input: list of individual summaries and max_tokens to decide output length
-    output: summary as a string
-    '''
-    summaries="\n".join(individual_summaries)
-    final_prompt = f"""<|im_start|>system
+GROUP_PROMPT_PREFIX="""<|im_start|>system
     You are a precise and concise summariser.
-    You will be given a series of summaries from a book. The summaries will be enclosed in triple backticks (```).
-    Your task is to write a verbose summary of what was covered in the book.
-
-    The output should be a detailed and coherent summary that captures all the key information present in the provided summaries. Combine each summary into one whole summary 
-    The goal is to help a reader understand the entire content of the book from this single collated summary. 
-
-    Do not add any external information. Base your answer only on what is provided. Ensure it is a single stream of text, and not split up. Combine parts to form a bigger whole.
-    Capture the sentiment of the book.
-    Structure your response in markdown.
+    You will be given consecutive summaries of parts of a book. The summaries will be enclosed in triple backticks (```).
+    Combine them into a single summary of this part of the book in at most 8 sentences, keeping the key events, facts and sentiment.
+    Do not add any external information.
     <|im_end|>
     <|im_start|>user
-    ```{summaries}```
+    ```"""
+
+# output length of each intermediate reduction, and tokens kept free for prompt text and tokenizer differences
+GROUP_MAX_TOKENS=300
+PROMPT_MARGIN=64
+
+def final_prompt_for(summaries: str)->str:
+    return REDUCE_PROMPT_PREFIX+f"""{summaries}```
     Question:
     Provide a detailed summary of the book based on the provided summaries.
     <|im_end|>
@@ -166,41 +111,89 @@ def collate_summaries(individual_summaries: list[str], max_tokens: int)->str:
     Here is the detailed summary of the book:
     """
 
+def group_prompt_for(summaries: str)->str:
+    return GROUP_PROMPT_PREFIX+f"""{summaries}```
+    <|im_end|>
+    <|im_start|>assistant
+    """
+
+def group_by_budget(summaries: list[str], budget_tokens: int)->list[list[str]]:
+    '''
+    input: ordered summaries and the token budget of one group
+    output: consecutive groups of summaries, each within the budget where possible
+    '''
+    groups=[]
+    used=0
+    for summary in summaries:
+        tokens=inference.count_tokens(summary+"\n")
+        if groups and used+tokens<=budget_tokens:
+            groups[-1].append(summary)
+            used+=tokens
+        else:
+            groups.append([summary])
+            used=tokens
+    return groups
+
+def reduce_summaries(summaries: list[str], budget_tokens: int, parallelism: int=None, cache_job: str=None)->list[str]:
+    '''
+    input: ordered summaries, the token budget they must fit in together, how many groups to reduce concurrently,
+    and optionally the id of the summary job whose completion cache is used
+    collates groups of summaries into shorter ones, level by level, until they all fit the budget
+    output: summaries fitting in budget_tokens
+    '''
+    parallelism=llm_pool.default_parallelism() if parallelism is None else parallelism
+    group_budget=llm_pool.context_window(parallelism)-GROUP_MAX_TOKENS-inference.count_tokens(group_prompt_for(""))-PROMPT_MARGIN
+    level=0
+    while inference.count_tokens("\n".join(summaries))>budget_tokens:
+        groups=group_by_budget(summaries, min(group_budget, budget_tokens))
+        if len(groups)==len(summaries) and len(summaries)>1:
+            # no two summaries fit one prompt, so pair them up and let the model shorten them
+            groups=[summaries[i:i+2] for i in range(0, len(summaries), 2)]
+        level+=1
+        print(f"Reduce level {level}: collating {len(summaries)} summaries in {len(groups)} groups")
+        prompts=[group_prompt_for("\n".join(group)) for group in groups]
+        # intermediate results are cached for the job, so retrying it after a failure later on does not redo this work
+        summaries=llm_pool.map_completions(prompts, GROUP_MAX_TOKENS, temperature=0.7, prefix=GROUP_PROMPT_PREFIX, parallelism=parallelism, cache_job=cache_job)
+        if len(summaries)==1:
+            break
+    return summaries
+
+def collate_summaries(individual_summaries: list[str], max_tokens: int, on_text=None, on_stats=None, parallelism: int=None, cache_job: str=None)->str:
+    '''
+    input: list of individual summaries and max_tokens to decide output length, and optionally the id of the
+    summary job whose completion cache is used
+    optionally on_text receives the partial summary while it streams, and on_stats the generation stats
+    summaries that do not fit the context window together are first collated hierarchically
+    output: summary as a string
+    '''
+    budget_tokens=model_loader.get_llm().n_ctx()-max_tokens-inference.count_tokens(final_prompt_for(""))-PROMPT_MARGIN
+    individual_summaries=reduce_summaries(individual_summaries, budget_tokens, parallelism, cache_job)
+
+    summaries="\n".join(individual_summaries)
+    final_prompt=final_prompt_for(summaries)
+
     temp=0.7
 
-    response=model.create_completion(
-        prompt=final_prompt,
-        temperature=temp,
-        max_tokens=max_tokens
-    )
-    assistant_reply=response['choices'][0]['text']
-    collated_summary=assistant_reply.replace("[/INST]", "")
+    collated_summary, stats=inference.complete(final_prompt, max_tokens, temperature=temp, on_text=on_text, prefix=REDUCE_PROMPT_PREFIX)
+    if on_stats:
+        on_stats(stats)
     return collated_summary
 
-class WorkerSignals(QObject):
-    finished=Signal()
-    error=Signal(str)
-    result=Signal(object)
-
-class SummarizationWorker(QRunnable):
-    def __init__(self, filepaths: list[str], num_clusters: int=10, max_tokens: int=512):
-        super().__init__()
-        self.filepaths=filepaths
-        self.num_clusters=num_clusters
-        self.max_tokens=max_tokens
-        self.signals=WorkerSignals()
-    
-    @Slot()
-    def run(self):
-        try:
-            all_chunks, all_vectors=process_files(self.filepaths)
-            selected_indices=clustering(all_vectors, self.num_clusters)
-            individual_summaries=summary_creater(selected_indices, all_chunks)
-            collated_summary=collate_summaries(individual_summaries, self.max_tokens)
-            self.signals.result.emit(collated_summary)
-        
-        except Exception as e:
-            tb=traceback.format_exc()
-            self.signals.error.emit(tb)
-        finally:
-            self.signals.finished.emit()
+def summarize(filepaths: list[str], num_clusters: int=10, max_tokens: int=512, on_text=None, on_stats=None, on_progress=None, map_parallelism: int=None)->str:
+    '''
+    input: filepaths, number of representative chunks, max tokens of the summary, optional callbacks receiving the
+    partial summary, the generation stats and the indexing progress, and the number of concurrent map generations
+    map and reduce completions are cached until the summary is done, so running it again after a failure resumes it
+    output: summary of the documents
+    '''
+    model_loader.wait_until_ready()
+    all_chunks, all_vectors=process_files(filepaths, on_progress)
+    selected_indices=clustering(all_vectors, num_clusters)
+    cache_job=completion_cache.job_id("summary", *sorted(embedding_cache.file_digest(path) for path in filepaths if ingestion.is_supported(path)), num_clusters, max_tokens)
+    # a summary is many generations, so chat questions asked meanwhile are answered between them
+    with scheduler.priority(scheduler.BACKGROUND):
+        individual_summaries=summary_creater(selected_indices, all_chunks, map_parallelism, cache_job)
+        summary=collate_summaries(individual_summaries, max_tokens, on_text, on_stats, map_parallelism, cache_job)
+    # a later summary of the same documents samples its own completions
+    completion_cache.clear(cache_job)
+    return summary
@@ -7,7 +7,7 @@ from PySide6.QtWidgets import(
 from PySide6.QtCore import Qt, QThreadPool
 from PySide6.QtGui import QTextOption
 
-from summariser_backend import SummarizationWorker
+from qt_workers import SummarizationWorker
 
 class SummarizerWidget(QWidget):
     def __init__(self, max_tokens: int=512):
@@ -93,12 +93,19 @@ class SummarizerWidget(QWidget):
 
         worker=SummarizationWorker(filepaths=self.selected_files, max_tokens=self.max_tokens)
 
+        worker.signals.progress.connect(self.show_progress)
+        worker.signals.partial.connect(self.display_summary)
         worker.signals.result.connect(self.display_summary)
         worker.signals.error.connect(self.display_error)
         worker.signals.finished.connect(self.summarization_finished)
 
         self.threadpool.start(worker)
 
+    def show_progress(self, done, total):
+        self.summary_output.setPlaceholderText(f"Reading documents {done}/{total}....")
+        if done==total:
+            self.summary_output.setPlaceholderText("Generating summary....")
+
     def display_summary(self, summary_text):
         self.summary_output.setText(summary_text)
 
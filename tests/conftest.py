@@ -0,0 +1,60 @@
+import os
+import re
+import sys
+import zlib
+import numpy as np
+import pytest
+
+# the modules live at the repository root, which is not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class WhitespaceTokenizer:
+    '''
+    One token per whitespace separated word, called like a Hugging Face fast tokenizer.
+    '''
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False):
+        texts=[text] if isinstance(text, str) else text
+        input_ids=[]
+        offset_mapping=[]
+        for item in texts:
+            spans=[match.span() for match in re.finditer(r"\S+", item)]
+            input_ids.append(list(range(len(spans)+(2 if add_special_tokens else 0))))
+            offset_mapping.append(spans)
+        if isinstance(text, str):
+            return {"input_ids": input_ids[0], "offset_mapping": offset_mapping[0]}
+        return {"input_ids": input_ids, "offset_mapping": offset_mapping}
+
+@pytest.fixture
+def tokenizer():
+    return WhitespaceTokenizer()
+
+class HashingEmbedder:
+    '''
+    Bag of hashed words, normalized, standing in for the SentenceTransformer; counts the texts it encodes.
+    '''
+    dimension=64
+
+    def __init__(self):
+        self.tokenizer=WhitespaceTokenizer()
+        self.encoded=[]
+
+    def encode(self, texts, batch_size=32):
+        self.encoded.extend(texts)
+        vectors=np.zeros((len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, zlib.crc32(word.encode("utf-8"))%self.dimension]+=1.0
+        norms=np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors/np.maximum(norms, 1e-6)
+
+@pytest.fixture
+def embedder(monkeypatch):
+    import embedding_service
+    fake=HashingEmbedder()
+    monkeypatch.setattr(embedding_service, "_embedder", fake)
+    monkeypatch.setattr(embedding_service, "_query_cache", type(embedding_service._query_cache)())
+    return fake
+
+def count_words(text: str)->int:
+    # stands in for the llm tokenizer, words and punctuation marks each count as a token
+    return len(re.findall(r"\w+|[^\w\s]", text))
@@ -0,0 +1,61 @@
+import numpy as np
+from bm25 import BM25Index, tokenize
+
+TEXTS=[
+    "The pump model XR-200 failed after 300 hours.",
+    "Maintenance of the cooling loop is scheduled monthly.",
+    "The XR-300 pump replaced the older model.",
+    "Quarterly report on cooling efficiency.",
+]
+
+def make_index():
+    index=BM25Index()
+    index.add(np.arange(len(TEXTS), dtype='int64'), TEXTS)
+    return index
+
+def test_tokenize_keeps_compounds_and_parts():
+    tokens=tokenize("XR-200 pump")
+    assert "xr-200" in tokens and "xr" in tokens and "200" in tokens and "pump" in tokens
+
+def test_exact_identifier_ranks_first():
+    ids, scores=make_index().search("XR-200", 2)
+    assert ids[0]==0
+    assert np.all(np.diff(scores)<=0)
+
+def test_removed_chunks_are_not_returned():
+    index=make_index()
+    index.remove(np.array([0], dtype='int64'))
+    ids, _=index.search("XR-200 pump", 4)
+    assert 0 not in ids.tolist() and 2 in ids.tolist()
+
+def test_save_and_open_round_trip(tmp_path):
+    index=make_index()
+    index.remove(np.array([1], dtype='int64'))
+    index.save(str(tmp_path))
+    opened=BM25Index.open(str(tmp_path))
+    for query in ("cooling", "pump model", "XR-300", "monthly"):
+        expected_ids, expected_scores=index.search(query, 4)
+        ids, scores=opened.search(query, 4)
+        assert ids.tolist()==expected_ids.tolist()
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+
+def test_add_after_open_merges_postings(tmp_path):
+    make_index().save(str(tmp_path))
+    opened=BM25Index.open(str(tmp_path))
+    opened.add(np.array([4], dtype='int64'), ["Cooling loop XR-200 inspection."])
+    ids, _=opened.search("XR-200", 4)
+    # the other XR model only matches on the compound's parts
+    assert sorted(ids[:2].tolist())==[0, 4]
+    term_ids, tfs=opened.term_postings("cooling")
+    assert sorted(term_ids.tolist())==[1, 3, 4]
+
+def test_compacted_translates_ids():
+    index=make_index()
+    index.remove(np.array([0, 1], dtype='int64'))
+    mapping=np.array([-1, -1, 0, 1], dtype='int64')
+    compacted=index.compacted(mapping)
+    assert len(compacted.doc_lengths)==2
+    ids, _=compacted.search("cooling", 4)
+    assert ids.tolist()==[1]
+    ids, _=compacted.search("XR-300", 4)
+    assert ids.tolist()==[0]
@@ -0,0 +1,46 @@
+import pytest
+import chat_history
+import scheduler
+from chat_history import HistoryManager, format_turn
+from conftest import count_words
+
+@pytest.fixture(autouse=True)
+def words_as_tokens(monkeypatch):
+    monkeypatch.setattr(chat_history, "count_tokens", count_words)
+
+def turn(n: int)->tuple[str, str]:
+    return f"question {n} about the report?", f"answer {n} with some detail about the report."
+
+def test_keeps_the_newest_turns_that_fit():
+    history=[turn(n) for n in range(6)]
+    per_turn=count_words(format_turn(*history[0]))
+    manager=HistoryManager(budget_tokens=2*per_turn+1)
+    assert manager.render(history)==format_turn(*history[4])+format_turn(*history[5])
+    assert manager.render(history, budget_tokens=per_turn)==format_turn(*history[5])
+    assert manager.render(history, budget_tokens=per_turn-1)==""
+    assert HistoryManager(budget_tokens=10**6).render(history)=="".join(format_turn(*item) for item in history)
+    assert manager.render([])==""
+
+def test_old_turns_are_folded_into_a_summary(monkeypatch):
+    prompts=[]
+    priorities=[]
+
+    def complete(prompt, max_tokens, temperature=0.7, prefix=None):
+        prompts.append(prompt)
+        priorities.append(scheduler.current_priority())
+        return " report discussed in turns 0 to 3 ", {}
+    monkeypatch.setattr(chat_history.inference, "complete", complete)
+    history=[turn(n) for n in range(6)]
+    per_turn=count_words(format_turn(*history[0]))
+    manager=HistoryManager(budget_tokens=chat_history.SUMMARY_MAX_TOKENS+2*per_turn+1, summarise=True)
+    manager.refresh_summary_async(history)
+    manager.summary_thread.join(5)
+    assert priorities==[scheduler.BACKGROUND]
+    assert "question 0" in prompts[0] and "question 3" in prompts[0] and "question 4" not in prompts[0]
+    assert manager.covered==4
+
+    rendered=manager.render(history)
+    assert rendered.startswith("Summary of the earlier conversation: report discussed in turns 0 to 3\n\n")
+    assert "question 3" not in rendered and rendered.endswith(format_turn(*history[5]))
+    # a different conversation does not get this summary
+    assert not manager.render([turn(9)]+history[1:]).startswith("Summary")
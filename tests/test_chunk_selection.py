@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+import chunk_selection
+
+def test_nearest_to_centroids_picks_one_chunk_per_cluster():
+    vectors=np.array([[0.0, 0.0], [5.2, 5.0], [0.3, 0.0], [5.0, 5.0], [0.1, 0.1], [9.0, 0.0]], dtype='float32')
+    labels=np.array([0, 1, 0, 1, 0, 0])
+    # the third cluster has no members
+    centroids=np.array([[0.2, 0.0], [5.0, 5.0], [-9.0, -9.0]], dtype='float32')
+    assert chunk_selection.nearest_to_centroids(vectors, labels, centroids)==[2, 3]
+
+def test_choose_method_by_corpus_size():
+    assert chunk_selection.choose_method(100)=="kmeans"
+    assert chunk_selection.choose_method(chunk_selection.KMEANS_MAX_VECTORS)=="minibatch"
+    assert chunk_selection.choose_method(chunk_selection.MINIBATCH_MAX_VECTORS)=="faiss"
+
+@pytest.mark.parametrize("method", chunk_selection.SELECTION_METHODS)
+def test_every_method_picks_a_member_of_each_blob(method):
+    rng=np.random.default_rng(0)
+    centres=np.array([[0, 0, 0], [20, 0, 0], [0, 20, 0]], dtype='float32')
+    vectors=np.vstack([centre+rng.normal(size=(40, 3)) for centre in centres]).astype('float32')
+    selected=chunk_selection.select_representatives(vectors, 3, method)
+    assert sorted(index//40 for index in selected)==[0, 1, 2]
+
+def test_fewer_chunks_than_clusters_selects_all():
+    assert chunk_selection.select_representatives(np.zeros((2, 3), dtype='float32'), 5)==[0, 1]
+    with pytest.raises(ValueError):
+        chunk_selection.select_representatives(np.zeros((8, 3), dtype='float32'), 2, "spectral")
@@ -0,0 +1,61 @@
+import pytest
+from chunk_store import ChunkStore
+
+def make_store():
+    store=ChunkStore()
+    a=store.add("a.pdf", ["alpha one", "alpha two"], [1, 2])
+    b=store.add("b.pdf", ["beta é"], [1])
+    c=store.add("c.pdf", ["gamma one", "gamma two", "gamma three"], [4, 4, 5])
+    return store, a, b, c
+
+def test_add_and_lookup():
+    store, a, b, c=make_store()
+    assert a.tolist()==[0, 1] and b.tolist()==[2] and c.tolist()==[3, 4, 5]
+    assert store[2]=="beta é"
+    assert store.page(5)==5
+    assert store.source(4)=="c.pdf"
+    assert len(store)==6 and store.next_id==6
+
+def test_removed_chunks_keep_their_ids():
+    store, a, b, c=make_store()
+    store.remove(b)
+    assert 2 not in store
+    assert store.source(2) is None
+    with pytest.raises(KeyError):
+        store[2]
+    assert store[3]=="gamma one"
+    assert len(store)==5 and store.next_id==6
+
+def test_save_and_open_round_trip(tmp_path):
+    store, a, b, c=make_store()
+    store.remove(b)
+    store.save(str(tmp_path))
+    opened=ChunkStore.open(str(tmp_path))
+    assert opened.next_id==6 and len(opened)==5 and opened.removed==1
+    assert 2 not in opened
+    assert [opened[i] for i in (0, 1, 3, 4, 5)]==["alpha one", "alpha two", "gamma one", "gamma two", "gamma three"]
+    assert opened.page(5)==5 and opened.source(3)=="c.pdf"
+
+def test_add_after_open_appends(tmp_path):
+    store, _, _, _=make_store()
+    store.save(str(tmp_path))
+    opened=ChunkStore.open(str(tmp_path))
+    ids=opened.add("d.pdf", ["delta"], [9])
+    assert ids.tolist()==[6]
+    assert opened[6]=="delta" and opened[0]=="alpha one"
+    (tmp_path/"again").mkdir()
+    opened.save(str(tmp_path/"again"))
+    assert ChunkStore.open(str(tmp_path/"again"))[6]=="delta"
+
+def test_compacted_renumbers_in_file_order():
+    store, a, b, c=make_store()
+    store.remove(b)
+    compacted, new_ids=store.compacted({"c.pdf": c, "a.pdf": a})
+    assert new_ids["c.pdf"].tolist()==[0, 1, 2] and new_ids["a.pdf"].tolist()==[3, 4]
+    assert compacted.removed==0 and len(compacted)==5
+    assert compacted[0]=="gamma one" and compacted.page(2)==5 and compacted.source(3)=="a.pdf"
+
+def test_empty_store_round_trip(tmp_path):
+    ChunkStore().save(str(tmp_path))
+    opened=ChunkStore.open(str(tmp_path))
+    assert len(opened)==0 and opened.add("a", ["x"], [1]).tolist()==[0]
@@ -0,0 +1,59 @@
+import pytest
+import chunking
+
+def sentence(n: int, words: int)->str:
+    return " ".join(f"s{n}w{i}" for i in range(words-1))+f" s{n}end."
+
+def token_count(text: str)->int:
+    return len(text.split())
+
+def test_chunks_stay_within_budget_and_keep_sentences_whole(tokenizer):
+    text=" ".join(sentence(n, 7) for n in range(20))
+    chunks=list(chunking.iter_chunks([(1, text)], chunk_tokens=30, overlap_tokens=10, tokenizer=tokenizer))
+    assert len(chunks)>1
+    for chunk, page in chunks:
+        assert token_count(chunk)<=30
+        assert chunk.endswith("end.") and chunk.split()[0].endswith("w0")
+        assert page==1
+
+def test_overlap_is_whole_trailing_sentences(tokenizer):
+    text=" ".join(sentence(n, 7) for n in range(10))
+    chunks=[chunk for chunk, _ in chunking.iter_chunks([(1, text)], chunk_tokens=30, overlap_tokens=10, tokenizer=tokenizer)]
+    for left, right in zip(chunks, chunks[1:]):
+        last_sentence=" ".join(left.split()[-7:])
+        assert right.startswith(last_sentence)
+
+def test_no_overlap_when_the_last_sentence_is_too_long(tokenizer):
+    text=" ".join(sentence(n, 12) for n in range(6))
+    chunks=[chunk for chunk, _ in chunking.iter_chunks([(1, text)], chunk_tokens=30, overlap_tokens=10, tokenizer=tokenizer)]
+    assert " ".join(chunks)==text
+
+def test_every_sentence_is_covered(tokenizer):
+    sentences=[sentence(n, 3+n%9) for n in range(40)]
+    chunks=[chunk for chunk, _ in chunking.iter_chunks([(1, " ".join(sentences))], chunk_tokens=25, overlap_tokens=8, tokenizer=tokenizer)]
+    for text in sentences:
+        assert any(text in chunk for chunk in chunks)
+
+def test_long_sentence_is_cut_on_token_boundaries(tokenizer):
+    text=sentence(0, 70)
+    chunks=[chunk for chunk, _ in chunking.iter_chunks([(1, text)], chunk_tokens=30, overlap_tokens=5, tokenizer=tokenizer)]
+    assert len(chunks)>=3
+    assert all(token_count(chunk)<=30 for chunk in chunks)
+    words=text.split()
+    assert chunks[0].split()==words[:30]
+    # consecutive windows share overlap_tokens words
+    assert chunks[1].split()[:5]==words[25:30]
+    assert chunks[-1].split()[-1]==words[-1]
+
+def test_paragraphs_and_pages(tokenizer):
+    pages=[(3, sentence(0, 5)+"\n\n"+sentence(1, 5)), (4, sentence(2, 20))]
+    chunks=list(chunking.iter_chunks(pages, chunk_tokens=12, overlap_tokens=0, tokenizer=tokenizer))
+    assert chunks[0]==(sentence(0, 5)+"\n\n"+sentence(1, 5), 3)
+    assert chunks[1]==(sentence(2, 20)[:len(" ".join(sentence(2, 20).split()[:12]))], 4)
+
+def test_empty_pages_give_no_chunks(tokenizer):
+    assert list(chunking.iter_chunks([(1, ""), (2, "   ")], tokenizer=tokenizer))==[]
+
+def test_chunk_size_must_fit_the_embedder(tokenizer):
+    with pytest.raises(ValueError):
+        list(chunking.iter_chunks([(1, "text.")], chunk_tokens=chunking.embedding_service.MAX_SEQ_TOKENS, tokenizer=tokenizer))
@@ -0,0 +1,64 @@
+import os
+import pytest
+import completion_cache
+import inference
+import llm_pool
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(completion_cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(completion_cache, "ENABLED", True)
+    return tmp_path
+
+def test_completions_are_scoped_to_one_job():
+    job=completion_cache.job_id("summary", "digest-a", 10, 512)
+    other=completion_cache.job_id("summary", "digest-b", 10, 512)
+    assert job==completion_cache.job_id("summary", "digest-a", 10, 512) and job!=other
+
+    completion_cache.store(job, "prompt", 64, 0.7, "reply")
+    assert completion_cache.load(job, "prompt", 64, 0.7)=="reply"
+    assert completion_cache.load(job, "prompt", 65, 0.7) is None
+    assert completion_cache.load(other, "prompt", 64, 0.7) is None
+
+    completion_cache.clear(job)
+    assert completion_cache.load(job, "prompt", 64, 0.7) is None
+
+def test_disabled_cache_has_no_job(monkeypatch):
+    monkeypatch.setattr(completion_cache, "ENABLED", False)
+    assert completion_cache.job_id("summary", "digest-a") is None
+
+def test_prune_keeps_the_newest_jobs(cache_dir):
+    jobs=[completion_cache.job_id("summary", n) for n in range(4)]
+    for age, job in enumerate(jobs):
+        completion_cache.store(job, "prompt", 64, 0.7, "reply")
+        os.utime(cache_dir/job, (1000+age, 1000+age))
+    # a completion cached per prompt before the cache was scoped to jobs
+    (cache_dir/"legacy.json").write_text('{"text": "old"}')
+    completion_cache.prune(2)
+    assert sorted(os.listdir(cache_dir))==sorted(jobs[2:])
+
+def test_a_new_job_makes_room(cache_dir, monkeypatch):
+    monkeypatch.setattr(completion_cache, "MAX_JOBS", 2)
+    for n in range(3):
+        completion_cache.store(completion_cache.job_id("summary", n), "prompt", 64, 0.7, "reply")
+        os.utime(cache_dir/completion_cache.job_id("summary", n), (1000+n, 1000+n))
+    assert len(os.listdir(cache_dir))==2
+
+def test_retried_job_reuses_its_completions(monkeypatch):
+    generated=[]
+
+    def complete(prompt, max_tokens, temperature=0.7, prefix=None):
+        generated.append(prompt)
+        if prompt=="fails":
+            raise RuntimeError("out of memory")
+        return prompt.upper(), {}
+    monkeypatch.setattr(inference, "complete", complete)
+    job=completion_cache.job_id("summary", "digest-a")
+    with pytest.raises(RuntimeError):
+        llm_pool.map_completions(["one", "two", "fails"], 64, parallelism=1, cache_job=job)
+    generated.clear()
+    assert llm_pool.map_completions(["one", "two", "three"], 64, parallelism=1, cache_job=job)==["ONE", "TWO", "THREE"]
+    assert generated==["three"]
+    # another job samples its own completions
+    llm_pool.map_completions(["one"], 64, parallelism=1, cache_job=completion_cache.job_id("summary", "digest-b"))
+    assert generated==["three", "one"]
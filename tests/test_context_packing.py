@@ -0,0 +1,26 @@
+import context_packing
+
+class Manager:
+    def __init__(self, chunks: dict):
+        self.chunks=chunks
+
+    def same_file(self, a: int, b: int)->bool:
+        return True
+
+def pack(chunks: dict, ids: list[int])->str:
+    return context_packing.pack_context(ids, Manager(chunks), budget_tokens=10_000)
+
+def test_overlapping_neighbours_are_merged(monkeypatch):
+    monkeypatch.setattr(context_packing, "count_tokens", lambda text: len(text.split()))
+    chunks={0: "Alpha beta. Gamma delta long sentence.", 1: "Gamma delta long sentence. Eta theta."}
+    assert pack(chunks, [1, 0])=="Alpha beta. Gamma delta long sentence. Eta theta."
+
+def test_neighbours_without_overlap_are_separated(monkeypatch):
+    monkeypatch.setattr(context_packing, "count_tokens", lambda text: len(text.split()))
+    assert pack({0: "Alpha beta. Eps zeta.", 1: "Eta theta."}, [0, 1])=="Alpha beta. Eps zeta. Eta theta."
+    # a short accidental match is not taken as overlap
+    assert pack({0: "ends with a.", 1: "a. begins"}, [0, 1])=="ends with a. a. begins"
+
+def test_overlap_length():
+    assert context_packing.overlap_length("x "+"shared sentence text.", "shared sentence text. more")==len("shared sentence text.")
+    assert context_packing.overlap_length("abc xy", "xy def")==0
@@ -0,0 +1,72 @@
+import os
+import time
+import numpy as np
+import pytest
+import embedding_cache
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "CACHE_DIR", str(tmp_path/"cache"))
+    calls=[]
+
+    def embed_file(path):
+        calls.append(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            words=f.read().split()
+        return words, np.ones((len(words), 4), dtype='float32')*len(calls), [1]*len(words)
+    return embed_file, calls
+
+def write(path, text: str)->str:
+    path.write_text(text)
+    return str(path)
+
+def test_hit_until_the_content_changes(tmp_path, cache):
+    embed_file, calls=cache
+    path=write(tmp_path/"doc.json", "alpha beta")
+    assert embedding_cache.load(path) is None
+    chunks, vectors, _=embedding_cache.load_or_embed(path, embed_file)
+    assert chunks==["alpha", "beta"] and calls==[path]
+    chunks, cached_vectors, pages=embedding_cache.load_or_embed(path, embed_file)
+    assert calls==[path] and np.array_equal(cached_vectors, vectors) and pages==[1, 1]
+
+    time.sleep(0.01)
+    write(tmp_path/"doc.json", "alpha beta gamma")
+    assert embedding_cache.load(path) is None
+    chunks, _, _=embedding_cache.load_or_embed(path, embed_file)
+    assert chunks==["alpha", "beta", "gamma"] and len(calls)==2
+
+@pytest.mark.parametrize("meta", ['{"chunker": ', '[]', '{}', '{"chunker": "%s", "embedder": "%s"}'])
+def test_malformed_entry_is_a_miss(tmp_path, cache, meta):
+    embed_file, calls=cache
+    path=write(tmp_path/"doc.json", "alpha beta")
+    embedding_cache.load_or_embed(path, embed_file)
+    meta_path, _=embedding_cache._entry_paths(embedding_cache.cache_key(embedding_cache.file_digest(path)))
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        f.write(meta.replace("%s", embedding_cache.CHUNKER_VERSION, 1).replace("%s", embedding_cache.EMBEDDER_VERSION, 1))
+    assert embedding_cache.load(path) is None
+    chunks, _, _=embedding_cache.load_or_embed(path, embed_file)
+    assert chunks==["alpha", "beta"] and len(calls)==2
+    assert embedding_cache.load(path)[0]==chunks
+
+def test_truncated_vectors_are_a_miss(tmp_path, cache):
+    embed_file, _=cache
+    path=write(tmp_path/"doc.json", "alpha beta")
+    embedding_cache.load_or_embed(path, embed_file)
+    _, vectors_path=embedding_cache._entry_paths(embedding_cache.cache_key(embedding_cache.file_digest(path)))
+    with open(vectors_path, 'r+b') as f:
+        f.truncate(20)
+    assert embedding_cache.load(path) is None
+
+def test_prune_drops_the_least_recently_used(tmp_path, cache):
+    embed_file, _=cache
+    paths=[write(tmp_path/f"doc{n}.json", f"document {n} "*50) for n in range(3)]
+    for n, path in enumerate(paths):
+        embedding_cache.load_or_embed(path, embed_file)
+        meta_path, _=embedding_cache._entry_paths(embedding_cache.cache_key(embedding_cache.file_digest(path)))
+        os.utime(meta_path, (1000+n, 1000+n))
+    # the oldest entry is used again, so the second one is the least recently used
+    assert embedding_cache.load(paths[0]) is not None
+    entry_size=sum(os.path.getsize(entry) for entry in embedding_cache._entry_paths(embedding_cache.cache_key(embedding_cache.file_digest(paths[1]))))
+    embedding_cache.prune(2*entry_size+entry_size//2)
+    assert embedding_cache.load(paths[1]) is None
+    assert embedding_cache.load(paths[0]) is not None and embedding_cache.load(paths[2]) is not None
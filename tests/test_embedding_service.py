@@ -0,0 +1,23 @@
+import numpy as np
+import embedding_service
+
+def test_repeated_queries_are_encoded_once(embedder):
+    first=embedding_service.encode_queries(["What is the revenue?", "Who audited it?", "what is  the REVENUE?"])
+    assert embedder.encoded==["what is the revenue?", "who audited it?"]
+    assert np.array_equal(first[0], first[2])
+
+    second=embedding_service.encode_queries(["Who audited it?", "When was it signed?"])
+    assert embedder.encoded[2:]==["when was it signed?"]
+    assert np.array_equal(second[0], first[1])
+
+def test_least_recently_used_queries_are_evicted(embedder, monkeypatch):
+    monkeypatch.setattr(embedding_service, "QUERY_CACHE_SIZE", 2)
+    embedding_service.encode_queries(["alpha"])
+    embedding_service.encode_queries(["beta"])
+    # a hit makes alpha the most recently used, so gamma evicts beta
+    embedding_service.encode_queries(["alpha"])
+    embedding_service.encode_queries(["gamma"])
+    assert list(embedding_service._query_cache)==["alpha", "gamma"]
+    embedder.encoded.clear()
+    embedding_service.encode_queries(["alpha", "beta"])
+    assert embedder.encoded==["beta"]
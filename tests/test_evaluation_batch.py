@@ -0,0 +1,64 @@
+import csv
+import json
+import pytest
+import evaluation_batch
+
+def test_read_questions_from_text(tmp_path):
+    path=tmp_path/"questions.txt"
+    path.write_text("# suite\nFirst?\n\n  Second?  \n")
+    assert evaluation_batch.read_questions(str(path))==["First?", "Second?"]
+
+def test_records_without_a_question_are_skipped_with_their_line(tmp_path, capsys):
+    path=tmp_path/"questions.jsonl"
+    path.write_text('{"question": "First?"}\n"Second?"\n{"prompt": "wrong key"}\n\nnot json\n{"question": ""}\n')
+    assert evaluation_batch.read_questions(str(path))==["First?", "Second?"]
+    output=capsys.readouterr().out
+    assert "line 3" in output and "line 5" in output and "line 6" in output
+
+def test_json_list(tmp_path, capsys):
+    path=tmp_path/"questions.json"
+    path.write_text(json.dumps([{"question": "First?", "id": 1}, "Second?", {"id": 3}]))
+    assert evaluation_batch.read_questions(str(path))==["First?", "Second?"]
+    assert "item 3" in capsys.readouterr().out
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(evaluation_batch.model_loader, "wait_until_ready", lambda: None)
+    monkeypatch.setattr(evaluation_batch.evaluation_backend, "index_files", lambda filepaths: (True, None))
+    monkeypatch.setattr(evaluation_batch.evaluation_metrics, "load", lambda path: None)
+    searched=[]
+
+    def search_batch(manager, queries, top_k):
+        searched.append(list(queries))
+        return [[len(query)] for query in queries]
+    monkeypatch.setattr(evaluation_batch.retrieval, "search_batch", search_batch)
+
+    def ask_model(question, history, metrics_path, max_tokens, on_stats=None, candidate_ids=None):
+        if "fail" in question:
+            raise RuntimeError("model failed")
+        on_stats({"total_s": 1.5, "queue_wait_s": 0.0, "time_to_first_token_s": 0.2, "prompt_tokens": 10, "completion_tokens": 5})
+        return f"answer to {question} from {candidate_ids}"
+    monkeypatch.setattr(evaluation_batch.evaluation_backend, "ask_model", ask_model)
+    return searched
+
+def test_batch_writes_one_row_per_question(tmp_path, backend):
+    questions=["How fit?", "how  FIT?", "please fail"]
+    output=tmp_path/"results.csv"
+    seen=[]
+    rows=evaluation_batch.run_batch(["doc.pdf"], "metrics.json", questions, str(output), on_result=lambda position, row: seen.append(position))
+    # repeated questions are retrieved once
+    assert backend==[["how fit?", "please fail"]]
+    assert seen==[0, 1, 2]
+    assert [row["question"] for row in rows]==questions
+    assert rows[0]["answer"]=="answer to How fit? from [8]" and rows[0]["completion_tokens"]==5 and rows[0]["error"] is None
+    assert rows[2]["answer"] is None and "model failed" in rows[2]["error"] and rows[2]["total_s"] is None
+    with open(output, 'r', encoding='utf-8', newline='') as f:
+        written=list(csv.DictReader(f))
+    assert [row["question"] for row in written]==questions
+    assert list(written[0])==evaluation_batch.RESULT_FIELDS
+
+def test_batch_writes_json_lines(tmp_path, backend):
+    output=tmp_path/"results.jsonl"
+    evaluation_batch.run_batch(["doc.pdf"], "metrics.json", ["How fit?"], str(output))
+    rows=[json.loads(line) for line in output.read_text().splitlines()]
+    assert len(rows)==1 and rows[0]["prompt_tokens"]==10
@@ -0,0 +1,34 @@
+import json
+import os
+import pytest
+import evaluation_metrics
+from conftest import count_words
+
+SAMPLE=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "metrics", "sample1.json")
+
+@pytest.fixture
+def sample(embedder, monkeypatch):
+    monkeypatch.setattr(evaluation_metrics, "count_tokens", count_words)
+    with open(SAMPLE, 'r', encoding='utf-8') as f:
+        return evaluation_metrics.MetricsIndex(json.load(f))
+
+def test_sample_survives_unchanged_when_it_fits(sample):
+    full=evaluation_metrics.render(sample.records)
+    # the records cost more one by one than rendered together, since they share their parents' lines
+    assert sum(count_words(evaluation_metrics.render([record])) for record in sample.records)>count_words(full)
+    assert sample.render_for("How fit is the student?", count_words(full))==full
+    assert sample.render_for("How fit is the student?")==full
+
+def test_selection_fits_the_budget_and_keeps_the_relevant_records(sample):
+    budget=count_words(evaluation_metrics.render(sample.records))//3
+    selected=sample.select("What was the reaction_time_ms?", budget)
+    assert 0<len(selected)<len(sample.records)
+    assert count_words(evaluation_metrics.render(selected))<=budget
+    assert any(path.endswith("reaction_time_ms") for path, _ in selected)
+    # file order is kept
+    assert selected==[record for record in sample.records if record in selected]
+
+def test_flatten_and_render():
+    records=evaluation_metrics.flatten({"quiz": {"total": 15, "correct": 13, "tags": ["a", "b"]}, "name": "x"})
+    assert records==[("quiz.total", "15"), ("quiz.correct", "13"), ("quiz.tags", "a; b"), ("name", "x")]
+    assert evaluation_metrics.render(records)=="quiz: total=15, correct=13, tags=a; b\nname: x"
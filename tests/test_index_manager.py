@@ -0,0 +1,74 @@
+import threading
+import numpy as np
+import pytest
+import embedding_cache
+import index_manager
+from index_manager import IndexManager
+
+N_FILES=3
+VECTORS_PER_FILE=2500
+
+def test_auto_kind_never_picks_lossy_compression():
+    assert index_manager.choose_index_kind(1_000)=="flat"
+    assert index_manager.choose_index_kind(index_manager.FLAT_MAX_VECTORS)=="ivf_flat"
+    assert index_manager.choose_index_kind(50_000_000)=="ivf_flat"
+
+@pytest.fixture
+def corpus(monkeypatch):
+    monkeypatch.setattr(embedding_cache, "file_digest", lambda path: path)
+    rng=np.random.default_rng(0)
+    return {f"doc{n}": ([f"doc{n} chunk{i}" for i in range(VECTORS_PER_FILE)], rng.standard_normal((VECTORS_PER_FILE, 8)).astype('float32'), [1]*VECTORS_PER_FILE) for n in range(N_FILES)}
+
+@pytest.fixture
+def blocked_training(monkeypatch):
+    '''
+    holds the training of approximate indexes until the event is set
+    '''
+    release=threading.Event()
+    train_index=index_manager.train_index
+
+    def blocked(index, vectors):
+        assert release.wait(10)
+        train_index(index, vectors)
+    monkeypatch.setattr(index_manager, "train_index", blocked)
+    yield release
+    release.set()
+
+def nearest(manager, vector)->int:
+    _, ids=manager.search(vector[None, :], 1)
+    return int(ids[0][0])
+
+def test_training_does_not_hold_up_sync_or_search(corpus, blocked_training):
+    paths=list(corpus)
+    manager=IndexManager(kind="ivf_flat")
+    manager.sync(paths, corpus.__getitem__)
+    # served by a flat index while the ivf one trains
+    assert manager.built_kind=="flat" and manager.builder is not None
+    assert nearest(manager, corpus[paths[1]][1][7])==VECTORS_PER_FILE+7
+    blocked_training.set()
+    manager.wait_until_built(10)
+    assert manager.built_kind=="ivf_flat" and manager.builder is None
+    assert manager.index.ntotal==N_FILES*VECTORS_PER_FILE
+    assert nearest(manager, corpus[paths[1]][1][7])==VECTORS_PER_FILE+7
+
+def test_build_of_an_outdated_selection_is_thrown_away(corpus, blocked_training):
+    paths=list(corpus)
+    manager=IndexManager(kind="ivf_flat")
+    manager.sync(paths, corpus.__getitem__)
+    manager.sync(paths[1:], corpus.__getitem__)
+    blocked_training.set()
+    manager.wait_until_built(10)
+    assert manager.built_kind=="ivf_flat"
+    assert manager.index.ntotal==len(manager.chunks)==(N_FILES-1)*VECTORS_PER_FILE
+    assert nearest(manager, corpus[paths[2]][1][3])==int(manager.files[paths[2]][1][3])
+
+def test_hnsw_removal_falls_back_to_flat_until_rebuilt(corpus):
+    paths=list(corpus)
+    manager=IndexManager(kind="hnsw")
+    manager.sync(paths, corpus.__getitem__)
+    manager.wait_until_built(30)
+    assert manager.built_kind=="hnsw"
+    manager.sync(paths[:2], corpus.__getitem__)
+    assert manager.index.ntotal==2*VECTORS_PER_FILE
+    manager.wait_until_built(30)
+    assert manager.built_kind=="hnsw" and manager.index.ntotal==2*VECTORS_PER_FILE
@@ -0,0 +1,34 @@
+import inference
+
+class DictCache:
+    def __init__(self, capacity_bytes=0):
+        self.states={}
+
+    def __setitem__(self, key, value):
+        self.states[tuple(key)]=value
+
+class FakeLlama:
+    def __init__(self):
+        self.cache=inference.prefix_cache(DictCache)()
+
+    def tokenize(self, text, add_bos=True, special=True):
+        return list(text)
+
+    def reset(self):
+        pass
+
+    def eval(self, tokens):
+        pass
+
+    def save_state(self):
+        return "state"
+
+def test_prompt_cache_keeps_only_prefix_states(monkeypatch):
+    monkeypatch.setattr(inference, "_primed_prefixes", set())
+    llm=FakeLlama()
+    # what llama-cpp-python does after every completion
+    llm.cache[list("whole prompt and reply")]="large state"
+    inference.prime_prefix(llm, "prefix")
+    assert llm.cache.states=={tuple(b"prefix"): "state"}
+    llm.cache[list("prefix and more")]="large state"
+    assert list(llm.cache.states)==[tuple(b"prefix")]
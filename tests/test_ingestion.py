@@ -0,0 +1,68 @@
+from concurrent.futures import Future
+import pymupdf
+import pytest
+import embedding_cache
+import ingestion
+
+@pytest.fixture
+def documents(tmp_path, embedder, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "CACHE_DIR", str(tmp_path/"cache"))
+    monkeypatch.setattr(ingestion, "PAGES_PER_TASK", 3)
+    pdf_path=tmp_path/"report.pdf"
+    doc=pymupdf.open()
+    for number in range(10):
+        page=doc.new_page()
+        page.insert_text((72, 72), f"Page {number+1} starts here. Its measurement is {number*7} units.")
+    doc.save(str(pdf_path))
+    doc.close()
+    empty_path=tmp_path/"empty.pdf"
+    doc=pymupdf.open()
+    doc.new_page()
+    doc.save(str(empty_path))
+    doc.close()
+    json_path=tmp_path/"metrics.json"
+    json_path.write_text('{"score": 42}')
+    return [str(pdf_path), str(empty_path), str(json_path)]
+
+def test_page_ranges(documents):
+    pdf_path=documents[0]
+    assert ingestion.page_count(pdf_path)==10
+    pages=ingestion.extract_pages(pdf_path, 3, 6)
+    assert [number for number, _ in pages]==[4, 5, 6]
+    assert "Page 5 starts here." in pages[1][1]
+    assert ingestion.extract_pages(pdf_path, 9, 12)[0][0]==10
+    assert ingestion.extract_pages(documents[2], 0, 3)==[(1, '{"score": 42}')]
+
+def test_pooled_ingestion_matches_embedding_one_file(documents):
+    progress=[]
+    results=ingestion.ingest_files(documents, workers=2, on_progress=lambda done, total: progress.append((done, total)))
+    assert progress[-1]==(3, 3)
+    for path in documents:
+        chunks, vectors, pages=results[path]
+        expected_chunks, expected_vectors, expected_pages=ingestion.embed_file(path)
+        assert chunks==expected_chunks and pages==expected_pages
+        assert len(vectors)==len(expected_vectors)
+    chunks, _, pages=results[documents[0]]
+    assert len(chunks)==1 and pages==[1] and "Page 10 starts here." in chunks[0]
+    assert results[documents[1]][0]==[]
+    # written to the embedding cache
+    assert embedding_cache.load(documents[0])[0]==chunks
+
+def test_extraction_runs_a_bounded_number_of_tasks_ahead():
+    class Executor:
+        def __init__(self):
+            self.submitted=0
+
+        def submit(self, function, *args):
+            self.submitted+=1
+            future=Future()
+            future.set_result([args])
+            return future
+    executor=Executor()
+    tasks=[("a", start, start+1) for start in range(10)]
+    consumed=0
+    for path, pages in ingestion.iter_extracted(executor, tasks, 2):
+        assert pages==[(path, consumed, consumed+1)]
+        consumed+=1
+        assert executor.submitted-consumed<=2
+    assert consumed==10
@@ -0,0 +1,154 @@
+import json
+import os
+import numpy as np
+import pytest
+import knowledge_base
+from index_manager import IndexManager
+from bm25 import BM25Index
+
+DIMENSION=8
+CHUNKS_PER_FILE=5
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(knowledge_base, "KB_DIR", str(tmp_path/"knowledge_bases"))
+    rng=np.random.default_rng(0)
+    files={}
+    for n in range(3):
+        path=tmp_path/f"doc{n}.txt"
+        path.write_text(f"document {n}")
+        chunks=[f"doc{n} chunk{i} keyword{n}x{i}" for i in range(CHUNKS_PER_FILE)]
+        files[str(path)]=(chunks, rng.standard_normal((CHUNKS_PER_FILE, DIMENSION)).astype('float32'), list(range(CHUNKS_PER_FILE)))
+    return files
+
+def nearest(manager, vector)->int:
+    _, ids=manager.search(vector[None, :], 1)
+    return int(ids[0][0])
+
+def test_save_and_load_round_trip(corpus):
+    paths=list(corpus)
+    manager=IndexManager(kind="flat")
+    manager.sync(paths, corpus.__getitem__)
+    knowledge_base.save(manager, "kb", corpus.__getitem__)
+
+    opened=IndexManager(kind="flat")
+    assert knowledge_base.load(opened, "kb")
+    assert opened.mapped and len(opened.chunks)==3*CHUNKS_PER_FILE
+    assert knowledge_base.list_knowledge_bases()==["kb"]
+    for path, (chunks, vectors, _) in corpus.items():
+        first=int(opened.files[path][1][0])
+        assert opened.chunks[first+2]==chunks[2]
+        assert nearest(opened, vectors[2])==first+2
+    assert opened.search_lexical("keyword1x3")==[CHUNKS_PER_FILE+3]
+
+def test_save_keeps_gaps_of_removed_files(corpus):
+    paths=list(corpus)
+    manager=IndexManager(kind="flat")
+    manager.sync(paths, corpus.__getitem__)
+    manager.sync([paths[0], paths[2]], corpus.__getitem__)
+    knowledge_base.save(manager, "kb", corpus.__getitem__)
+
+    opened=IndexManager(kind="flat")
+    assert knowledge_base.load(opened, "kb")
+    assert opened.chunks.next_id==3*CHUNKS_PER_FILE and len(opened.chunks)==2*CHUNKS_PER_FILE
+    assert CHUNKS_PER_FILE not in opened.chunks
+    assert opened.index.ntotal==2*CHUNKS_PER_FILE
+    assert nearest(opened, corpus[paths[2]][1][0])==2*CHUNKS_PER_FILE
+    assert opened.search_lexical("keyword1x0")==[]
+
+def test_compact_renumbers_ids(corpus):
+    paths=list(corpus)
+    manager=IndexManager(kind="flat")
+    manager.sync(paths, corpus.__getitem__)
+    manager.sync([paths[0], paths[2]], corpus.__getitem__)
+    knowledge_base.save(manager, "kb", corpus.__getitem__, compact=True)
+
+    opened=IndexManager(kind="flat")
+    assert knowledge_base.load(opened, "kb")
+    assert opened.chunks.next_id==2*CHUNKS_PER_FILE and opened.chunks.removed==0
+    assert opened.files[paths[2]][1].tolist()==list(range(CHUNKS_PER_FILE, 2*CHUNKS_PER_FILE))
+    assert nearest(opened, corpus[paths[2]][1][1])==CHUNKS_PER_FILE+1
+    assert opened.search_lexical("keyword2x1")==[CHUNKS_PER_FILE+1]
+
+def test_opened_knowledge_base_accepts_changes(corpus):
+    paths=list(corpus)
+    manager=IndexManager(kind="flat")
+    manager.sync(paths[:2], corpus.__getitem__)
+    knowledge_base.save(manager, "kb", corpus.__getitem__)
+
+    opened=IndexManager(kind="flat")
+    knowledge_base.load(opened, "kb")
+    opened.sync([paths[1], paths[2]], corpus.__getitem__)
+    assert not opened.mapped and opened.index.ntotal==2*CHUNKS_PER_FILE
+    assert nearest(opened, corpus[paths[2]][1][4])==int(opened.files[paths[2]][1][4])
+    knowledge_base.save(opened, "kb", corpus.__getitem__)
+    reopened=IndexManager(kind="flat")
+    assert knowledge_base.load(reopened, "kb") and set(reopened.files)=={paths[1], paths[2]}
+
+def test_load_rejects_missing_and_other_chunker(corpus):
+    manager=IndexManager(kind="flat")
+    assert not knowledge_base.load(manager, "missing")
+    manager.sync(list(corpus), corpus.__getitem__)
+    knowledge_base.save(manager, "kb", corpus.__getitem__)
+    meta_path=os.path.join(knowledge_base.current_generation("kb"), "meta.json")
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta=json.load(f)
+    meta["chunker"]="another"
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    assert not knowledge_base.load(IndexManager(kind="flat"), "kb")
+
+def test_invalid_names_are_rejected():
+    for name in ("", "../kb", ".hidden", "a/b"):
+        with pytest.raises(ValueError):
+            knowledge_base.kb_path(name)
+
+def test_save_later_writes_once_pending_saves_are_flushed(corpus):
+    manager=IndexManager(kind="flat")
+    manager.sync(list(corpus), corpus.__getitem__)
+    knowledge_base.save_later(manager, "kb", corpus.__getitem__, delay=60)
+    knowledge_base.save_later(manager, "kb", corpus.__getitem__, delay=60)
+    assert knowledge_base.current_generation("kb") is None
+    knowledge_base.flush_pending()
+    assert knowledge_base.current_generation("kb") is not None
+    assert not knowledge_base._pending
+
+def test_switching_a_file_in_and_out_stays_bounded(corpus):
+    paths=list(corpus)
+    manager=IndexManager(kind="flat")
+    for _ in range(10):
+        manager.sync(paths, corpus.__getitem__)
+        manager.sync(paths[:2], corpus.__getitem__)
+    assert len(manager.chunks)==2*CHUNKS_PER_FILE
+    assert manager.chunks.next_id<=2*len(manager.chunks)+CHUNKS_PER_FILE
+    assert manager.index.ntotal==len(manager.chunks)
+    assert len(manager.lexical.doc_lengths)<=manager.chunks.next_id
+    manager.sync(paths, corpus.__getitem__)
+    assert nearest(manager, corpus[paths[2]][1][3])==int(manager.files[paths[2]][1][3])
+    assert manager.search_lexical("keyword2x3")==[int(manager.files[paths[2]][1][3])]
+
+    knowledge_base.save(manager, "kb", corpus.__getitem__)
+    size=os.path.getsize(os.path.join(knowledge_base.current_generation("kb"), "vectors.npy"))
+    assert size<=(2*len(manager.chunks)+CHUNKS_PER_FILE)*DIMENSION*4+128
+
+def test_save_writes_outside_the_index_lock(corpus, monkeypatch):
+    paths=list(corpus)
+    manager=IndexManager(kind="flat")
+    manager.sync(paths, corpus.__getitem__)
+    original=BM25Index.save
+    checked=[]
+
+    def save_and_change(lexical, directory):
+        assert not manager.lock.locked()
+        # the manager keeps changing while the snapshot is written
+        manager.sync(paths[:1], corpus.__getitem__)
+        checked.append(directory)
+        original(lexical, directory)
+    monkeypatch.setattr(BM25Index, "save", save_and_change)
+    knowledge_base.save(manager, "kb", corpus.__getitem__)
+    assert checked
+
+    opened=IndexManager(kind="flat")
+    assert knowledge_base.load(opened, "kb")
+    assert set(opened.files)==set(paths) and len(opened.chunks)==3*CHUNKS_PER_FILE
+    assert opened.search_lexical("keyword2x4")==[2*CHUNKS_PER_FILE+4]
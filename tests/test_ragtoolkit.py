@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import knowledge_base
+import rag_backend
+import ragtoolkit
+from index_manager import IndexManager
+
+@pytest.fixture
+def documents(tmp_path, monkeypatch):
+    monkeypatch.setattr(knowledge_base, "KB_DIR", str(tmp_path/"knowledge_bases"))
+    monkeypatch.setattr(rag_backend, "index_manager", IndexManager(kind="flat"))
+    rng=np.random.default_rng(0)
+    paths=[]
+    for n in range(2):
+        path=tmp_path/f"doc{n}.json"
+        path.write_text(f'{{"document": {n}}}')
+        paths.append(str(path))
+
+    def ingest_files(paths, on_progress=None):
+        return {path: ([f"{path} chunk {i}" for i in range(3)], rng.standard_normal((3, 8)).astype('float32'), [1, 1, 1]) for path in paths}
+    monkeypatch.setattr(rag_backend.ingestion, "ingest_files", ingest_files)
+    return paths
+
+def test_ingest_saves_only_the_named_knowledge_base(documents):
+    assert ragtoolkit.ingest(documents, knowledge_base_name="foo")==6
+    assert not knowledge_base._pending
+    knowledge_base.flush_pending()
+    assert knowledge_base.list_knowledge_bases()==["foo"]
+
+def test_app_selection_is_saved_in_the_background(documents):
+    rag_backend.process_files(documents)
+    assert list(knowledge_base._pending)==[rag_backend.KNOWLEDGE_BASE]
+    knowledge_base.flush_pending()
+    assert knowledge_base.list_knowledge_bases()==[rag_backend.KNOWLEDGE_BASE]
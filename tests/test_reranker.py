@@ -0,0 +1,43 @@
+import pytest
+import reranker
+
+class SlowCrossEncoder:
+    '''
+    Scores a chunk by its number and advances a fake clock by 10ms per pair.
+    '''
+    def __init__(self, clock):
+        self.clock=clock
+        self.scored=[]
+
+    def predict(self, pairs, batch_size=16):
+        self.clock[0]+=0.01*len(pairs)
+        self.scored.extend(text for _, text in pairs)
+        return [float(text) for _, text in pairs]
+
+@pytest.fixture
+def model(monkeypatch):
+    clock=[0.0]
+    model=SlowCrossEncoder(clock)
+    monkeypatch.setattr(reranker, "_reranker", model)
+    monkeypatch.setattr(reranker, "_seconds_per_pair", None)
+    monkeypatch.setattr(reranker.time, "perf_counter", lambda: clock[0])
+    return model
+
+def test_overrun_keeps_fused_order_for_the_rest(model, monkeypatch):
+    monkeypatch.setattr(reranker, "RERANK_BATCH_SIZE", 4)
+    ids=list(range(10))
+    # the first batch takes 40ms of a 30ms budget, so only it is re-scored
+    assert reranker.rerank("query", ids, str, top_k=6, budget_s=0.03)==[3, 2, 1, 0, 4, 5]
+    assert model.scored==["0", "1", "2", "3"]
+    assert reranker._seconds_per_pair==pytest.approx(0.01)
+
+def test_measured_speed_cuts_the_pool(model):
+    reranker._seconds_per_pair=0.01
+    ids=list(range(10))
+    assert reranker.rerank("query", ids, str, top_k=10, budget_s=0.05)==[4, 3, 2, 1, 0, 5, 6, 7, 8, 9]
+    assert len(model.scored)==5
+
+    # less than two pairs fit, so the fused order is returned unscored
+    model.scored.clear()
+    assert reranker.rerank("query", ids, str, top_k=3, budget_s=0.015)==[0, 1, 2]
+    assert model.scored==[]
@@ -0,0 +1,113 @@
+import threading
+import time
+import scheduler
+from scheduler import Scheduler, INTERACTIVE, BACKGROUND
+
+def wait_for(condition, timeout: float=5.0)->None:
+    deadline=time.monotonic()+timeout
+    while not condition():
+        assert time.monotonic()<deadline, "timed out"
+        time.sleep(0.005)
+
+class Holder:
+    '''
+    Takes a slot on a thread and keeps it until released.
+    '''
+    def __init__(self, jobs: Scheduler, name: str, order: list, level: int=INTERACTIVE, pooled: bool=False, cancel=None):
+        self.release=threading.Event()
+        self.error=None
+
+        def run():
+            try:
+                with jobs.slot(level, cancel, pooled):
+                    order.append(name)
+                    self.release.wait(5)
+            except scheduler.Cancelled as e:
+                self.error=e
+        self.thread=threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def finish(self)->None:
+        self.release.set()
+        self.thread.join(5)
+
+def test_interactive_goes_before_waiting_background():
+    jobs=Scheduler()
+    order=[]
+    first=Holder(jobs, "background 1", order, BACKGROUND)
+    wait_for(lambda: order==["background 1"])
+    second=Holder(jobs, "background 2", order, BACKGROUND)
+    wait_for(lambda: jobs.status()["queued"]==1)
+    chat=Holder(jobs, "chat", order, INTERACTIVE)
+    wait_for(lambda: jobs.status()["queued"]==2)
+    assert jobs.status()["queued_by_priority"]=={"interactive": 1, "background": 1}
+    first.finish()
+    wait_for(lambda: len(order)==2)
+    chat.finish()
+    second.finish()
+    assert order==["background 1", "chat", "background 2"]
+
+def test_arrival_order_within_a_priority():
+    jobs=Scheduler()
+    order=[]
+    holders=[Holder(jobs, "first", order)]
+    wait_for(lambda: order==["first"])
+    for name in ("second", "third"):
+        holders.append(Holder(jobs, name, order))
+        wait_for(lambda: jobs.status()["queued"]==len(holders)-1)
+    for holder in holders:
+        holder.finish()
+    assert order==["first", "second", "third"]
+
+def test_cancel_while_waiting_leaves_the_queue():
+    jobs=Scheduler()
+    order=[]
+    running=Holder(jobs, "running", order)
+    wait_for(lambda: order==["running"])
+    cancel=threading.Event()
+    cancelled=Holder(jobs, "cancelled", order, cancel=cancel)
+    waiting=Holder(jobs, "waiting", order)
+    wait_for(lambda: jobs.status()["queued"]==2)
+    cancel.set()
+    cancelled.thread.join(5)
+    assert isinstance(cancelled.error, scheduler.Cancelled)
+    assert jobs.status()["queued"]==1
+    running.finish()
+    waiting.finish()
+    assert order==["running", "waiting"]
+
+def test_pooled_generations_run_together_but_yield_to_interactive():
+    jobs=Scheduler()
+    order=[]
+    pooled=[Holder(jobs, f"pooled {n}", order, BACKGROUND, pooled=True) for n in range(2)]
+    wait_for(lambda: len(order)==2)
+    assert jobs.status()["running_pooled"]["background"]==2
+    chat=Holder(jobs, "chat", order)
+    wait_for(lambda: "chat" in order)
+    late=Holder(jobs, "pooled late", order, BACKGROUND, pooled=True)
+    wait_for(lambda: jobs.status()["queued"]==1)
+    assert "pooled late" not in order
+    chat.finish()
+    wait_for(lambda: "pooled late" in order)
+    for holder in pooled+[late]:
+        holder.finish()
+    assert jobs.status()["running_pooled"]["background"]==0
+
+def test_priority_is_per_thread():
+    assert scheduler.current_priority()==INTERACTIVE
+    seen=[]
+    with scheduler.priority(BACKGROUND):
+        thread=threading.Thread(target=lambda: seen.append(scheduler.current_priority()))
+        thread.start()
+        thread.join()
+        assert scheduler.current_priority()==BACKGROUND
+    assert seen==[INTERACTIVE]
+    assert scheduler.current_priority()==INTERACTIVE
+
+def test_status_reports_waits():
+    jobs=Scheduler()
+    with jobs.slot(BACKGROUND) as waited:
+        assert waited>=0
+        status=jobs.status()
+        assert status["running"]=="background" and status["queued"]==0
+    assert jobs.status()["served"]=={"interactive": 0, "background": 1}
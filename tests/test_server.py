@@ -0,0 +1,66 @@
+import asyncio
+import json
+import pytest
+import model_loader
+import server
+
+class FakeLlama:
+    def n_ctx(self):
+        return 4096
+
+class BufferWriter:
+    def __init__(self):
+        self.data=b""
+
+    def write(self, data):
+        self.data+=data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+def call(body, path="/ask", method="POST"):
+    '''
+    input: request body, path and method
+    output: status and parsed JSON body of the server's response
+    '''
+    data=body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+
+    async def run():
+        reader=asyncio.StreamReader()
+        reader.feed_data(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(data)}\r\n\r\n".encode()+data)
+        reader.feed_eof()
+        writer=BufferWriter()
+        await server.InferenceServer().handle(reader, writer)
+        return writer.data
+    head, _, content=asyncio.run(run()).partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(content)
+
+@pytest.fixture(autouse=True)
+def llm(monkeypatch):
+    monkeypatch.setattr(model_loader, "get_llm", lambda: FakeLlama())
+
+@pytest.mark.parametrize("path, body, message", [
+    ("/ask", {"files": ["a.pdf"]}, "Missing or invalid field: question"),
+    ("/ask", {"question": "q"}, "Give either files or kb"),
+    ("/ask", {"question": "q", "files": ["a.pdf"], "kb": "reports"}, "Give either files or kb"),
+    ("/ask", {"question": "q", "files": ["a.pdf", 3]}, "files must be a list of paths"),
+    ("/ask", {"question": "q", "kb": "reports", "history": [["only a question"]]}, "history must be a list of [question, answer] pairs"),
+    ("/ask", {"question": "q", "kb": "reports", "max_tokens": 4096}, "max_tokens must be a whole number from 1 to 2048"),
+    ("/summarize", {"files": ["a.pdf"], "clusters": True}, "clusters must be a whole number from 1 to 1000"),
+    ("/summarize", {"files": "a.pdf"}, "Missing or invalid field: files"),
+    ("/v1/completions", {"prompt": "hello", "temperature": "hot"}, "temperature must be a number from 0.0 to 2.0"),
+])
+def test_bad_fields_are_rejected_before_queueing(path, body, message):
+    assert call(body, path)==(400, {"error": {"message": message}})
+
+def test_malformed_requests():
+    assert call(b"[1, 2]")==(400, {"error": {"message": "Body must be a JSON object"}})
+    assert call(b"{not json")==(400, {"error": {"message": "Body is not valid JSON"}})
+    assert call({}, "/missing")[0]==404
+    assert call({}, "/ask", "GET")[0]==405
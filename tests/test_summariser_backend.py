@@ -0,0 +1,20 @@
+import inference
+import llm_pool
+import summariser_backend
+from conftest import count_words
+
+def test_reduce_summaries_collates_until_they_fit(monkeypatch):
+    prompts=[]
+
+    def complete(prompt, max_tokens, temperature=0.7, prefix=None):
+        prompts.append(prompt)
+        return "merged part", {}
+    monkeypatch.setattr(inference, "count_tokens", count_words)
+    monkeypatch.setattr(inference, "complete", complete)
+    monkeypatch.setattr(llm_pool, "context_window", lambda parallelism: 10**4)
+    summaries=[f"summary {n} of a part of the book" for n in range(8)]
+
+    # 8 words per summary, so 3 fit a group of 24 and the 3 merged results fit together
+    assert summariser_backend.reduce_summaries(summaries, 24, parallelism=1)==["merged part"]*3
+    assert len(prompts)==3 and "summary 2 of" in prompts[0] and "summary 3 of" not in prompts[0]
+    assert summariser_backend.reduce_summaries(summaries, 100, parallelism=1)==summaries